@@ -0,0 +1,115 @@
+import logging
+from dataclasses import dataclass, field
+
+from cursor import OrderCursor
+from marks import Portfolio
+from position_tracker import PositionTracker
+from scheduler import AdaptiveScheduler
+from tracker import PriceTracker
+
+
+@dataclass
+class Account:
+    """Tracker namespace and poll schedule for one Schwab account.
+
+    ``account_hash`` of ``None`` means "all linked accounts" and uses the
+    ``account_orders_all`` endpoint, which is how a single implicit account
+    is represented. ``name`` is the label shown in messages, logs, metrics
+    and file names; the full account ``number`` is only used to key local
+    state and match stream activity.
+    """
+
+    name: str = ""
+    number: str = ""
+    account_hash: str | None = None
+    interval_secs: float = 5
+    tracker: PriceTracker = field(default_factory=PriceTracker)
+    position_tracker: PositionTracker = field(default_factory=PositionTracker)
+    cursor: OrderCursor | None = None
+    # adapts ``interval_secs`` to activity when set
+    scheduler: AdaptiveScheduler | None = None
+    # values open positions at cached quotes when set
+    marks: Portfolio | None = None
+    # monotonic time at which the account is next due to be polled
+    next_poll: float = 0.0
+
+    @property
+    def key(self) -> str:
+        """Return the name the account's persisted state is stored under."""
+        return self.number or self.name
+
+
+def mask_account(number: str, digits: int = 4) -> str:
+    """Return ``number`` with all but its last ``digits`` hidden."""
+    return f"…{number[-digits:]}" if len(number) > digits else number
+
+
+def parse_account_spec(
+    spec: str, default_interval: float
+) -> list[tuple[str, float]]:
+    """Parse ``"1234:5,5678"`` into ``[("1234", 5.0), ("5678", default)]``."""
+    entries = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, interval = item.partition(":")
+        entries.append(
+            (name.strip(), float(interval) if interval else default_interval)
+        )
+    return entries
+
+
+def resolve_accounts(
+    spec: str,
+    hashes: dict[str, str],
+    default_interval: float,
+) -> list[Account]:
+    """Build :class:`Account` objects for the accounts named in ``spec``.
+
+    Each entry may be a full account number, its last digits or an account
+    hash. Entries that match no linked account, or an account already
+    listed, are logged and skipped.
+    Accounts are named by :func:`mask_account`, with more digits shown
+    where the last four are shared.
+    """
+    accounts = []
+    numbers = set()
+    for name, interval in parse_account_spec(spec, default_interval):
+        matches = [
+            (number, account_hash)
+            for number, account_hash in hashes.items()
+            if name in (number, account_hash) or number.endswith(name)
+        ]
+        if len(matches) != 1:
+            logging.error(
+                "Account %s matched %s linked accounts; skipping",
+                name,
+                len(matches),
+            )
+            continue
+        number, account_hash = matches[0]
+        if number in numbers:
+            logging.warning(
+                "Account %s is listed more than once; skipping", name
+            )
+            continue
+        numbers.add(number)
+        accounts.append(
+            Account(
+                number=number,
+                account_hash=account_hash,
+                interval_secs=interval,
+            )
+        )
+    # full numbers are unique, so showing every digit always tells them apart
+    longest = max((len(number) for number in numbers), default=0)
+    digits = 4
+    while True:
+        names = [mask_account(account.number, digits) for account in accounts]
+        if len(set(names)) == len(names) or digits >= longest:
+            break
+        digits += 1
+    for account, name in zip(accounts, names):
+        account.name = name
+    return accounts
@@ -0,0 +1,258 @@
+"""Running position totals by underlying, expiration and day.
+
+:class:`AggregateIndex` is kept by each
+:class:`position_tracker.PositionTracker` and updated with the change every
+fill makes to its contract, so totals for an underlying, an expiration
+date, the whole account or a range of days are read without scanning every
+contract. Fills are bucketed by the UTC day of their execution time; only
+realized PnL and closed basis are kept per day.
+"""
+from bisect import bisect_left, insort
+from dataclasses import dataclass, field
+
+Key = tuple[str, str, float]
+
+DAY_SECS = 86400
+
+# positions in Aggregate.quantities; shorts follow the matching longs
+LONG_SHARES = 0
+SHORT_SHARES = 1
+LONG_CONTRACTS = 2
+SHORT_CONTRACTS = 3
+
+
+@dataclass(slots=True)
+class Aggregate:
+    """Totals over a group of contracts.
+
+    ``quantities`` holds the gross long and short quantities open, in
+    shares for equities and contracts for options, indexed by
+    :data:`LONG_SHARES`, :data:`SHORT_SHARES`, :data:`LONG_CONTRACTS` and
+    :data:`SHORT_CONTRACTS`; short quantities are positive. ``open_cost``
+    is the signed cost of the open lots in dollars; ``realized`` and
+    ``basis`` are the realized PnL and closed cost basis in dollars.
+    """
+
+    quantities: list[float] = field(default_factory=lambda: [0.0] * 4)
+    open_cost: float = 0.0
+    realized: float = 0.0
+    basis: float = 0.0
+
+    @property
+    def long_shares(self) -> float:
+        return self.quantities[LONG_SHARES]
+
+    @property
+    def short_shares(self) -> float:
+        return self.quantities[SHORT_SHARES]
+
+    @property
+    def long_contracts(self) -> float:
+        return self.quantities[LONG_CONTRACTS]
+
+    @property
+    def short_contracts(self) -> float:
+        return self.quantities[SHORT_CONTRACTS]
+
+    def merge(self, other: "Aggregate") -> None:
+        self.quantities = [
+            mine + theirs
+            for mine, theirs in zip(self.quantities, other.quantities)
+        ]
+        self.open_cost += other.open_cost
+        self.realized += other.realized
+        self.basis += other.basis
+
+    def pnl(self) -> float:
+        """Return realized PnL as a percentage of closed basis."""
+        return self.realized / self.basis * 100 if self.basis else 0.0
+
+
+def day_of(epoch: float) -> int:
+    """Return the UTC day number of ``epoch`` seconds."""
+    return int(epoch // DAY_SECS)
+
+
+def week_of(epoch: float) -> int:
+    """Return the day number of the Monday starting the week of ``epoch``."""
+    day = day_of(epoch)
+    # day 0, 1970-01-01, was a Thursday
+    return day - (day + 3) % 7
+
+
+class AggregateIndex:
+    """Totals per underlying, per expiration, per day and for the account.
+
+    :meth:`opened` and :meth:`closed` are O(1) per fill and point lookups
+    are O(1). Totals over a range of expirations cost O(log n) plus the
+    expirations in the range, and totals over a range of days one lookup
+    per day.
+    """
+
+    def __init__(self):
+        self.total = Aggregate()
+        self.by_underlying: dict[str, Aggregate] = {}
+        self.by_expiration: dict[str, Aggregate] = {}
+        # option expirations in sorted order, for range queries
+        self.expirations: list[str] = []
+        self.by_day: dict[int, Aggregate] = {}
+        # days changed since the state was last persisted
+        self.dirty_days: set[int] = set()
+        # underlying of each contract; missing means the symbol itself
+        self.underlyings: dict[Key, str] = {}
+        # contract -> the (total, underlying, expiration) aggregates it
+        # counts towards
+        self._groups: dict[Key, tuple[Aggregate, ...]] = {}
+
+    def underlying(self, key: Key) -> str:
+        return self.underlyings.get(key) or key[0]
+
+    def _group(
+        self, key: Key, underlying: str | None = None
+    ) -> tuple[Aggregate, ...]:
+        if underlying and underlying != key[0]:
+            self.underlyings[key] = underlying
+        underlying = self.underlying(key)
+        by_underlying = self.by_underlying.get(underlying)
+        if by_underlying is None:
+            by_underlying = self.by_underlying[underlying] = Aggregate()
+        expiration = key[1]
+        by_expiration = self.by_expiration.get(expiration)
+        if by_expiration is None:
+            by_expiration = self.by_expiration[expiration] = Aggregate()
+            if expiration:
+                insort(self.expirations, expiration)
+        group = (self.total, by_underlying, by_expiration)
+        self._groups[key] = group
+        return group
+
+    def opened(
+        self,
+        key: Key,
+        qty: float,
+        cost: float,
+        underlying: str | None = None,
+    ) -> None:
+        """Add a fill that only opened signed ``qty`` at ``cost`` dollars.
+
+        ``underlying`` is only needed the first time a contract is seen.
+        """
+        group = self._groups.get(key)
+        if group is None:
+            group = self._group(key, underlying)
+        index = LONG_CONTRACTS if key[1] else LONG_SHARES
+        if qty < 0:
+            index += 1
+            qty = -qty
+        # inlined rather than calling a method: runs for every fill
+        for aggregate in group:
+            aggregate.quantities[index] += qty
+            aggregate.open_cost += cost
+
+    def closed(
+        self,
+        key: Key,
+        before: float,
+        after: float,
+        cost: float,
+        realized: float,
+        basis: float,
+        when: float | None = None,
+        underlying: str | None = None,
+    ) -> None:
+        """Add a fill that closed lots, realizing ``realized`` on ``basis``.
+
+        ``before`` and ``after`` are the contract's signed open quantity
+        around the fill and ``cost`` the change in open cost in dollars.
+        ``when`` is the fill's epoch time; fills without one are left out
+        of the daily totals.
+        """
+        group = self._groups.get(key)
+        if group is None:
+            group = self._group(key, underlying)
+        index = LONG_CONTRACTS if key[1] else LONG_SHARES
+        # a fill can cross from long to short or back
+        longs = (after if after > 0 else 0) - (before if before > 0 else 0)
+        shorts = (before if before < 0 else 0) - (after if after < 0 else 0)
+        for aggregate in group:
+            quantities = aggregate.quantities
+            quantities[index] += longs
+            quantities[index + 1] += shorts
+            aggregate.open_cost += cost
+            aggregate.realized += realized
+            aggregate.basis += basis
+        if when is not None:
+            day = day_of(when)
+            by_day = self.by_day.get(day)
+            if by_day is None:
+                by_day = self.by_day[day] = Aggregate()
+            by_day.realized += realized
+            by_day.basis += basis
+            self.dirty_days.add(day)
+
+    def rebuild(self, position_tracker) -> None:
+        """Recompute every total except the daily ones from the tracker."""
+        self.total = Aggregate()
+        self.by_underlying.clear()
+        self.by_expiration.clear()
+        self.expirations.clear()
+        self._groups.clear()
+        positions = position_tracker.positions
+        realized = position_tracker.realized_pnl
+        basis = position_tracker.closed_basis
+        for key in positions.keys() | realized.keys():
+            queue = positions.get(key)
+            qty = cost = 0.0
+            if queue is not None:
+                qty = queue.qty
+                cost = queue.cost * position_tracker.multiplier(key)
+            index = LONG_CONTRACTS if key[1] else LONG_SHARES
+            if qty < 0:
+                index += 1
+                qty = -qty
+            for aggregate in self._group(key):
+                aggregate.quantities[index] += qty
+                aggregate.open_cost += cost
+                aggregate.realized += realized.get(key, 0.0)
+                aggregate.basis += basis.get(key, 0.0)
+
+    def underlying_total(self, underlying: str) -> Aggregate:
+        return self.by_underlying.get(underlying) or Aggregate()
+
+    def expiration_total(self, expiration: str) -> Aggregate:
+        return self.by_expiration.get(expiration) or Aggregate()
+
+    def expiring(self, start: str, end: str) -> Aggregate:
+        """Return totals for expirations from ``start`` up to ``end``.
+
+        ``end`` is excluded, so ``expiring("2024-01-19", "2024-01-20")``
+        covers everything expiring on the 19th.
+        """
+        expirations = self.expirations
+        total = Aggregate()
+        for expiration in expirations[
+            bisect_left(expirations, start):bisect_left(expirations, end)
+        ]:
+            total.merge(self.by_expiration[expiration])
+        return total
+
+    def days(self, first: int, last: int) -> Aggregate:
+        """Return realized totals for UTC days ``first`` to ``last``."""
+        total = Aggregate()
+        by_day = self.by_day
+        for day in range(first, last + 1):
+            aggregate = by_day.get(day)
+            if aggregate is not None:
+                # days only keep realized PnL and basis
+                total.realized += aggregate.realized
+                total.basis += aggregate.basis
+        return total
+
+    def day_total(self, epoch: float) -> Aggregate:
+        """Return realized totals for the UTC day of ``epoch``."""
+        return self.by_day.get(day_of(epoch)) or Aggregate()
+
+    def week_total(self, epoch: float) -> Aggregate:
+        """Return realized totals for the Monday to Sunday of ``epoch``."""
+        monday = week_of(epoch)
+        return self.days(monday, monday + 6)
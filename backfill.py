@@ -0,0 +1,364 @@
+"""Batch FIFO position and PnL recomputation over columnar legs.
+
+Requires NumPy, available with the ``analytics`` extra::
+
+    pip install .[analytics]
+    python backfill.py orders.json
+"""
+import json
+import logging
+import sys
+from dataclasses import dataclass
+
+from flatten import Leg, iter_flatten_legs
+from normalize import normalize_legs
+from position_tracker import INSTRUCTION_SIDES, LotQueue, PositionTracker
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+Key = tuple[str, str, float]
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise ImportError(
+            "backfill requires NumPy; install the 'analytics' extra"
+        )
+
+
+@dataclass
+class LegColumns:
+    """Flattened legs as parallel arrays in arrival order.
+
+    ``group`` indexes into ``keys``; ``is_buy`` distinguishes buys from
+    sells and ``closing`` marks instructions that may only close, such as
+    ``SELL_TO_CLOSE``. ``spread`` numbers the multi-leg orders, whose legs
+    are applied as one unit, and is -1 for legs applied on their own. Legs
+    :class:`PositionTracker` would reject for a missing field or an
+    unsupported instruction are dropped while loading, with the rest of
+    their order if it has several legs.
+    """
+
+    keys: list[Key]
+    group: "np.ndarray"
+    qty: "np.ndarray"
+    price: "np.ndarray"
+    is_buy: "np.ndarray"
+    closing: "np.ndarray"
+    spread: "np.ndarray"
+
+    def __len__(self) -> int:
+        return len(self.group)
+
+
+def _units(legs):
+    """Yield lists of legs the poller applies to positions together.
+
+    Like :func:`poller.process_orders`, consecutive legs of one multi-leg
+    order form a unit and legs without a quantity or instruction are left
+    out.
+    """
+    unit: list[Leg] = []
+    for leg in legs:
+        if leg.qty is None or leg.instruction is None:
+            continue
+        if (
+            leg.multi_leg
+            and unit
+            and unit[0].multi_leg
+            and unit[0].order_id == leg.order_id
+        ):
+            unit.append(leg)
+            continue
+        if unit:
+            yield unit
+        unit = [leg]
+    if unit:
+        yield unit
+
+
+def load_legs(legs) -> LegColumns:
+    """Load flattened :class:`flatten.Leg` records into :class:`LegColumns`.
+
+    Leg dicts are turned into records first. Legs are normalized, grouped
+    and filtered exactly as the poller does before calling
+    :meth:`PositionTracker.add_leg` or :meth:`PositionTracker.add_spread`.
+    """
+    _require_numpy()
+    build_key = PositionTracker._build_key
+    codes: dict[Key, int] = {}
+    group, qty, price, is_buy, closing, spread = [], [], [], [], [], []
+    spreads = 0
+    records = (
+        Leg.from_dict(leg) if isinstance(leg, dict) else leg for leg in legs
+    )
+    for unit in _units(normalize_legs(records)):
+        sides = [INSTRUCTION_SIDES.get(leg.instruction) for leg in unit]
+        if None in sides:
+            continue
+        unit_id = -1
+        if len(unit) > 1:
+            unit_id = spreads
+            spreads += 1
+        for leg, side in zip(unit, sides):
+            key = build_key(leg.symbol, leg.expiration, leg.strike)
+            group.append(codes.setdefault(key, len(codes)))
+            qty.append(leg.qty)
+            price.append(leg.price)
+            is_buy.append(side[0] > 0)
+            closing.append(side[1])
+            spread.append(unit_id)
+    return LegColumns(
+        list(codes),
+        np.asarray(group, dtype=np.int64),
+        np.asarray(qty, dtype=np.float64),
+        np.asarray(price, dtype=np.float64),
+        np.asarray(is_buy, dtype=bool),
+        np.asarray(closing, dtype=bool),
+        np.asarray(spread, dtype=np.int64),
+    )
+
+
+@dataclass
+class Backfill:
+    """FIFO results per contract, aligned with ``keys``.
+
+    ``lots`` holds the open ``[qty, price]`` lots for each contract in FIFO
+    order.
+    """
+
+    keys: list[Key]
+    open_qty: "np.ndarray"
+    open_cost: "np.ndarray"
+    realized_pnl: "np.ndarray"
+    closed_basis: "np.ndarray"
+    lots: list[list[list[float]]]
+
+    def pnl_percent(self) -> "np.ndarray":
+        """Return realized PnL as a percentage of closed basis."""
+        basis = self.closed_basis
+        out = np.zeros_like(basis)
+        np.divide(self.realized_pnl * 100, basis, out=out, where=basis != 0)
+        return out
+
+    def to_position_tracker(self) -> PositionTracker:
+        """Return a :class:`PositionTracker` holding these results."""
+        tracker = PositionTracker()
+        for i, key in enumerate(self.keys):
+            tracker.positions[key] = LotQueue.from_lots(self.lots[i])
+            if self.closed_basis[i] or self.realized_pnl[i]:
+                tracker.realized_pnl[key] = float(self.realized_pnl[i])
+                tracker.closed_basis[key] = float(self.closed_basis[i])
+        tracker.aggregates.rebuild(tracker)
+        return tracker
+
+    def mismatches(
+        self, tracker: PositionTracker, tolerance: float = 1e-6
+    ) -> list[Key]:
+        """Return keys whose numbers differ from ``tracker``.
+
+        Values are compared with a relative and absolute ``tolerance`` since
+        the two implementations add the same amounts in a different order.
+        """
+        keys = set(self.keys) | set(tracker.positions)
+        index = {key: i for i, key in enumerate(self.keys)}
+        mismatched = []
+        for key in keys:
+            queue = tracker.positions.get(key)
+            tracked = (
+                queue.qty if queue is not None else 0.0,
+                queue.cost if queue is not None else 0.0,
+                tracker.realized_pnl.get(key, 0.0),
+                tracker.closed_basis.get(key, 0.0),
+            )
+            i = index.get(key)
+            computed = (0.0, 0.0, 0.0, 0.0) if i is None else (
+                self.open_qty[i],
+                self.open_cost[i],
+                self.realized_pnl[i],
+                self.closed_basis[i],
+            )
+            if not np.allclose(
+                tracked, computed, rtol=tolerance, atol=tolerance
+            ):
+                mismatched.append(key)
+        return sorted(mismatched)
+
+
+def _group_sums(values, group, groups: int):
+    return np.bincount(group, weights=values, minlength=groups)
+
+
+# (is_buy, closing) -> an instruction with that meaning
+_INSTRUCTIONS = {
+    (True, False): "BUY",
+    (True, True): "BUY_TO_CLOSE",
+    (False, False): "SELL_TO_OPEN",
+    (False, True): "SELL",
+}
+
+
+def _sequential(columns: LegColumns, rows, tracker: PositionTracker) -> None:
+    """Replay ``rows`` through ``tracker`` exactly as the poller would.
+
+    ``rows`` are in arrival order and include every leg of each multi-leg
+    order they touch.
+    """
+    spread = columns.spread
+    unit: list[Leg] = []
+    for position, row in enumerate(rows):
+        key = columns.keys[columns.group[row]]
+        leg = Leg(
+            symbol=key[0],
+            instruction=_INSTRUCTIONS[
+                bool(columns.is_buy[row]), bool(columns.closing[row])
+            ],
+            qty=float(columns.qty[row]),
+            price=float(columns.price[row]),
+            expiration=key[1],
+            strike=key[2],
+            order_id=int(spread[row]),
+        )
+        unit.append(leg)
+        if (
+            spread[row] >= 0
+            and position + 1 < len(rows)
+            and spread[rows[position + 1]] == spread[row]
+        ):
+            continue
+        try:
+            if len(unit) == 1:
+                tracker.add_leg(leg)
+            else:
+                tracker.add_spread(unit)
+        except ValueError as exc:
+            logging.debug("Backfill skipped leg: %s", exc)
+        unit = []
+
+
+def backfill(columns: LegColumns) -> Backfill:
+    """Compute FIFO positions and realized PnL for every contract at once.
+
+    Every sell can only close quantity bought before it, so the basis of
+    everything sold in a contract is the cost of its first ``sold`` units
+    bought. That cost is read off one piecewise-linear curve of cumulative
+    buy quantity against cumulative buy cost built over all contracts, with
+    each contract occupying its own segment. Contracts that ever sell more
+    than the open quantity or buy to close are short at some point, or have
+    legs :class:`PositionTracker` rejects, so they are replayed through it
+    and the results match it in every case. So are contracts traded in
+    multi-leg orders, which are applied or rejected as a whole. Realized
+    PnL and closed basis are scaled by :meth:`PositionTracker.multiplier`.
+    """
+    _require_numpy()
+    groups = len(columns.keys)
+    order = np.argsort(columns.group, kind="stable")
+    group = columns.group[order]
+    qty = columns.qty[order]
+    price = columns.price[order]
+    is_buy = columns.is_buy[order]
+    closing = columns.closing[order]
+    buy_qty = np.where(is_buy, qty, 0.0)
+    sell_qty = qty - buy_qty
+
+    bought = _group_sums(buy_qty, group, groups)
+    sold = _group_sums(sell_qty, group, groups)
+    bought_cost = _group_sums(buy_qty * price, group, groups)
+    proceeds = _group_sums(sell_qty * price, group, groups)
+
+    # running totals within each contract, to spot contracts going short
+    starts = np.searchsorted(group, np.arange(groups))
+    cum_buy = np.cumsum(buy_qty)
+    cum_sell = np.cumsum(sell_qty)
+    base_buy = np.concatenate(([0.0], cum_buy))[starts]
+    base_sell = np.concatenate(([0.0], cum_sell))[starts]
+    oversold_rows = ~is_buy & (
+        cum_sell - base_sell[group]
+        > cum_buy - base_buy[group] + LotQueue.EPSILON
+    )
+    oversold = np.zeros(groups, dtype=bool)
+    oversold[group[oversold_rows | (is_buy & closing)]] = True
+    # every contract of a multi-leg order is in the replay, and so with it
+    # every order's other legs
+    oversold[columns.group[columns.spread >= 0]] = True
+
+    # cost of the first ``sold`` units of each contract
+    buys = is_buy & (qty > 0)
+    knot_qty = np.concatenate(([0.0], np.cumsum(qty[buys])))
+    knot_cost = np.concatenate(([0.0], np.cumsum(qty[buys] * price[buys])))
+    base_cost = np.interp(base_buy, knot_qty, knot_cost)
+    closed_basis = np.interp(base_buy + sold, knot_qty, knot_cost) - base_cost
+    closed_basis[sold == 0] = 0.0
+
+    open_qty = bought - sold
+    open_cost = bought_cost - closed_basis
+    realized = proceeds - closed_basis
+    unit = PositionTracker().multiplier
+    multiplier = np.array(
+        [unit(key) for key in columns.keys], dtype=np.float64
+    )
+    realized *= multiplier
+    closed_basis *= multiplier
+    # LotQueue resets its totals once every lot is closed
+    flat = open_qty <= LotQueue.EPSILON
+    open_qty[flat] = 0.0
+    open_cost[flat] = 0.0
+
+    # buys still open after FIFO closes the first ``sold`` units
+    remaining = np.clip(
+        cum_buy - base_buy[group] - sold[group], 0.0, buy_qty
+    )
+    lots: list[list[list[float]]] = [[] for _ in range(groups)]
+    for row in np.flatnonzero(is_buy & (remaining > LotQueue.EPSILON)):
+        if not flat[group[row]]:
+            lots[group[row]].append([float(remaining[row]), float(price[row])])
+
+    if oversold.any():
+        tracker = PositionTracker()
+        _sequential(
+            columns, np.flatnonzero(oversold[columns.group]), tracker
+        )
+        for i in np.flatnonzero(oversold):
+            key = columns.keys[i]
+            queue = tracker.positions[key]
+            open_qty[i] = queue.qty
+            open_cost[i] = queue.cost
+            realized[i] = tracker.realized_pnl.get(key, 0.0)
+            closed_basis[i] = tracker.closed_basis.get(key, 0.0)
+            lots[i] = queue.to_list()
+        logging.info(
+            "Backfill replayed %s contracts with shorts or spreads "
+            "sequentially",
+            int(oversold.sum()),
+        )
+
+    return Backfill(
+        columns.keys, open_qty, open_cost, realized, closed_basis, lots
+    )
+
+
+def backfill_orders(orders) -> Backfill:
+    """Flatten Schwab ``orders`` and backfill the resulting legs."""
+    return backfill(load_legs(iter_flatten_legs(orders)))
+
+
+def main(argv=None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        print("usage: python backfill.py ORDERS_JSON", file=sys.stderr)
+        sys.exit(2)
+    with open(argv[0]) as fh:
+        result = backfill_orders(json.load(fh))
+    pnl = result.pnl_percent()
+    for i, (symbol, expiration, strike) in enumerate(result.keys):
+        print(
+            f"{symbol} {expiration} {strike:g} open {result.open_qty[i]:g} "
+            f"realized {result.realized_pnl[i]:.2f} PnL {pnl[i]:.2f}%"
+        )
+
+
+if __name__ == "__main__":
+    main()
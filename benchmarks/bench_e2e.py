@@ -0,0 +1,146 @@
+"""Measure end-to-end poll throughput against the local fake Schwab API.
+
+Starts ``fake_schwab.FakeSchwabServer`` in a thread, feeds it synthetic fills
+at ``--rate`` orders per second and runs the real poll loop, with the shared
+rate limiter and circuit breaker, for ``--duration`` seconds::
+
+    python benchmarks/bench_e2e.py --rate 50 --duration 30 --throttle-rate 0.1
+
+Notifications go to a counting stub instead of Discord. The report shows
+notified legs per second, fill-to-notify lag and how often the client
+retried, was rate limited or found the circuit open.
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from fake_schwab import FakeSchwabServer, FaultInjector, FillGenerator  # noqa: E402,E501
+from synthetic import StubSink  # noqa: E402
+
+from accounts import Account  # noqa: E402
+from client import AsyncSchwabClient, SchwabClient  # noqa: E402
+from cursor import OrderCursor  # noqa: E402
+from dedup import DedupIndex  # noqa: E402
+from metrics import (  # noqa: E402
+    CIRCUIT_OPEN,
+    FILL_LAG_SECONDS,
+    RATE_LIMITED,
+    RETRIES,
+    TRADES,
+)
+from poller import poll_accounts  # noqa: E402
+from ratelimit import CircuitBreaker, TokenBucket  # noqa: E402
+
+TEMPLATE = "{ticker} {instruction} {qty} @ {price} PnL {pnl:.2f}%"
+
+
+async def _run(client, account, sink, duration: float) -> None:
+    task = asyncio.create_task(
+        poll_accounts(client, [account], TEMPLATE, DedupIndex(), sink)
+    )
+    await asyncio.sleep(duration)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+def run(
+    rate: float,
+    duration: float,
+    interval: float = 1.0,
+    budget_per_min: float = 120,
+    faults: FaultInjector | None = None,
+    seed: int = 0,
+) -> dict:
+    """Poll the fake API for ``duration`` seconds and return the results."""
+    server = FakeSchwabServer(faults=faults)
+    server.start()
+    generator = FillGenerator(server.book, rate, seed=seed)
+    client = AsyncSchwabClient(
+        SchwabClient(
+            None,
+            None,
+            TokenBucket.per_minute(budget_per_min),
+            CircuitBreaker(),
+            base_url=server.url,
+        )
+    )
+    account = Account(interval_secs=interval, cursor=OrderCursor())
+    sink = StubSink()
+    before = (
+        TRADES.value(account=""),
+        RETRIES.value(),
+        RATE_LIMITED.value(),
+        FILL_LAG_SECONDS.count(),
+        FILL_LAG_SECONDS.sum(),
+    )
+    generator.start()
+    try:
+        asyncio.run(_run(client, account, sink, duration))
+    finally:
+        generator.stop()
+        client.close()
+        server.shutdown()
+        server.server_close()
+    lags = FILL_LAG_SECONDS.count() - before[3]
+    return {
+        "generated": generator.generated,
+        "legs": TRADES.value(account="") - before[0],
+        "notifications": sink.messages,
+        "notified_per_sec": sink.messages / duration,
+        "mean_lag_secs": (
+            (FILL_LAG_SECONDS.sum() - before[4]) / lags if lags else None
+        ),
+        "retries": RETRIES.value() - before[1],
+        "rate_limited": RATE_LIMITED.value() - before[2],
+        "circuit_open": bool(CIRCUIT_OPEN.value()),
+        "server": dict(server.stats),
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rate", type=float, default=20.0)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--interval", type=float, default=1.0)
+    parser.add_argument("--budget", type=float, default=120)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--quota", type=int)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    faults = FaultInjector(
+        args.latency,
+        args.jitter,
+        args.throttle_rate,
+        args.error_rate,
+        args.quota,
+        args.retry_after,
+        args.seed,
+    )
+    result = run(
+        args.rate,
+        args.duration,
+        args.interval,
+        args.budget,
+        faults,
+        args.seed,
+    )
+    server = result.pop("server")
+    for name, value in result.items():
+        print(f"{name:>18} {value}")
+    print(
+        f"{'server':>18} {server['requests']} requests, "
+        f"{server['throttled']} throttled, {server['errors']} errors, "
+        f"{server['orders_served']} orders served"
+    )
+
+
+if __name__ == "__main__":
+    main()
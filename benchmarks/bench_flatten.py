@@ -0,0 +1,87 @@
+"""Compare the compiled flatten mapping against the path interpreter.
+
+Run from the project root::
+
+    python benchmarks/bench_flatten.py --orders 20000
+"""
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from flatten import (  # noqa: E402
+    TRADE_MAPPING,
+    extract_and_append,
+    flatten_dataset,
+)
+
+
+def make_orders(count: int, legs: int = 2) -> list[dict]:
+    """Return ``count`` Schwab-shaped orders with ``legs`` legs each."""
+    orders = []
+    for order_id in range(count):
+        orders.append({
+            "orderId": order_id,
+            "orderLegCollection": [
+                {
+                    "instrument": {
+                        "symbol": f"SPY   240119C00{470 + leg}000",
+                        "underlyingSymbol": "SPY",
+                        "maturityDate": "2024-01-19",
+                        "strikePrice": 470.0 + leg,
+                    },
+                    "instruction": "BUY_TO_OPEN",
+                    "quantity": 1,
+                }
+                for leg in range(legs)
+            ],
+            "orderActivityCollection": [{
+                "executionLegs": [
+                    {"price": 1.25, "time": "2024-01-02T15:30:00+0000"}
+                    for _ in range(legs)
+                ],
+            }],
+        })
+    return orders
+
+
+def interpreted_dataset(orders) -> list[dict]:
+    """Flatten ``orders`` by interpreting ``TRADE_MAPPING`` per field."""
+    results = []
+    for trade in orders:
+        legs = trade.get("orderLegCollection", [])
+        for i in range(len(legs)):
+            flat = extract_and_append(trade, TRADE_MAPPING, i)
+            flat["multi_leg"] = len(legs) > 1
+            results.append(flat)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=10000)
+    parser.add_argument("--legs", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    orders = make_orders(args.orders, args.legs)
+    assert interpreted_dataset(orders) == flatten_dataset(orders)
+
+    for name, func in (
+        ("interpreted", interpreted_dataset),
+        ("compiled", flatten_dataset),
+    ):
+        best = min(
+            timeit.repeat(lambda: func(orders), number=1, repeat=args.repeat)
+        )
+        legs = args.orders * args.legs
+        print(
+            f"{name:<12} {best * 1000:9.1f} ms  "
+            f"{legs / best:12,.0f} legs/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
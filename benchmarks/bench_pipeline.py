@@ -0,0 +1,230 @@
+"""Time and measure memory for each stage of the poll-to-notify pipeline.
+
+Run from the project root::
+
+    python benchmarks/bench_pipeline.py --save benchmarks/baseline.json
+    python benchmarks/bench_pipeline.py --compare benchmarks/baseline.json
+
+Stages are measured separately on the same synthetic orders:
+
+``flatten``  ``flatten_legs`` and ``normalize_legs`` over the orders
+``track``    ``PositionTracker.add_leg`` for every flattened leg
+``format``   ``format_trade`` for every flattened leg
+``poll``     one ``poll_account`` cycle against a stub client and Discord
+             sink, including JSON decoding and deduplication
+
+``--compare`` exits with status 1 when a stage is slower or uses more memory
+than the baseline by more than ``--threshold``.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from synthetic import StubClient, StubSink, generate_orders  # noqa: E402
+
+from accounts import Account  # noqa: E402
+from dedup import DedupIndex  # noqa: E402
+from flatten import iter_flatten_legs  # noqa: E402
+from normalize import normalize_legs  # noqa: E402
+from messaging import format_trade  # noqa: E402
+from poller import poll_account  # noqa: E402
+from position_tracker import PositionTracker  # noqa: E402
+
+TEMPLATE = (
+    "{ticker} {instruction} {qty} @ {price} {expiration} {strike} "
+    "change {pct_change:.2f}% open {open_qty} PnL {pnl:.2f}%"
+)
+DEFAULT_SIZES = (10, 100, 1000, 10000, 100000)
+STAGES = ("flatten", "track", "format", "poll")
+
+
+def run_flatten(orders, legs, client) -> None:
+    list(normalize_legs(iter_flatten_legs(orders)))
+
+
+def run_track(orders, legs, client) -> None:
+    tracker = PositionTracker()
+    for leg in legs:
+        tracker.add_leg(leg)
+
+
+def run_format(orders, legs, client) -> None:
+    for leg in legs:
+        format_trade(
+            TEMPLATE,
+            leg,
+            ticker=leg.symbol,
+            pct_change=0.0,
+            open_qty=0.0,
+            pnl=0.0,
+        )
+
+
+def run_poll(orders, legs, client) -> None:
+    asyncio.run(
+        poll_account(client, Account(), TEMPLATE, DedupIndex(), StubSink())
+    )
+
+
+RUNNERS = {
+    "flatten": run_flatten,
+    "track": run_track,
+    "format": run_format,
+    "poll": run_poll,
+}
+
+
+def measure(func, repeat: int, memory: bool = True) -> dict:
+    """Return the best of ``repeat`` timings and the peak traced memory."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    result = {"seconds": best}
+    if memory:
+        # traced separately so tracing overhead does not skew the timings
+        tracemalloc.start()
+        try:
+            func()
+            result["peak_kib"] = tracemalloc.get_traced_memory()[1] / 1024
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def run_benchmarks(
+    sizes=DEFAULT_SIZES,
+    stages=STAGES,
+    repeat: int = 3,
+    seed: int = 0,
+    memory: bool = True,
+) -> dict:
+    """Benchmark ``stages`` for each order count in ``sizes``."""
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": seed,
+            "repeat": repeat,
+        },
+        "results": {},
+    }
+    for size in sizes:
+        orders = generate_orders(size, seed=seed)
+        legs = list(normalize_legs(iter_flatten_legs(orders)))
+        client = StubClient(orders)
+        results = report["results"][str(size)] = {"legs": len(legs)}
+        for stage in stages:
+            runner = RUNNERS[stage]
+            result = measure(
+                lambda: runner(orders, legs, client), repeat, memory
+            )
+            result["us_per_leg"] = result["seconds"] * 1e6 / max(1, len(legs))
+            results[stage] = result
+    return report
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> list[str]:
+    """Return a description of every stage that regressed past ``threshold``.
+
+    Sizes and stages missing from either report are ignored.
+    """
+    regressions = []
+    for size, results in report["results"].items():
+        base_results = baseline.get("results", {}).get(size, {})
+        for stage, result in results.items():
+            base = base_results.get(stage)
+            if not isinstance(result, dict) or not isinstance(base, dict):
+                continue
+            for metric in ("seconds", "peak_kib"):
+                if metric not in result or not base.get(metric):
+                    continue
+                ratio = result[metric] / base[metric]
+                if ratio > 1 + threshold:
+                    regressions.append(
+                        f"{stage} @ {size} orders: {metric} "
+                        f"{base[metric]:.4g} -> {result[metric]:.4g} "
+                        f"(+{(ratio - 1) * 100:.0f}%)"
+                    )
+    return regressions
+
+
+def print_report(report: dict) -> None:
+    print(
+        f"{'orders':>8} {'legs':>8} {'stage':<8} {'ms':>10} "
+        f"{'us/leg':>8} {'peak KiB':>10}"
+    )
+    for size, results in report["results"].items():
+        for stage in STAGES:
+            result = results.get(stage)
+            if result is None:
+                continue
+            peak = result.get("peak_kib")
+            print(
+                f"{size:>8} {results['legs']:>8} {stage:<8} "
+                f"{result['seconds'] * 1000:10.2f} "
+                f"{result['us_per_leg']:8.2f} "
+                f"{'-' if peak is None else f'{peak:10.0f}':>10}"
+            )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        default=",".join(map(str, DEFAULT_SIZES)),
+        help="comma-separated order counts",
+    )
+    parser.add_argument(
+        "--stages", default=",".join(STAGES), help="comma-separated stages"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--no-memory", action="store_true", help="skip tracemalloc runs"
+    )
+    parser.add_argument("--save", type=Path, help="write results as JSON")
+    parser.add_argument("--compare", type=Path, help="baseline JSON file")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="allowed fractional slowdown before failing, default 0.25",
+    )
+    args = parser.parse_args(argv)
+
+    stages = [stage for stage in args.stages.split(",") if stage]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+    report = run_benchmarks(
+        [int(size) for size in args.sizes.split(",") if size],
+        stages,
+        args.repeat,
+        args.seed,
+        not args.no_memory,
+    )
+    print_report(report)
+    if args.save:
+        args.save.write_text(json.dumps(report, indent=2))
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        regressions = compare(report, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} of the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
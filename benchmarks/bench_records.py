@@ -0,0 +1,83 @@
+"""Compare flattened legs and lots as dicts/lists against record types.
+
+Run from the project root::
+
+    python benchmarks/bench_records.py --orders 20000
+
+For each representation the legs of ``--orders`` synthetic orders are
+flattened and kept alive, and one lot per leg is held open, reporting the
+time taken and the memory retained per item.
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from synthetic import generate_orders  # noqa: E402
+
+from flatten import flatten_dataset, iter_flatten_legs  # noqa: E402
+from normalize import normalize_legs  # noqa: E402
+from position_tracker import Lot  # noqa: E402
+
+
+def dict_legs(orders) -> list:
+    return flatten_dataset(orders)
+
+
+def record_legs(orders) -> list:
+    return list(normalize_legs(iter_flatten_legs(orders)))
+
+
+def list_lots(legs) -> list:
+    return [[float(index), 1.25] for index in range(len(legs))]
+
+
+def record_lots(legs) -> list:
+    return [Lot(float(index), 1.25) for index in range(len(legs))]
+
+
+def measure(func, arg, repeat: int) -> tuple[float, int, int]:
+    """Return the best time, retained bytes and item count of ``func``."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(arg)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        result = func(arg)
+        retained = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return best, retained, len(result)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    orders = generate_orders(args.orders, seed=args.seed)
+    legs = record_legs(orders)
+    print(f"{'kind':<8} {'as':<8} {'ms':>9} {'us/item':>8} {'B/item':>8}")
+    for kind, func, arg in (
+        ("legs", dict_legs, orders),
+        ("legs", record_legs, orders),
+        ("lots", list_lots, legs),
+        ("lots", record_lots, legs),
+    ):
+        seconds, retained, count = measure(func, arg, args.repeat)
+        name = func.__name__.split("_")[0]
+        print(
+            f"{kind:<8} {name:<8} {seconds * 1000:9.1f} "
+            f"{seconds * 1e6 / count:8.2f} {retained / count:8.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,377 @@
+"""Local stand-in for the Schwab trader API used by load and CI tests.
+
+Serves the order, linked-account, quote and preference endpoints that
+``SchwabClient`` calls. Orders come from recorded JSON (``--replay``), from a
+synthetic fill stream (``--rate``), or both, and every response can be
+delayed or replaced with a 429 or 5xx error. Point the tracker at it with::
+
+    python benchmarks/fake_schwab.py --rate 20 --throttle-rate 0.05
+    SCHWAB_BASE_URL=http://127.0.0.1:8182 python main.py
+
+``GET /_stats`` returns counts of the requests served and errors injected.
+"""
+import argparse
+import copy
+import json
+import logging
+import math
+import random
+import sys
+import threading
+import time
+import zlib
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from synthetic import generate_orders  # noqa: E402
+
+from cursor import order_time, parse_time  # noqa: E402
+
+ACCOUNT_NUMBER = "12345678"
+ACCOUNT_HASH = "FAKEHASH"
+
+
+def _now() -> datetime:
+    # whole seconds, so orders entered "now" fall inside a request whose
+    # end time was truncated to the second
+    return datetime.now(timezone.utc).replace(microsecond=0)
+
+
+def _format(moment: datetime) -> str:
+    moment = moment.astimezone(timezone.utc)
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "+0000"
+
+
+def shift_order(order: dict, delta: timedelta) -> dict:
+    """Return a copy of ``order`` with every timestamp moved by ``delta``."""
+    order = copy.deepcopy(order)
+    for field in ("enteredTime", "closeTime"):
+        moment = parse_time(order.get(field))
+        if moment is not None:
+            order[field] = _format(moment + delta)
+    for activity in order.get("orderActivityCollection") or []:
+        for leg in activity.get("executionLegs") or []:
+            moment = parse_time(leg.get("time"))
+            if moment is not None:
+                leg["time"] = _format(moment + delta)
+    return order
+
+
+def fake_quote(symbol: str) -> dict:
+    """Return a quote whose mark drifts slowly around a per-symbol level."""
+    level = 0.05 + zlib.crc32(symbol.encode()) % 2000 / 100
+    mark = round(level * (1 + 0.05 * math.sin(time.time() / 60)), 2)
+    return {"symbol": symbol, "quote": {"mark": mark}}
+
+
+class FaultInjector:
+    """Decide per request whether to delay, throttle or fail it.
+
+    ``throttle_rate`` and ``error_rate`` are probabilities. ``quota`` caps
+    the requests accepted in any 60-second window; requests over it get a
+    429 like Schwab's per-minute limit.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        throttle_rate: float = 0.0,
+        error_rate: float = 0.0,
+        quota: int | None = None,
+        retry_after: float = 1.0,
+        seed: int | None = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.quota = quota
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.window: deque[float] = deque()
+        self.lock = threading.Lock()
+
+    def delay(self) -> float:
+        with self.lock:
+            return self.latency + self.random.uniform(0, self.jitter)
+
+    def fault(self) -> int | None:
+        """Return the error status to send instead of a result, if any."""
+        now = time.monotonic()
+        with self.lock:
+            if self.quota is not None:
+                while self.window and self.window[0] <= now - 60:
+                    self.window.popleft()
+                if len(self.window) >= self.quota:
+                    return 429
+                self.window.append(now)
+            roll = self.random.random()
+        if roll < self.throttle_rate:
+            return 429
+        if roll < self.throttle_rate + self.error_rate:
+            return 503
+        return None
+
+
+class OrderBook:
+    """Orders visible to the fake API, filtered like ``account_orders``.
+
+    Orders are returned in the order they were added unless
+    ``newest_first`` is set, which reverses them the way the live API lists
+    recent orders.
+    """
+
+    def __init__(self, newest_first: bool = False):
+        self.orders: list[dict] = []
+        self.newest_first = newest_first
+        self.lock = threading.Lock()
+
+    def add(self, order: dict) -> None:
+        with self.lock:
+            self.orders.append(order)
+
+    def replay(self, orders, rebase: bool = True) -> None:
+        """Add recorded ``orders``, moved so the newest is entered now."""
+        orders = list(orders)
+        if rebase and orders:
+            times = [order_time(order) for order in orders]
+            newest = max((t for t in times if t is not None), default=None)
+            if newest is not None:
+                delta = _now() - newest
+                orders = [shift_order(order, delta) for order in orders]
+        with self.lock:
+            self.orders.extend(orders)
+
+    def query(
+        self,
+        start: datetime | None,
+        end: datetime | None,
+        max_results: int | None = None,
+        status: str | None = None,
+    ) -> list[dict]:
+        with self.lock:
+            orders = list(self.orders)
+        matches = []
+        for order in orders:
+            entered = parse_time(order.get("enteredTime"))
+            if entered is not None:
+                if start is not None and entered < start:
+                    continue
+                if end is not None and entered > end:
+                    continue
+            if status is not None and order.get("status") != status:
+                continue
+            matches.append(order)
+        if self.newest_first:
+            matches.reverse()
+        return matches[:max_results] if max_results else matches
+
+
+class FillGenerator(threading.Thread):
+    """Add synthetic orders to ``book`` at ``rate`` orders per second.
+
+    Orders are drawn from a pool made by :func:`synthetic.generate_orders`
+    and restamped with the current time and a fresh order ID, so the pool
+    can repeat indefinitely without ever selling more than was bought.
+    """
+
+    def __init__(
+        self, book: OrderBook, rate: float, pool_size: int = 1000, seed=0
+    ):
+        super().__init__(daemon=True, name="fake-schwab-fills")
+        self.book = book
+        self.rate = rate
+        self.pool = generate_orders(pool_size, seed=seed)
+        self.generated = 0
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        interval = 1 / self.rate
+        next_fill = time.monotonic()
+        while not self.stopped.is_set():
+            template = self.pool[self.generated % len(self.pool)]
+            order = shift_order(template, _now() - order_time(template))
+            order["orderId"] = 50_000_000 + self.generated
+            self.book.add(order)
+            self.generated += 1
+            next_fill += interval
+            self.stopped.wait(max(0.0, next_fill - time.monotonic()))
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+
+class FakeSchwabHandler(BaseHTTPRequestHandler):
+    server: "FakeSchwabServer"
+
+    def log_message(self, format, *args) -> None:
+        logging.debug("fake schwab: " + format, *args)
+
+    def _send_json(self, status: int, body, headers=None) -> None:
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        stats = self.server.stats
+        if url.path == "/_stats":
+            self._send_json(200, dict(stats))
+            return
+        stats["requests"] += 1
+        time.sleep(self.server.faults.delay())
+        status = self.server.faults.fault()
+        if status == 429:
+            stats["throttled"] += 1
+            retry_after = self.server.faults.retry_after
+            self._send_json(
+                429,
+                {"message": "Too many requests"},
+                {"Retry-After": f"{retry_after:g}"},
+            )
+            return
+        if status is not None:
+            stats["errors"] += 1
+            self._send_json(status, {"message": "Service unavailable"})
+            return
+
+        parts = url.path.strip("/").split("/")
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if parts == ["trader", "v1", "orders"] or (
+            len(parts) == 5
+            and parts[:3] == ["trader", "v1", "accounts"]
+            and parts[4] == "orders"
+        ):
+            if len(parts) == 5 and parts[3] != ACCOUNT_HASH:
+                self._send_json(404, {"message": "Unknown account"})
+                return
+            max_results = query.get("maxResults")
+            orders = self.server.book.query(
+                parse_time(query.get("fromEnteredTime")),
+                parse_time(query.get("toEnteredTime")),
+                int(max_results) if max_results else None,
+                query.get("status"),
+            )
+            stats["orders_served"] += len(orders)
+            self._send_json(200, orders)
+        elif parts == ["trader", "v1", "accounts", "accountNumbers"]:
+            self._send_json(
+                200,
+                [{"accountNumber": ACCOUNT_NUMBER, "hashValue": ACCOUNT_HASH}],
+            )
+        elif parts == ["marketdata", "v1", "quotes"]:
+            symbols = [s for s in query.get("symbols", "").split(",") if s]
+            self._send_json(
+                200, {symbol: fake_quote(symbol) for symbol in symbols}
+            )
+        elif parts == ["trader", "v1", "userPreference"]:
+            self._send_json(200, {"accounts": [], "streamerInfo": []})
+        else:
+            self._send_json(404, {"message": f"Unknown path {url.path}"})
+
+
+class FakeSchwabServer(ThreadingHTTPServer):
+    """Threaded HTTP server holding the order book and fault settings."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address=("127.0.0.1", 0),
+        book: OrderBook | None = None,
+        faults: FaultInjector | None = None,
+    ):
+        super().__init__(address, FakeSchwabHandler)
+        self.book = book or OrderBook()
+        self.faults = faults or FaultInjector()
+        self.stats = {
+            "requests": 0,
+            "throttled": 0,
+            "errors": 0,
+            "orders_served": 0,
+        }
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> threading.Thread:
+        """Serve from a daemon thread and return it."""
+        thread = threading.Thread(
+            target=self.serve_forever, daemon=True, name="fake-schwab"
+        )
+        thread.start()
+        return thread
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8182)
+    parser.add_argument(
+        "--replay", type=Path, action="append", default=[],
+        help="JSON file of recorded orders; may be repeated",
+    )
+    parser.add_argument(
+        "--no-rebase", action="store_true",
+        help="serve replayed orders with their recorded timestamps",
+    )
+    parser.add_argument(
+        "--newest-first", action="store_true",
+        help="list orders newest first like the live API",
+    )
+    parser.add_argument(
+        "--rate", type=float, default=0.0,
+        help="synthetic orders generated per second",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--quota", type=int, help="requests allowed per minute"
+    )
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    faults = FaultInjector(
+        args.latency,
+        args.jitter,
+        args.throttle_rate,
+        args.error_rate,
+        args.quota,
+        args.retry_after,
+        args.seed,
+    )
+    server = FakeSchwabServer(
+        (args.host, args.port), OrderBook(args.newest_first), faults
+    )
+    for path in args.replay:
+        server.book.replay(json.loads(path.read_text()), not args.no_rebase)
+    if args.rate > 0:
+        FillGenerator(server.book, args.rate, seed=args.seed).start()
+    logging.info("Fake Schwab API listening on %s", server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Synthetic Schwab orders and stub endpoints for the benchmarks.
+
+The generated orders follow the shape returned by ``account_orders``:
+single-leg and multi-leg option orders, some of them only partially filled.
+Sells never exceed the quantity bought earlier on the same contract, so the
+orders can be fed through :class:`PositionTracker` without errors.
+"""
+import json
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from discord_client import record_fill_lag  # noqa: E402
+
+UNDERLYINGS = ("SPY", "QQQ", "AAPL", "TSLA", "NVDA", "AMD", "MSFT", "IWM")
+EPOCH = datetime(2024, 1, 2, 14, 30, tzinfo=timezone.utc)
+
+
+def _contract(rng: random.Random) -> dict:
+    underlying = rng.choice(UNDERLYINGS)
+    expiration = (EPOCH + timedelta(days=rng.randrange(0, 60, 7))).date()
+    strike = float(rng.randrange(50, 600, 5))
+    put_call = rng.choice("CP")
+    return {
+        "symbol": (
+            f"{underlying:<6}{expiration:%y%m%d}{put_call}"
+            f"{int(strike * 1000):08d}"
+        ),
+        "underlyingSymbol": underlying,
+        "maturityDate": expiration.isoformat(),
+        "strikePrice": strike,
+        "putCall": "CALL" if put_call == "C" else "PUT",
+        "assetType": "OPTION",
+    }
+
+
+def generate_orders(
+    count: int,
+    multi_leg_ratio: float = 0.3,
+    partial_ratio: float = 0.2,
+    max_legs: int = 4,
+    contracts: int = 500,
+    seed: int = 0,
+) -> list[dict]:
+    """Return ``count`` deterministic orders for ``seed``.
+
+    ``multi_leg_ratio`` of the orders have 2 to ``max_legs`` legs and
+    ``partial_ratio`` have fills for less than the ordered quantity, spread
+    over several activities. Legs trade a pool of ``contracts`` contracts.
+    """
+    rng = random.Random(seed)
+    pool = [_contract(rng) for _ in range(contracts)]
+    open_qty = [0] * contracts
+    orders = []
+    for order_id in range(count):
+        entered = EPOCH + timedelta(seconds=order_id)
+        legs = 1
+        if rng.random() < multi_leg_ratio:
+            legs = rng.randint(2, max_legs)
+        partial = rng.random() < partial_ratio
+        leg_collection = []
+        fills = []
+        ordered = 0
+        for leg_id, index in enumerate(rng.sample(range(contracts), legs)):
+            quantity = rng.randint(1, 10)
+            # close only what an earlier order opened
+            if open_qty[index] >= quantity and rng.random() < 0.5:
+                instruction = "SELL"
+            else:
+                instruction = "BUY"
+            open_qty[index] += quantity if instruction == "BUY" else -quantity
+            ordered += quantity
+            leg_collection.append({
+                "legId": leg_id + 1,
+                "instrument": dict(pool[index]),
+                "instruction": instruction,
+                "quantity": quantity,
+                "orderLegType": "OPTION",
+            })
+            price = round(rng.uniform(0.05, 20.0), 2)
+            fills.append((leg_id + 1, quantity, price))
+        # a partially filled order has two executions covering part of it
+        executions = 2 if partial else 1
+        activities = []
+        filled = 0
+        for execution in range(executions):
+            executed = entered + timedelta(seconds=execution, milliseconds=250)
+            execution_legs = []
+            for leg_id, quantity, price in fills:
+                leg_qty = max(1, quantity // 3) if partial else quantity
+                filled += leg_qty
+                execution_legs.append({
+                    "legId": leg_id,
+                    "price": price,
+                    "quantity": leg_qty,
+                    "time": executed.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
+                    + "+0000",
+                })
+            activities.append({
+                "activityType": "EXECUTION",
+                "executionType": "FILL",
+                "quantity": sum(leg["quantity"] for leg in execution_legs),
+                "executionLegs": execution_legs,
+            })
+        # Schwab lists the most recent execution first
+        activities.reverse()
+        orders.append({
+            "orderId": 10_000_000 + order_id,
+            "accountNumber": 12345678,
+            "status": "WORKING" if partial else "FILLED",
+            "quantity": ordered,
+            "filledQuantity": min(filled, ordered),
+            "remainingQuantity": max(0, ordered - filled),
+            "orderStrategyType": "SINGLE" if legs == 1 else "TRIGGER",
+            "complexOrderStrategyType": "NONE" if legs == 1 else "CUSTOM",
+            "enteredTime": entered.strftime("%Y-%m-%dT%H:%M:%S+0000"),
+            "closeTime": entered.strftime("%Y-%m-%dT%H:%M:%S+0000"),
+            "orderLegCollection": leg_collection,
+            "orderActivityCollection": activities,
+        })
+    return orders
+
+
+class StubClient:
+    """In-memory stand-in for :class:`client.SchwabClient`.
+
+    The orders are serialised once and decoded on every request so the
+    benchmark includes JSON parsing.
+    """
+
+    def __init__(self, orders: list[dict]):
+        self.body = json.dumps(orders).encode()
+        self.calls = 0
+
+    def get_account_positions(self, **kwargs):
+        self.calls += 1
+        return json.loads(self.body)
+
+    def refresh_tokens(self) -> None:
+        pass
+
+
+class StubSink:
+    """Discord dispatcher stand-in that only counts queued messages.
+
+    Messages count as delivered when queued, so their fill lag is recorded
+    at once.
+    """
+
+    def __init__(self):
+        self.messages = 0
+        self.chars = 0
+
+    async def send(self, message, fill_times=()) -> None:
+        self.messages += 1
+        self.chars += len(message)
+        record_fill_lag(fill_times)
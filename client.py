@@ -1,26 +1,170 @@
+import asyncio
 import logging
+import random
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
-import requests
-import schwabdev
+from email.utils import parsedate_to_datetime
 
+from http_session import HttpSession, get_session
+from lazy import lazy_import
+from metrics import RATE_LIMITED, RETRIES
+from ratelimit import CircuitBreaker, CircuitOpenError, TokenBucket
 
-def create_schwab_client(key: str, secret: str):
-    """Instantiate and return a Schwabdev client."""
+# imported on first use so tools and tests that never log in skip them
+requests = lazy_import("requests")
+schwabdev = lazy_import("schwabdev")
+
+
+class HttpSchwabClient:
+    """Minimal unauthenticated client for a Schwab-compatible API.
+
+    Implements the subset of ``schwabdev.Client`` used by
+    :class:`SchwabClient` against ``base_url``, such as the local stand-in
+    in ``benchmarks/fake_schwab.py``. No OAuth tokens are sent. Requests
+    go through the shared pooled session from
+    :func:`http_session.get_session`.
+    """
+
+    def __init__(self, base_url: str, session: HttpSession | None = None):
+        self.base_url = base_url.rstrip("/")
+        self.session = session or get_session()
+
+    def _get(self, path: str, params: dict | None = None):
+        if params:
+            params = {k: v for k, v in params.items() if v is not None}
+        return self.session.get(self.base_url + path, params=params)
+
+    def linked_accounts(self):
+        return self._get("/trader/v1/accounts/accountNumbers")
+
+    def account_orders(
+        self, account_hash, from_entered, to_entered, max_results=None,
+        status=None,
+    ):
+        return self._get(
+            f"/trader/v1/accounts/{account_hash}/orders",
+            {
+                "fromEnteredTime": from_entered,
+                "toEnteredTime": to_entered,
+                "maxResults": max_results,
+                "status": status,
+            },
+        )
+
+    def account_orders_all(
+        self, from_entered, to_entered, max_results=None, status=None
+    ):
+        return self._get(
+            "/trader/v1/orders",
+            {
+                "fromEnteredTime": from_entered,
+                "toEnteredTime": to_entered,
+                "maxResults": max_results,
+                "status": status,
+            },
+        )
+
+    def preferences(self):
+        return self._get("/trader/v1/userPreference")
+
+    def quotes(self, symbols, fields=None, indicative=False):
+        if not isinstance(symbols, str):
+            symbols = ",".join(symbols)
+        return self._get(
+            "/marketdata/v1/quotes",
+            {"symbols": symbols, "fields": fields, "indicative": indicative},
+        )
+
+    def update_tokens(self) -> None:
+        """No-op; the stand-in API needs no tokens."""
+
+
+def create_schwab_client(key: str, secret: str, base_url: str | None = None):
+    """Instantiate and return a Schwabdev client.
+
+    With ``base_url`` an :class:`HttpSchwabClient` for that address is
+    returned instead, for running against a local stand-in API.
+    """
+    if base_url:
+        logging.info("Using Schwab API at %s", base_url)
+        return HttpSchwabClient(base_url)
     logging.debug("Initializing Schwabdev client")
     return schwabdev.Client(key, secret)
 
 
+def format_time(moment: datetime) -> str:
+    """Return ``moment`` as a UTC ISO timestamp accepted by Schwab."""
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
 def get_start_time(delta_hours: int = 1) -> str:
     """Return the UTC ISO timestamp ``delta_hours`` hours ago."""
-    start = datetime.now(timezone.utc) - timedelta(hours=delta_hours)
-    return start.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+    return format_time(
+        datetime.now(timezone.utc) - timedelta(hours=delta_hours)
+    )
 
 
 def get_end_time() -> str:
     """Return the current time as a UTC ISO timestamp."""
-    end = datetime.now(timezone.utc)
-    return end.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+    return format_time(datetime.now(timezone.utc))
+
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+def retry_after_secs(response) -> float | None:
+    """Return the ``Retry-After`` delay of ``response`` in seconds."""
+    value = getattr(response, "headers", {}).get("Retry-After")
+    if not isinstance(value, str):
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (moment - datetime.now(timezone.utc)).total_seconds())
+
+
+def _attempt_delay(
+    response,
+    exc: Exception | None,
+    delay: float,
+    limiter: TokenBucket | None,
+    breaker: CircuitBreaker | None,
+) -> float | None:
+    """Classify one attempt and return how long to wait before retrying.
+
+    Returns ``None`` when the attempt is final: a response whose status is
+    not retryable. Exceptions and 5xx responses count against ``breaker``;
+    a 429 pauses ``limiter`` so every caller sharing it backs off.
+    """
+    status = getattr(response, "status_code", None)
+    if exc is None and status not in RETRY_STATUSES:
+        if breaker is not None:
+            breaker.record_success()
+        return None
+    retry_after = retry_after_secs(response) if exc is None else None
+    if status == 429:
+        RATE_LIMITED.inc()
+        if limiter is not None:
+            limiter.pause(retry_after if retry_after is not None else delay)
+    elif breaker is not None:
+        breaker.record_failure()
+    if retry_after is not None:
+        return retry_after + random.uniform(0, 1)
+    # "equal jitter": half the backoff plus a random share of the rest
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def _admit(breaker: CircuitBreaker | None) -> None:
+    if breaker is not None and not breaker.allow():
+        raise CircuitOpenError(
+            f"Schwab circuit open, retry in {breaker.retry_in():.0f}s"
+        )
 
 
 def retry_request(
@@ -28,42 +172,263 @@ def retry_request(
     retries: int = 3,
     delay: int = 5,
     backoff: int = 2,
-    retry_on=(requests.exceptions.RequestException,),
+    retry_on=None,
     raise_on_fail: bool = False,
+    limiter: TokenBucket | None = None,
+    breaker: CircuitBreaker | None = None,
 ):
-    """Retry a request with exponential backoff."""
+    """Retry a request with jittered exponential backoff.
+
+    Exceptions in ``retry_on`` and responses with a status in
+    ``RETRY_STATUSES`` are retried, waiting for ``Retry-After`` when the
+    server sends one. Every attempt first takes a token from ``limiter``.
+    While ``breaker`` is open no request is sent and
+    :class:`CircuitOpenError` is raised. When retries run out on a bad
+    status the last response is returned for the caller to report.
+    """
+    if retry_on is None:
+        retry_on = (requests.exceptions.RequestException,)
     last_exc = None
+    response = None
     for attempt in range(1, retries + 1):
+        _admit(breaker)
+        if limiter is not None:
+            limiter.acquire_sync()
         try:
-            return request_func()
+            response = request_func()
+            last_exc = None
         except retry_on as e:
-            last_exc = e
-            logging.warning(
-                "[Attempt %s] Request failed: %s. Retrying in %ss...",
-                attempt,
-                e,
-                delay,
-            )
-            time.sleep(delay)
-            delay *= backoff
+            response, last_exc = None, e
+        wait = _attempt_delay(response, last_exc, delay, limiter, breaker)
+        if wait is None:
+            return response
+        if attempt == retries:
+            break
+        logging.warning(
+            "[Attempt %s] Request failed: %s. Retrying in %.1fs...",
+            attempt,
+            last_exc or f"HTTP {response.status_code}",
+            wait,
+        )
+        RETRIES.inc()
+        time.sleep(wait)
+        delay *= backoff
+    logging.error("All retry attempts failed.")
+    if raise_on_fail and last_exc is not None:
+        raise last_exc
+    return response
+
+
+async def async_retry_request(
+    request_func,
+    retries: int = 3,
+    delay: int = 5,
+    backoff: int = 2,
+    retry_on=None,
+    raise_on_fail: bool = False,
+    executor: ThreadPoolExecutor | None = None,
+    limiter: TokenBucket | None = None,
+    breaker: CircuitBreaker | None = None,
+):
+    """Retry a blocking request in ``executor`` with asyncio backoff.
+
+    Behaves like :func:`retry_request` but each attempt runs in a worker
+    thread and waits between attempts, and for ``limiter`` tokens, with
+    ``asyncio.sleep`` so the event loop stays responsive and cancellation
+    is honoured immediately.
+    """
+    if retry_on is None:
+        retry_on = (requests.exceptions.RequestException,)
+    loop = asyncio.get_running_loop()
+    last_exc = None
+    response = None
+    for attempt in range(1, retries + 1):
+        _admit(breaker)
+        if limiter is not None:
+            await limiter.acquire()
+        try:
+            response = await loop.run_in_executor(executor, request_func)
+            last_exc = None
+        except retry_on as e:
+            response, last_exc = None, e
+        wait = _attempt_delay(response, last_exc, delay, limiter, breaker)
+        if wait is None:
+            return response
+        if attempt == retries:
+            break
+        logging.warning(
+            "[Attempt %s] Request failed: %s. Retrying in %.1fs...",
+            attempt,
+            last_exc or f"HTTP {response.status_code}",
+            wait,
+        )
+        RETRIES.inc()
+        await asyncio.sleep(wait)
+        delay *= backoff
     logging.error("All retry attempts failed.")
     if raise_on_fail and last_exc is not None:
         raise last_exc
-    return None
+    return response
 
 
 class SchwabClient:
-    """Wrapper around schwabdev.Client with retry logic."""
+    """Wrapper around schwabdev.Client with retry logic.
+
+    ``limiter`` is a :class:`TokenBucket` shared by every request, sized to
+    the Schwab quota, and ``breaker`` fails requests fast while the API is
+    down. ``base_url`` points the client at a Schwab-compatible stand-in;
+    see :func:`create_schwab_client`.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        secret: str,
+        limiter: TokenBucket | None = None,
+        breaker: CircuitBreaker | None = None,
+        base_url: str | None = None,
+    ):
+        self.client = create_schwab_client(key, secret, base_url)
+        self.limiter = limiter
+        self.breaker = breaker
+
+    def get_account_positions(
+        self,
+        status: str | None = None,
+        hours: int = 1,
+        since: datetime | None = None,
+        account_hash: str | None = None,
+    ):
+        """Return account orders between ``hours`` ago and now.
+
+        When ``since`` is given it replaces the ``hours`` window so callers
+        can fetch only orders entered after a known cursor. ``account_hash``
+        restricts the request to one linked account.
+        """
+        response = retry_request(
+            self._orders_request(status, hours, since, account_hash),
+            raise_on_fail=True,
+            limiter=self.limiter,
+            breaker=self.breaker,
+        )
+        return self._parse_orders(response)
+
+    def get_account_hashes(self) -> dict[str, str]:
+        """Return a mapping of linked account numbers to their hashes."""
+        response = retry_request(
+            self._linked_request(),
+            raise_on_fail=True,
+            limiter=self.limiter,
+            breaker=self.breaker,
+        )
+        if response is None or response.status_code != 200:
+            logging.error("Failed to get linked accounts: %s", response)
+            return {}
+        return {
+            str(account["accountNumber"]): account["hashValue"]
+            for account in response.json()
+        }
+
+    def get_streamer_info(self) -> dict | None:
+        """Return the streamer connection details from user preferences.
 
-    def __init__(self, key: str, secret: str):
-        self.client = create_schwab_client(key, secret)
+        The first ``streamerInfo`` entry is returned with the current
+        ``accessToken`` added for the streamer login, or ``None`` when the
+        preferences cannot be fetched.
+        """
+        response = retry_request(
+            self.client.preferences,
+            raise_on_fail=True,
+            limiter=self.limiter,
+            breaker=self.breaker,
+        )
+        if response is None or response.status_code != 200:
+            logging.error("Failed to get streamer info: %s", response)
+            return None
+        streamers = response.json().get("streamerInfo") or []
+        if not streamers:
+            logging.error("No streamer info in user preferences")
+            return None
+        tokens = getattr(self.client, "tokens", None)
+        return {
+            **streamers[0],
+            "accessToken": getattr(tokens, "access_token", "") or "",
+        }
+
+    def get_quotes(self, symbols: list[str]) -> dict:
+        """Return the quotes response for ``symbols`` in one request.
+
+        Returns an empty dict when the request fails.
+        """
+        response = retry_request(
+            lambda: self.client.quotes(symbols, "quote"),
+            raise_on_fail=True,
+            limiter=self.limiter,
+            breaker=self.breaker,
+        )
+        if response is None or response.status_code != 200:
+            logging.error("Failed to get quotes: %s", response)
+            return {}
+        return response.json()
+
+    def probe(self) -> bool:
+        """Send one cheap request and report the outcome to the breaker.
+
+        Used to test whether the API has recovered while the circuit is
+        open; returns whether the request succeeded.
+        """
+        if self.limiter is not None:
+            self.limiter.acquire_sync()
+        try:
+            response = self._linked_request()()
+        except requests.exceptions.RequestException:
+            response = None
+        ok = getattr(response, "status_code", None) == 200
+        if self.breaker is not None:
+            if ok:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+        return ok
+
+    def refresh_tokens(self) -> None:
+        """Refresh the access token if the underlying client supports it."""
+        tokens = getattr(self.client, "tokens", None)
+        update = getattr(tokens, "update_tokens", None) or getattr(
+            self.client, "update_tokens", None
+        )
+        if update is not None:
+            update()
 
-    def get_account_positions(self, status: str | None = None, hours: int = 1):
-        """Return account orders between ``hours`` ago and now."""
+    def _linked_request(self):
+        """Return the linked-accounts call of the installed schwabdev."""
+        return getattr(self.client, "account_linked", None) or getattr(
+            self.client, "linked_accounts"
+        )
+
+    def _orders_request(
+        self,
+        status: str | None,
+        hours: int,
+        since: datetime | None,
+        account_hash: str | None = None,
+    ):
+        """Return a callable that performs one orders request."""
 
         def fetch_orders():
-            from_date_str = get_start_time(hours)
+            if since is not None:
+                from_date_str = format_time(since)
+            else:
+                from_date_str = get_start_time(hours)
             to_date_str = get_end_time()
+            if account_hash is not None:
+                return self.client.account_orders(
+                    account_hash,
+                    from_date_str,
+                    to_date_str,
+                    None,
+                    status,
+                )
             return self.client.account_orders_all(
                 from_date_str,
                 to_date_str,
@@ -71,7 +436,11 @@ class SchwabClient:
                 status,
             )
 
-        response = retry_request(fetch_orders, raise_on_fail=True)
+        return fetch_orders
+
+    @staticmethod
+    def _parse_orders(response):
+        """Decode a successful orders response or log the failure."""
         if response is not None and response.status_code == 200:
             return response.json()
         logging.error(
@@ -79,3 +448,117 @@ class SchwabClient:
             response,
         )
         return None
+
+
+class AsyncSchwabClient:
+    """Asyncio front-end for :class:`SchwabClient`.
+
+    Blocking HTTP calls and JSON decoding run in a dedicated thread pool and
+    retries back off with ``asyncio.sleep``, so fetching never blocks the
+    event loop. Up to ``max_workers`` requests can be in flight at once.
+    """
+
+    def __init__(self, client: SchwabClient, max_workers: int = 4):
+        self.sync_client = client
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="schwab"
+        )
+        self._token_refresh: asyncio.Future | None = None
+        self._probe_task: asyncio.Task | None = None
+
+    async def get_account_positions(
+        self,
+        status: str | None = None,
+        hours: int = 1,
+        since: datetime | None = None,
+        account_hash: str | None = None,
+    ):
+        """Asynchronously return account orders; see ``SchwabClient``.
+
+        The response is decoded in the executor, off the event loop.
+        """
+        try:
+            response = await async_retry_request(
+                self.sync_client._orders_request(
+                    status, hours, since, account_hash
+                ),
+                raise_on_fail=True,
+                executor=self.executor,
+                limiter=self.sync_client.limiter,
+                breaker=self.sync_client.breaker,
+            )
+        except CircuitOpenError:
+            self._start_probe()
+            raise
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, self.sync_client._parse_orders, response
+        )
+
+    async def get_account_hashes(self) -> dict[str, str]:
+        """Asynchronously return linked account numbers and hashes."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, self.sync_client.get_account_hashes
+        )
+
+    async def get_streamer_info(self) -> dict | None:
+        """Asynchronously return streamer connection details."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, self.sync_client.get_streamer_info
+        )
+
+    async def get_quotes(self, symbols: list[str]) -> dict:
+        """Asynchronously return quotes; see ``SchwabClient.get_quotes``."""
+        try:
+            response = await async_retry_request(
+                lambda: self.sync_client.client.quotes(symbols, "quote"),
+                raise_on_fail=True,
+                executor=self.executor,
+                limiter=self.sync_client.limiter,
+                breaker=self.sync_client.breaker,
+            )
+        except CircuitOpenError:
+            self._start_probe()
+            raise
+        if response is None or response.status_code != 200:
+            logging.error("Failed to get quotes: %s", response)
+            return {}
+        return response.json()
+
+    async def refresh_tokens(self) -> None:
+        """Refresh tokens once even when several callers ask concurrently.
+
+        Callers arriving while a refresh is in flight wait on the same
+        future instead of starting another refresh.
+        """
+        if self._token_refresh is None or self._token_refresh.done():
+            loop = asyncio.get_running_loop()
+            self._token_refresh = loop.run_in_executor(
+                self.executor, self.sync_client.refresh_tokens
+            )
+        await asyncio.shield(self._token_refresh)
+
+    def _start_probe(self) -> None:
+        """Probe the API in the background until the circuit closes."""
+        if self._probe_task is None or self._probe_task.done():
+            self._probe_task = asyncio.get_running_loop().create_task(
+                self._probe_until_closed()
+            )
+
+    async def _probe_until_closed(self) -> None:
+        breaker = self.sync_client.breaker
+        loop = asyncio.get_running_loop()
+        while breaker.state != breaker.CLOSED:
+            await asyncio.sleep(max(breaker.retry_in(), 0.05))
+            if breaker.allow():
+                await loop.run_in_executor(
+                    self.executor, self.sync_client.probe
+                )
+
+    def close(self) -> None:
+        """Shut down the worker threads without waiting for them."""
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,178 @@
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+# order statuses after which an order can receive no further fills
+TERMINAL_STATUSES = frozenset(
+    {"FILLED", "CANCELED", "REJECTED", "EXPIRED", "REPLACED"}
+)
+
+
+def parse_time(value: str | None) -> datetime | None:
+    """Parse a Schwab ISO timestamp, returning ``None`` when invalid."""
+    if not value:
+        return None
+    try:
+        moment = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment
+
+
+def order_time(order: dict) -> datetime | None:
+    """Return the close time of ``order`` falling back to its entered time."""
+    return parse_time(order.get("closeTime")) or parse_time(
+        order.get("enteredTime")
+    )
+
+
+class OrderCursor:
+    """High-water mark used to fetch only new orders from Schwab.
+
+    The cursor remembers the newest order close/entered time seen and the
+    number of fill activities recorded for each order. Fetches start
+    ``overlap_secs`` before the high-water mark so late-arriving orders are
+    not missed; the activity counts then filter out fills that were already
+    processed. Orders that are still working may fill long after they were
+    entered, so fetches also reach back to the earliest entered time among
+    them, and each later fill returns the whole order again. The IDs of
+    the fills already applied from working orders are kept in
+    ``applied`` for as long as the order can fill, so they are not applied
+    twice however long ago they were first seen. State is persisted as
+    JSON at ``path`` when one is given.
+    """
+
+    def __init__(self, path: str | None = None, overlap_secs: float = 60):
+        self.path = path
+        self.overlap = timedelta(seconds=overlap_secs)
+        self.high_water: datetime | None = None
+        # orderId -> (activity count, order time) for orders in the window
+        self.seen: dict[int, tuple[int, datetime | None]] = {}
+        # orderId -> entered time of orders that can still fill
+        self.working: dict[int, datetime] = {}
+        # (orderId, time, symbol) of fills applied by the poller; pruned to
+        # the working orders after each fetch
+        self.applied: set[tuple] = set()
+
+    def start_time(self, hours: int = 1) -> datetime:
+        """Return the ``fromEnteredTime`` for the next fetch."""
+        if self.high_water is None:
+            return datetime.now(timezone.utc) - timedelta(hours=hours)
+        start = self.high_water - self.overlap
+        if self.working:
+            start = min(start, min(self.working.values()))
+        return start
+
+    def filter_new(self, orders) -> list[dict]:
+        """Return orders in ``orders`` that carry fills not seen before.
+
+        The high-water mark advances to the newest order time encountered
+        and entries that fell out of the fetch window are pruned.
+        """
+        return list(self.iter_new(orders))
+
+    def iter_new(self, orders):
+        """Lazily yield orders with unseen fills; see :meth:`filter_new`."""
+        # rebuilt from each fetch, which reaches back to every working
+        # order, so orders that stopped being returned are dropped
+        working = {}
+        for order in orders or []:
+            moment = order_time(order)
+            if moment is not None and (
+                self.high_water is None or moment > self.high_water
+            ):
+                self.high_water = moment
+            order_id = order.get("orderId")
+            status = order.get("status")
+            entered = parse_time(order.get("enteredTime"))
+            if (
+                order_id is not None
+                and entered is not None
+                and status
+                and status not in TERMINAL_STATUSES
+            ):
+                working[order_id] = entered
+            activities = len(order.get("orderActivityCollection") or [])
+            if order_id is None:
+                if activities:
+                    yield order
+                continue
+            previous = self.seen.get(order_id)
+            if previous is None or activities > previous[0]:
+                self.seen[order_id] = (activities, moment)
+                if activities:
+                    yield order
+        self.working = working
+        self._prune()
+
+    def _prune(self) -> None:
+        """Forget orders that can no longer be returned by a fetch."""
+        if self.high_water is None:
+            return
+        cutoff = self.high_water - self.overlap * 2
+        stale = [
+            order_id
+            for order_id, (_, moment) in self.seen.items()
+            if moment is not None
+            and moment < cutoff
+            and order_id not in self.working
+        ]
+        for order_id in stale:
+            del self.seen[order_id]
+        working = self.working
+        self.applied = {
+            trade_id for trade_id in self.applied if trade_id[0] in working
+        }
+
+    def load(self) -> None:
+        """Restore cursor state from ``path`` if it exists."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (OSError, ValueError) as exc:
+            logging.error("Failed to load order cursor %s: %s", self.path, exc)
+            return
+        self.high_water = parse_time(state.get("high_water"))
+        self.seen = {
+            int(order_id): (count, parse_time(moment))
+            for order_id, (count, moment) in state.get("seen", {}).items()
+        }
+        self.working = {}
+        for order_id, entered in state.get("working", {}).items():
+            moment = parse_time(entered)
+            if moment is not None:
+                self.working[int(order_id)] = moment
+        self.applied = {
+            tuple(trade_id) for trade_id in state.get("applied", [])
+        }
+
+    def save(self) -> None:
+        """Write cursor state to ``path`` atomically."""
+        if not self.path:
+            return
+        state = {
+            "high_water": (
+                self.high_water.isoformat() if self.high_water else None
+            ),
+            "seen": {
+                str(order_id): [count, moment.isoformat() if moment else None]
+                for order_id, (count, moment) in self.seen.items()
+            },
+            "working": {
+                str(order_id): moment.isoformat()
+                for order_id, moment in self.working.items()
+            },
+            "applied": [list(trade_id) for trade_id in self.applied],
+        }
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.path)
+        except OSError as exc:
+            logging.error("Failed to save order cursor %s: %s", self.path, exc)
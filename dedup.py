@@ -0,0 +1,101 @@
+import hashlib
+import logging
+import time
+
+
+def trade_key(trade_id) -> int:
+    """Hash a ``(order_id, time, symbol)`` tuple to a signed 64-bit int.
+
+    Signed ints fit SQLite's ``INTEGER`` type directly.
+    """
+    raw = "\x1f".join("" if part is None else str(part) for part in trade_id)
+    digest = hashlib.blake2b(raw.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+class DedupIndex:
+    """Time-windowed set of trade IDs that have already been notified.
+
+    IDs are stored as 64-bit hashes with an expiry time of ``window_secs``
+    plus ``margin_secs`` after they were added. A fill can only be fetched
+    again while it is inside the fetch window, so expired entries are safe
+    to forget. Entries are kept in expiry order, which makes eviction a scan
+    from the front of the dict that stops at the first live entry.
+    """
+
+    def __init__(
+        self,
+        window_secs: float = 3600,
+        margin_secs: float = 600,
+        clock=time.time,
+    ):
+        self.ttl = window_secs + margin_secs
+        self.clock = clock
+        # hashed key -> expiry timestamp, in expiry order
+        self.entries: dict[int, float] = {}
+        # entries added since the last call to ``drain_pending``
+        self.pending: list[tuple[int, float]] = []
+        self.hits = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, trade_id) -> bool:
+        if trade_key(trade_id) in self.entries:
+            self.hits += 1
+            return True
+        return False
+
+    def add(self, trade_id) -> None:
+        """Record ``trade_id`` as sent, refreshing its expiry."""
+        key = trade_key(trade_id)
+        expires = self.clock() + self.ttl
+        self.entries.pop(key, None)
+        self.entries[key] = expires
+        self.pending.append((key, expires))
+
+    def expire(self, now: float | None = None) -> int:
+        """Drop entries whose expiry has passed and return how many."""
+        now = self.clock() if now is None else now
+        entries = self.entries
+        stale = []
+        for key, expires in entries.items():
+            if expires > now:
+                break
+            stale.append(key)
+        expired = len(stale)
+        if expired:
+            for key in stale:
+                del entries[key]
+            self.evictions += expired
+            logging.debug(
+                "Dedup index evicted %s entries, %s remain",
+                expired,
+                len(entries),
+            )
+        return expired
+
+    def load(self, rows) -> None:
+        """Restore ``(key, expiry)`` rows, skipping ones already expired.
+
+        Intended for startup, before any new IDs have been added.
+        """
+        now = self.clock()
+        for key, expires in sorted(rows, key=lambda row: row[1]):
+            if expires > now:
+                self.entries.pop(key, None)
+                self.entries[key] = expires
+
+    def drain_pending(self) -> list[tuple[int, float]]:
+        """Return and clear entries added since the last drain."""
+        pending, self.pending = self.pending, []
+        return pending
+
+    def stats(self) -> dict[str, int]:
+        """Return the current size and cumulative hit/eviction counts."""
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "evictions": self.evictions,
+        }
@@ -1,23 +1,285 @@
+import asyncio
 import os
 import logging
-import requests
+import time
 
+from http_session import HttpSession, get_session
+from lazy import lazy_import
+from metrics import (
+    DISCORD_QUEUE,
+    FILL_LAG_SECONDS,
+    SEND_FAILURES,
+    STAGE_SECONDS,
+)
 
-def send_message(content: str) -> None:
-    """Send ``content`` to a Discord channel using a bot token."""
+requests = lazy_import("requests")
+
+DISCORD_API_URL = "https://discord.com/api/v10"
+MAX_CONTENT_LENGTH = 2000
+MAX_EMBEDS = 10
+
+
+def send_message(content: str) -> bool:
+    """Send ``content`` to a Discord channel using a bot token.
+
+    Returns whether Discord accepted the message.
+    """
     token = os.getenv("DISCORD_BOT_TOKEN")
     channel_id = os.getenv("DISCORD_CHANNEL_ID")
 
     if not token or not channel_id:
         logging.error("DISCORD_BOT_TOKEN or DISCORD_CHANNEL_ID not set")
-        return
+        SEND_FAILURES.inc()
+        return False
 
-    url = f"https://discord.com/api/v10/channels/{channel_id}/messages"
+    url = f"{DISCORD_API_URL}/channels/{channel_id}/messages"
     headers = {"Authorization": f"Bot {token}"}
 
     try:
-        requests.post(
-            url, json={"content": content}, headers=headers, timeout=10
+        response = get_session().post(
+            url, json={"content": content}, headers=headers
         )
     except requests.RequestException as exc:  # pragma: no cover - logging only
         logging.error("Failed to send Discord message: %s", exc)
+        SEND_FAILURES.inc()
+        return False
+    if response.status_code >= 400:
+        logging.error(
+            "Discord rejected message: %s %s",
+            response.status_code,
+            response.text,
+        )
+        SEND_FAILURES.inc()
+        return False
+    return True
+
+
+def record_fill_lag(fill_times) -> None:
+    """Record the delay from each fill in ``fill_times`` until now.
+
+    ``fill_times`` are the epoch execution times of the fills a message
+    that was just delivered reports; ``None`` entries are skipped.
+    """
+    now = time.time()
+    lags = [max(0.0, now - when) for when in fill_times if when is not None]
+    FILL_LAG_SECONDS.observe_many(lags)
+
+
+def coalesce_messages(messages: list[str | dict]) -> list[dict]:
+    """Pack queued messages into as few Discord payloads as possible.
+
+    String messages are joined with newlines up to ``MAX_CONTENT_LENGTH``
+    characters and dict messages are treated as embeds, up to
+    ``MAX_EMBEDS`` per payload. Oversized strings are split.
+    """
+    return [payload for payload, _ in _coalesce(messages)]
+
+
+def _coalesce(messages: list[str | dict]) -> list[tuple[dict, int]]:
+    """Return :func:`coalesce_messages` payloads with a message count.
+
+    Each payload is paired with the number of messages that have been
+    delivered in full once it and every payload before it are posted.
+    """
+    payloads: list[tuple[dict, int]] = []
+    lines: list[str] = []
+    length = 0
+    embeds: list[dict] = []
+
+    def flush(complete: int) -> None:
+        nonlocal lines, length, embeds
+        if lines or embeds:
+            payload: dict = {}
+            if lines:
+                payload["content"] = "\n".join(lines)
+            if embeds:
+                payload["embeds"] = embeds
+            payloads.append((payload, complete))
+        lines, length, embeds = [], 0, []
+
+    for index, message in enumerate(messages):
+        if isinstance(message, dict):
+            if len(embeds) >= MAX_EMBEDS:
+                flush(index)
+            embeds.append(message)
+            continue
+        for start in range(0, max(len(message), 1), MAX_CONTENT_LENGTH):
+            chunk = message[start:start + MAX_CONTENT_LENGTH]
+            extra = len(chunk) + (1 if lines else 0)
+            if lines and length + extra > MAX_CONTENT_LENGTH:
+                flush(index)
+                extra = len(chunk)
+            lines.append(chunk)
+            length += extra
+    flush(len(messages))
+    return payloads
+
+
+class DiscordDispatcher:
+    """Deliver Discord messages from a bounded background queue.
+
+    Messages passed to :meth:`send` are queued and posted by :meth:`run`,
+    which coalesces whatever is waiting into as few requests as Discord
+    allows and reuses the shared pooled HTTP session from
+    :func:`http_session.get_session` unless ``session`` is given.
+    Rate-limit bucket headers are honoured before each post and 429
+    responses are retried after the advertised delay. The fill lag of each
+    message is recorded in :data:`metrics.FILL_LAG_SECONDS` once the
+    payload carrying it has been posted. Call :meth:`close` on shutdown to
+    flush the queue.
+    """
+
+    def __init__(
+        self,
+        token: str | None = None,
+        channel_id: str | None = None,
+        max_queue: int = 1000,
+        batch_delay: float = 0.25,
+        max_attempts: int = 5,
+        session: "HttpSession | requests.Session | None" = None,
+    ):
+        self.token = token or os.getenv("DISCORD_BOT_TOKEN")
+        self.channel_id = channel_id or os.getenv("DISCORD_CHANNEL_ID")
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.batch_delay = batch_delay
+        self.max_attempts = max_attempts
+        self.session = session or get_session()
+        # the shared session outlives the dispatcher
+        self._close_session = session is not None
+        # monotonic time before which the rate-limit bucket is exhausted
+        self.blocked_until = 0.0
+        self._task: asyncio.Task | None = None
+
+    async def send(self, message: str | dict, fill_times=()) -> None:
+        """Queue ``message`` for delivery, waiting if the queue is full.
+
+        ``fill_times`` are the execution times of the fills the message
+        reports, for :func:`record_fill_lag`.
+        """
+        await self.queue.put((message, fill_times))
+        DISCORD_QUEUE.set(self.queue.qsize())
+
+    async def run(self) -> None:
+        """Consume the queue forever, posting coalesced batches."""
+        self._task = asyncio.current_task()
+        while True:
+            batch = [await self.queue.get()]
+            if self.batch_delay:
+                await asyncio.sleep(self.batch_delay)
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            DISCORD_QUEUE.set(0)
+            try:
+                with STAGE_SECONDS.time(stage="deliver"):
+                    delivered = 0
+                    for payload, complete in _coalesce(
+                        [message for message, _ in batch]
+                    ):
+                        if await self._post(payload):
+                            for _, fill_times in batch[delivered:complete]:
+                                record_fill_lag(fill_times)
+                        delivered = complete
+            except Exception as exc:  # pragma: no cover - logging only
+                logging.error("Failed to send Discord message: %s", exc)
+                SEND_FAILURES.inc()
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _post(self, payload: dict) -> bool:
+        """Post one payload, respecting Discord's rate limits.
+
+        Returns whether Discord accepted it.
+        """
+        if not self.token or not self.channel_id:
+            logging.error("DISCORD_BOT_TOKEN or DISCORD_CHANNEL_ID not set")
+            SEND_FAILURES.inc()
+            return False
+        url = f"{DISCORD_API_URL}/channels/{self.channel_id}/messages"
+        headers = {"Authorization": f"Bot {self.token}"}
+        for _ in range(self.max_attempts):
+            wait = self.blocked_until - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                response = await asyncio.to_thread(
+                    self.session.post,
+                    url,
+                    json=payload,
+                    headers=headers,
+                )
+            except requests.RequestException as exc:
+                logging.error("Failed to send Discord message: %s", exc)
+                SEND_FAILURES.inc()
+                return False
+            self._update_bucket(response)
+            if response.status_code != 429:
+                if response.status_code >= 400:
+                    logging.error(
+                        "Discord rejected message: %s %s",
+                        response.status_code,
+                        response.text,
+                    )
+                    SEND_FAILURES.inc()
+                    return False
+                return True
+            retry_after = self._retry_after(response)
+            logging.warning(
+                "Discord rate limited, retrying in %.2fs", retry_after
+            )
+            self.blocked_until = time.monotonic() + retry_after
+        logging.error("Giving up on Discord message after rate limiting")
+        SEND_FAILURES.inc()
+        return False
+
+    def _update_bucket(self, response) -> None:
+        """Record when the current rate-limit bucket allows another post."""
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset_after = response.headers.get("X-RateLimit-Reset-After")
+        if remaining is None or reset_after is None:
+            return
+        try:
+            if int(remaining) <= 0:
+                self.blocked_until = time.monotonic() + float(reset_after)
+        except ValueError:
+            return
+
+    @staticmethod
+    def _retry_after(response) -> float:
+        """Return the delay requested by a 429 response in seconds."""
+        try:
+            return float(response.json()["retry_after"])
+        except (KeyError, TypeError, ValueError):
+            pass
+        try:
+            return float(response.headers.get("Retry-After", 1))
+        except ValueError:
+            return 1.0
+
+    async def flush(self, timeout: float = 10) -> None:
+        """Wait up to ``timeout`` seconds for queued messages to be sent."""
+        if self._task is None or self._task.done():
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logging.error(
+                "Dropped %s Discord messages on shutdown", self.queue.qsize()
+            )
+            SEND_FAILURES.inc(self.queue.qsize())
+
+    async def close(self, timeout: float = 10) -> None:
+        """Flush pending messages, stop the worker and close the session.
+
+        The shared session is left open for
+        :func:`http_session.close_session`.
+        """
+        await self.flush(timeout)
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._close_session:
+            self.session.close()
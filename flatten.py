@@ -1,5 +1,14 @@
 from __future__ import annotations
 
+from dataclasses import dataclass
+from functools import lru_cache
+from time import gmtime, strftime
+
+LEG_PLACEHOLDER = "{leg}"
+_LOOKUP_ERRORS = (KeyError, IndexError, TypeError)
+# distinct (mapping, factory) pairs whose compiled getters are kept
+_COMPILED_CACHE_SIZE = 32
+
 
 def extract_nested_value(obj, path, context: dict | None = None):
     """Safely navigate a nested structure using a list of keys/indexes."""
@@ -26,66 +35,211 @@ def extract_and_append(trade, mapping, leg_index):
     return flat
 
 
-def flatten_trade_with_mapping(trade, mapping):
+def _compile_path(path, leg_var: str) -> str:
+    """Return a Python expression that walks ``path`` from ``trade``."""
+    expr = "trade"
+    for key in path:
+        if isinstance(key, str) and key.startswith("{") and key.endswith("}"):
+            if key != LEG_PLACEHOLDER:
+                raise ValueError(f"Unsupported mapping placeholder {key!r}")
+            expr += f"[{leg_var}]"
+        else:
+            expr += f"[{key!r}]"
+    return expr
+
+
+def compile_mapping(mapping, factory=None):
+    """Return a getter ``(trade, leg_index) -> dict`` for ``mapping``.
+
+    The mapping is translated once into Python source with every path
+    unrolled into direct subscripts, so applying it performs no placeholder
+    checks or context allocation. With ``factory`` the getter returns
+    ``factory(*values)``, values in mapping order, without building a dict.
+    Getters are cached by the mapping's contents, so equal mappings share
+    one and a mapping changed after compiling gets a new one.
+    """
+    frozen = tuple((key, tuple(path)) for key, path in mapping.items())
+    return _compile_frozen(frozen, factory)
+
+
+@lru_cache(maxsize=_COMPILED_CACHE_SIZE)
+def _compile_frozen(mapping, factory):
+    lines = ["def getter(trade, leg):"]
+    names = []
+    for index, (key, path) in enumerate(mapping):
+        names.append(f"v{index}" if factory else f"{key!r}: v{index}")
+        lines += [
+            "    try:",
+            f"        v{index} = {_compile_path(path, 'leg')}",
+            "    except LOOKUP_ERRORS:",
+            f"        v{index} = None",
+        ]
+    if factory:
+        lines.append(f"    return factory({', '.join(names)})")
+    else:
+        lines.append(f"    return {{{', '.join(names)}}}")
+    namespace = {"LOOKUP_ERRORS": _LOOKUP_ERRORS, "factory": factory}
+    exec("\n".join(lines), namespace)
+    return namespace["getter"]
+
+
+def flatten_trade_with_mapping(trade, mapping, getter=None):
+    if getter is None:
+        getter = compile_mapping(mapping)
     legs = trade.get("orderLegCollection", [])
+    multi_leg = len(legs) > 1
     results = []
     for i in range(len(legs)):
-        flat = extract_and_append(trade, mapping, i)
-        flat["multi_leg"] = len(legs) > 1
+        flat = getter(trade, i)
+        flat["multi_leg"] = multi_leg
         results.append(flat)
     return results
 
 
+TRADE_MAPPING = {
+    "symbol": [
+        "orderLegCollection",
+        "{leg}",
+        "instrument",
+        "symbol",
+    ],
+    "underlying": [
+        "orderLegCollection",
+        "{leg}",
+        "instrument",
+        "underlyingSymbol",
+    ],
+    "instruction": ["orderLegCollection", "{leg}", "instruction"],
+    "qty": ["orderLegCollection", "{leg}", "quantity"],
+    "price": [
+        "orderActivityCollection",
+        0,
+        "executionLegs",
+        "{leg}",
+        "price",
+    ],
+    "expiration": [
+        "orderLegCollection",
+        "{leg}",
+        "instrument",
+        "maturityDate",
+    ],
+    "strike": [
+        "orderLegCollection",
+        "{leg}",
+        "instrument",
+        "strikePrice",
+    ],
+    "order_id": ["orderId"],
+    "time": [
+        "orderActivityCollection",
+        0,
+        "executionLegs",
+        "{leg}",
+        "time",
+    ],
+}
+
+
+def format_epoch(value: int | None) -> str | None:
+    """Return epoch seconds as a Schwab-style UTC timestamp."""
+    if value is None:
+        return None
+    return strftime("%Y-%m-%dT%H:%M:%S+0000", gmtime(value))
+
+
+@dataclass(slots=True)
+class Leg:
+    """One flattened order leg.
+
+    :func:`flatten_legs` fills the fields with the values found in the
+    order; :func:`normalize.normalize_leg` then converts them in place to
+    the annotated types: ``qty``, ``price`` and ``strike`` floats,
+    ``instruction`` a :class:`normalize.Instruction` and ``time`` the
+    execution time in epoch seconds. A slotted record takes a fraction of
+    the memory of the equivalent dict, which adds up when legs are held in
+    bulk.
+    """
+
+    # fields in ``TRADE_MAPPING`` order, as ``flatten_legs`` passes them
+    symbol: str | None = None
+    underlying: str | None = None
+    instruction: str | None = None
+    qty: float | None = None
+    price: float | None = None
+    expiration: str | None = None
+    strike: float | None = None
+    order_id: int | None = None
+    time: int | None = None
+    multi_leg: bool = False
+
+    @classmethod
+    def from_dict(cls, values: dict) -> Leg:
+        """Build a leg from a flattened dict; unknown keys are ignored."""
+        return cls(**{
+            name: values[name] for name in LEG_FIELDS if name in values
+        })
+
+    def as_dict(self) -> dict:
+        """Return the leg as a flattened dict for message templates.
+
+        ``time`` is formatted back to a timestamp and whole quantities are
+        given as ints, so placeholders render as they did from raw orders.
+        """
+        qty = self.qty
+        if qty is not None and qty.is_integer():
+            qty = int(qty)
+        return {
+            "symbol": self.symbol,
+            "underlying": self.underlying,
+            "instruction": self.instruction,
+            "qty": qty,
+            "price": self.price,
+            "expiration": self.expiration,
+            "strike": self.strike,
+            "order_id": self.order_id,
+            "time": format_epoch(self.time),
+            "multi_leg": self.multi_leg,
+        }
+
+
+LEG_FIELDS = tuple(Leg.__dataclass_fields__)
+
+# compiled once here so flattening each order skips the cache lookup
+_TRADE_GETTER = compile_mapping(TRADE_MAPPING)
+_LEG_GETTER = compile_mapping(TRADE_MAPPING, Leg)
+
+
 def flatten_data(trade):
-    mapping = {
-        "symbol": [
-            "orderLegCollection",
-            "{leg}",
-            "instrument",
-            "symbol",
-        ],
-        "underlying": [
-            "orderLegCollection",
-            "{leg}",
-            "instrument",
-            "underlyingSymbol",
-        ],
-        "instruction": ["orderLegCollection", "{leg}", "instruction"],
-        "qty": ["orderLegCollection", "{leg}", "quantity"],
-        "price": [
-            "orderActivityCollection",
-            0,
-            "executionLegs",
-            "{leg}",
-            "price",
-        ],
-        "expiration": [
-            "orderLegCollection",
-            "{leg}",
-            "instrument",
-            "maturityDate",
-        ],
-        "strike": [
-            "orderLegCollection",
-            "{leg}",
-            "instrument",
-            "strikePrice",
-        ],
-        "order_id": ["orderId"],
-        "time": [
-            "orderActivityCollection",
-            0,
-            "executionLegs",
-            "{leg}",
-            "time",
-        ],
-    }
-    return flatten_trade_with_mapping(trade, mapping)
+    return flatten_trade_with_mapping(trade, TRADE_MAPPING, _TRADE_GETTER)
+
+
+def flatten_legs(trade) -> list[Leg]:
+    """Flatten ``trade`` into :class:`Leg` records without building dicts."""
+    getter = _LEG_GETTER
+    count = len(trade.get("orderLegCollection", []))
+    legs = [getter(trade, i) for i in range(count)]
+    if count > 1:
+        for leg in legs:
+            leg.multi_leg = True
+    return legs
+
+
+def iter_flatten_dataset(json_data):
+    """Yield flattened legs one at a time as orders are consumed.
+
+    ``json_data`` may be any iterable of orders, such as the orders
+    :meth:`cursor.OrderCursor.iter_new` lets through.
+    """
+    for trade in json_data:
+        yield from flatten_data(trade)
 
 
 def flatten_dataset(json_data):
-    flat_trades_list = []
+    return list(iter_flatten_dataset(json_data))
+
+
+def iter_flatten_legs(json_data):
+    """Like :func:`iter_flatten_dataset` but yield :class:`Leg` records."""
     for trade in json_data:
-        flat_legs = flatten_data(trade)
-        flat_trades_list.extend(flat_legs)
-    return flat_trades_list
+        yield from flatten_legs(trade)
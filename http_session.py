@@ -0,0 +1,197 @@
+"""Process-wide pooled HTTP session shared by every outbound REST call.
+
+Reusing connections saves a TCP and TLS handshake per request, which is most
+of the latency of a Discord post. The session is configured from the
+environment the first time :func:`get_session` is called:
+
+``HTTP_POOL_SIZE``        connections kept per host, default ``10``
+``HTTP_TIMEOUT``          read timeout in seconds, default ``10``
+``HTTP_CONNECT_TIMEOUT``  connect timeout in seconds, default ``5``
+``HTTP_KEEPALIVE``        ``0`` closes connections after each request
+``HTTP2``                 ``1`` uses HTTP/2 through ``httpx`` when installed
+"""
+import logging
+import os
+import threading
+from urllib.parse import urlsplit
+
+from lazy import lazy_import
+from metrics import REGISTRY
+
+requests = lazy_import("requests")
+
+HTTP_CONNECTIONS = REGISTRY.gauge(
+    "tracker_http_pool_connections",
+    "Connections opened and currently idle in the shared HTTP pool",
+    labels=("host", "state"),
+)
+HTTP_REQUESTS = REGISTRY.gauge(
+    "tracker_http_pool_requests",
+    "Requests sent through the shared HTTP pool per host",
+    labels=("host",),
+)
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+class HttpSession:
+    """Pooled keep-alive session with default timeouts.
+
+    Uses ``requests`` with one urllib3 pool of up to ``pool_size``
+    connections per host. With ``http2`` the requests go through an
+    ``httpx`` client instead, which multiplexes them over one connection
+    per host; when ``httpx`` is missing HTTP/1.1 is used with a warning.
+    Transport errors are raised as ``requests.RequestException`` either way.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 10,
+        timeout: float = 10,
+        connect_timeout: float = 5,
+        keepalive: bool = True,
+        http2: bool = False,
+    ):
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, timeout)
+        self.keepalive = keepalive
+        self.http2 = False
+        self.client = None
+        if http2:
+            try:
+                import httpx
+            except ImportError:
+                logging.warning("HTTP2 requested but httpx is not installed")
+            else:
+                self.http2 = True
+                self.http2_errors = httpx.HTTPError
+                self.http2_requests: dict[str, int] = {}
+                limits = httpx.Limits(
+                    max_connections=pool_size,
+                    max_keepalive_connections=pool_size if keepalive else 0,
+                )
+                self.client = httpx.Client(
+                    http2=True,
+                    timeout=httpx.Timeout(timeout, connect=connect_timeout),
+                    limits=limits,
+                )
+        if self.client is None:
+            from requests.adapters import HTTPAdapter
+
+            self.adapter = HTTPAdapter(
+                pool_connections=pool_size, pool_maxsize=pool_size
+            )
+            self.client = requests.Session()
+            self.client.mount("https://", self.adapter)
+            self.client.mount("http://", self.adapter)
+            if not keepalive:
+                self.client.headers["Connection"] = "close"
+
+    @classmethod
+    def from_env(cls) -> "HttpSession":
+        return cls(
+            int(os.getenv("HTTP_POOL_SIZE", 10)),
+            float(os.getenv("HTTP_TIMEOUT", 10)),
+            float(os.getenv("HTTP_CONNECT_TIMEOUT", 5)),
+            _env_flag("HTTP_KEEPALIVE", "1"),
+            _env_flag("HTTP2", "0"),
+        )
+
+    def request(self, method: str, url: str, **kwargs):
+        """Send a request, applying the default timeout when none is given."""
+        if self.http2:
+            host = urlsplit(url).hostname or ""
+            self.http2_requests[host] = self.http2_requests.get(host, 0) + 1
+            try:
+                return self.client.request(method, url, **kwargs)
+            except self.http2_errors as exc:
+                raise requests.ConnectionError(str(exc)) from exc
+        kwargs.setdefault("timeout", self.timeout)
+        return self.client.request(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        """Return per-host connection and request counts for the pool.
+
+        ``opened`` counts pooled connections created, ``idle`` those
+        waiting for reuse and ``requests`` the requests sent; fewer
+        openings than requests means connections are being reused.
+        """
+        stats = {}
+        if self.http2:
+            for host, count in self.http2_requests.items():
+                stats[host] = {"opened": 0, "idle": 0, "requests": count}
+            # httpx exposes its pool only through private attributes
+            transport = getattr(self.client, "_transport", None)
+            pool = getattr(transport, "_pool", None)
+            for conn in getattr(pool, "connections", []):
+                try:
+                    host = conn._origin.host.decode()
+                    idle = conn.is_idle()
+                except AttributeError:
+                    continue
+                entry = stats.setdefault(
+                    host, {"opened": 0, "idle": 0, "requests": 0}
+                )
+                entry["opened"] += 1
+                entry["idle"] += int(idle)
+            return stats
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            idle = sum(1 for conn in list(pool.pool.queue) if conn is not None)
+            entry = stats.setdefault(
+                pool.host, {"opened": 0, "idle": 0, "requests": 0}
+            )
+            entry["opened"] += pool.num_connections
+            entry["idle"] += idle
+            entry["requests"] += pool.num_requests
+        return stats
+
+    def close(self) -> None:
+        self.client.close()
+
+
+_session: HttpSession | None = None
+_lock = threading.Lock()
+
+
+def get_session() -> HttpSession:
+    """Return the process-wide :class:`HttpSession`, creating it first."""
+    global _session
+    with _lock:
+        if _session is None:
+            _session = HttpSession.from_env()
+        return _session
+
+
+def close_session() -> None:
+    """Log pool usage and close the shared session if one was created."""
+    global _session
+    with _lock:
+        session, _session = _session, None
+    if session is not None:
+        logging.info("HTTP pool usage: %s", session.stats())
+        session.close()
+
+
+def _collect() -> None:
+    session = _session
+    if session is None:
+        return
+    for host, entry in session.stats().items():
+        HTTP_CONNECTIONS.set(entry["opened"], host=host, state="opened")
+        HTTP_CONNECTIONS.set(entry["idle"], host=host, state="idle")
+        HTTP_REQUESTS.set(entry["requests"], host=host)
+
+
+REGISTRY.add_collector(_collect)
@@ -0,0 +1,25 @@
+import importlib.util
+import sys
+
+
+def lazy_import(name: str):
+    """Return module ``name``, deferring its execution until first use.
+
+    The module is registered in ``sys.modules`` straight away, but its code
+    only runs when an attribute is first accessed, so startup and tools that
+    never touch it do not pay for importing it. Modules that are already
+    imported are returned as they are. Raises ``ImportError`` when the
+    module is not installed.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
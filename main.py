@@ -2,17 +2,63 @@ import asyncio
 import logging
 import os
 import signal
+import time
+from datetime import date
 
-from client import SchwabClient
+from accounts import Account, resolve_accounts
+from client import AsyncSchwabClient, SchwabClient
+from cursor import OrderCursor
+from dedup import DedupIndex
+from discord_client import DiscordDispatcher
+from http_session import close_session
+from marks import MarkTracker
+from metrics import (
+    TIME_TO_READY,
+    dump_metrics,
+    serve_metrics,
+    write_metrics,
+)
 from my_secrets import get_secret
-from poller import poll_schwab
-from tracker import PriceTracker
-from position_tracker import PositionTracker
+from messaging import validate_template
+from poller import DEFAULT_TEMPLATE, catch_up, poll_accounts
+from ratelimit import CircuitBreaker, TokenBucket
+from scheduler import (
+    AdaptiveScheduler,
+    MarketCalendar,
+    parse_clock,
+)
+from snapshot import (
+    read_snapshot,
+    restore_snapshot,
+    write_snapshot,
+)
+from state_store import StateStore
+from streamer import ActivityStream
 
 
 logging.basicConfig(level=logging.DEBUG,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
+# fallback start for time-to-ready where the OS does not report one
+STARTED = time.monotonic()
+
+
+def process_uptime() -> float | None:
+    """Return seconds since this process started, including imports.
+
+    Read from ``/proc``; ``None`` where that is unavailable.
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            # fields after the parenthesised command name, from the state
+            fields = f.read().rpartition(")")[2].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        # starttime, field 22, in clock ticks after boot
+        return uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
 
 def get_last_week_trades(
     client: SchwabClient, status: str = "FILLED", delta: int = 168
@@ -20,22 +66,210 @@ def get_last_week_trades(
     return client.get_account_positions(status, delta)
 
 
+def cursor_path(account: Account) -> str:
+    """Return the cursor file for ``account``."""
+    path = os.getenv("ORDER_CURSOR_FILE", "order_cursor.json")
+    if not account.name:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{account.name.lstrip('…')}{ext}"
+
+
+def build_accounts(
+    client: AsyncSchwabClient,
+    loop: asyncio.AbstractEventLoop,
+    interval: float,
+) -> list[Account]:
+    """Return the accounts to poll from ``SCHWAB_ACCOUNTS``.
+
+    Without ``SCHWAB_ACCOUNTS`` a single implicit account covering every
+    linked account is returned.
+    """
+    spec = os.getenv("SCHWAB_ACCOUNTS", "").strip()
+    if not spec:
+        return [Account(interval_secs=interval)]
+    hashes = loop.run_until_complete(client.get_account_hashes())
+    return resolve_accounts(spec, hashes, interval)
+
+
+def build_calendar() -> MarketCalendar:
+    """Return the market calendar configured by ``MARKET_*`` variables."""
+    holidays = os.getenv("MARKET_HOLIDAYS", "")
+    return MarketCalendar(
+        parse_clock(os.getenv("MARKET_OPEN", "09:30")),
+        parse_clock(os.getenv("MARKET_CLOSE", "16:00")),
+        os.getenv("MARKET_TZ", "America/New_York"),
+        holidays=[
+            date.fromisoformat(day.strip())
+            for day in holidays.split(",")
+            if day.strip()
+        ],
+    )
+
+
+def build_scheduler(
+    account: Account, calendar: MarketCalendar
+) -> AdaptiveScheduler | None:
+    """Return an adaptive scheduler for ``account`` unless disabled."""
+    if os.getenv("ADAPTIVE_POLLING", "1").lower() in ("0", "false", "no"):
+        return None
+    return AdaptiveScheduler(
+        base_interval=account.interval_secs,
+        min_interval=float(os.getenv("POLL_MIN_INTERVAL", 1)),
+        max_interval=float(os.getenv("POLL_MAX_INTERVAL", 60)),
+        closed_interval=float(os.getenv("POLL_CLOSED_INTERVAL", 300)),
+        calendar=calendar,
+    )
+
+
+def restore_state(
+    store: StateStore,
+    accounts: list[Account],
+    sent_trade_ids: DedupIndex,
+    snapshot_path: str | None,
+) -> None:
+    """Restore tracker state from the snapshot, or the store if stale.
+
+    The snapshot is only used when it was written after the store's last
+    flush, i.e. the process shut down cleanly since.
+    """
+    snapshot = read_snapshot(snapshot_path) if snapshot_path else None
+    if (
+        snapshot is not None
+        and snapshot.get("stamp") == store.last_flush()
+        and restore_snapshot(snapshot, accounts, sent_trade_ids)
+    ):
+        logging.info(
+            "Restored %s accounts and %s sent trades from %s",
+            len(accounts),
+            len(sent_trade_ids),
+            snapshot_path,
+        )
+        return
+    store.load(sent_trade_ids=sent_trade_ids)
+    for account in accounts:
+        store.load(
+            account.tracker, account.position_tracker, account=account.key
+        )
+
+
 def main():
+    template = os.getenv("MESSAGE_TEMPLATE", DEFAULT_TEMPLATE)
+    # fail before logging in when the template has a typo
+    validate_template(template)
     file_path = ".env"
     app_key = get_secret("SCHWAB_APP_KEY", file_path)
     app_secret = get_secret("SCHWAB_APP_SECRET", file_path)
-    client = SchwabClient(app_key, app_secret)
-    tracker = PriceTracker()
-    position_tracker = PositionTracker()
+    # every Schwab request, retries included, draws from one bucket
+    budget = TokenBucket.per_minute(
+        float(os.getenv("API_BUDGET_PER_MIN", 120))
+    )
+    breaker = CircuitBreaker(
+        int(os.getenv("BREAKER_FAILURES", 5)),
+        float(os.getenv("BREAKER_RESET", 30)),
+    )
+    client = AsyncSchwabClient(
+        SchwabClient(
+            app_key,
+            app_secret,
+            budget,
+            breaker,
+            os.getenv("SCHWAB_BASE_URL") or None,
+        ),
+        int(os.getenv("SCHWAB_MAX_WORKERS", 4)),
+    )
+    store = StateStore(os.getenv("STATE_DB", "tracker_state.db"))
+    sent_trade_ids = DedupIndex(
+        margin_secs=float(os.getenv("DEDUP_MARGIN", 600))
+    )
 
     interval = float(os.getenv("POLL_INTERVAL", 5))
     loop = asyncio.get_event_loop()
-    task = loop.create_task(
-        poll_schwab(client, interval, tracker, position_tracker)
+    accounts = build_accounts(client, loop, interval)
+    calendar = build_calendar()
+    mark_tracker = None
+    if os.getenv("MARK_TO_MARKET", "0").lower() in ("1", "true", "yes"):
+        mark_tracker = MarkTracker(
+            client,
+            float(os.getenv("QUOTE_TTL", 15)),
+            float(os.getenv("MARK_INTERVAL", 30)),
+        )
+    snapshot_path = os.getenv("SNAPSHOT_FILE", "tracker_snapshot.bin")
+    restore_state(store, accounts, sent_trade_ids, snapshot_path)
+    for account in accounts:
+        account.scheduler = build_scheduler(account, calendar)
+        account.cursor = OrderCursor(
+            cursor_path(account),
+            float(os.getenv("ORDER_CURSOR_OVERLAP", 60)),
+        )
+        account.cursor.load()
+        if mark_tracker is not None:
+            account.marks = mark_tracker.portfolio(
+                account.position_tracker, account.name
+            )
+
+    dispatcher = DiscordDispatcher(
+        max_queue=int(os.getenv("DISCORD_QUEUE_SIZE", 1000))
     )
+    loop.create_task(dispatcher.run())
+    metrics_server = None
+    metrics_port = os.getenv("METRICS_PORT")
+    if metrics_port:
+        metrics_server = loop.run_until_complete(
+            serve_metrics(
+                int(metrics_port), os.getenv("METRICS_HOST", "127.0.0.1")
+            )
+        )
+    metrics_file = os.getenv("METRICS_FILE")
+    if metrics_file:
+        loop.create_task(
+            dump_metrics(
+                metrics_file, float(os.getenv("METRICS_INTERVAL", 60))
+            )
+        )
+    background = []
+    if mark_tracker is not None:
+        background.append(loop.create_task(mark_tracker.run()))
+    stream = None
+    if os.getenv("STREAM_ACTIVITY", "0").lower() in ("1", "true", "yes"):
+        stream = ActivityStream(
+            client, float(os.getenv("STREAM_RECONCILE_INTERVAL", 300))
+        )
+        background.append(loop.create_task(stream.run()))
+    combine = os.getenv("COMBINE_NOTIFICATIONS", "0").lower() in (
+        "1", "true", "yes"
+    )
+
+    async def run() -> None:
+        # fetch what was missed while down before reporting ready
+        await catch_up(
+            client, accounts, template, sent_trade_ids, dispatcher, store,
+            combine,
+        )
+        ready = process_uptime()
+        if ready is None:
+            ready = time.monotonic() - STARTED
+        TIME_TO_READY.set(ready)
+        logging.info("Ready %.2fs after start", ready)
+        await poll_accounts(
+            client,
+            accounts,
+            template,
+            sent_trade_ids=sent_trade_ids,
+            dispatcher=dispatcher,
+            store=store,
+            combine=combine,
+            stream=stream,
+        )
+
+    task = loop.create_task(run())
+
+    def request_shutdown():
+        logging.info("Shutdown requested, flushing pending notifications")
+        task.cancel()
 
     for sig in (signal.SIGINT, signal.SIGTERM):
-        loop.add_signal_handler(sig, task.cancel)
+        loop.add_signal_handler(sig, request_shutdown)
 
     try:
         loop.run_until_complete(task)
@@ -45,6 +279,34 @@ def main():
     except asyncio.CancelledError:
         pass
     finally:
+        for background_task in background:
+            background_task.cancel()
+        loop.run_until_complete(
+            asyncio.gather(*background, return_exceptions=True)
+        )
+        loop.run_until_complete(dispatcher.close())
+        for account in accounts:
+            store.flush(
+                account.tracker,
+                account.position_tracker,
+                sent_trade_ids,
+                account.key,
+            )
+        if snapshot_path:
+            try:
+                size = write_snapshot(
+                    snapshot_path, accounts, sent_trade_ids, store.last_flush()
+                )
+                logging.info("Wrote %s byte snapshot", size)
+            except OSError as exc:
+                logging.error("Failed to write snapshot: %s", exc)
+        store.close()
+        client.close()
+        if metrics_server is not None:
+            metrics_server.close()
+        if metrics_file:
+            write_metrics(metrics_file)
+        close_session()
         logging.info("Polling stopped")
 
 
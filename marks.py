@@ -0,0 +1,224 @@
+"""Mark-to-market valuation of open positions from cached quotes.
+
+:class:`MarkTracker` refreshes quotes for every open contract in the
+background, in as few batched requests as possible, and keeps each
+account's :class:`Portfolio` up to date. The poller only reads cached marks,
+so quote requests never delay a fill notification.
+"""
+import asyncio
+import inspect
+import logging
+import time
+
+from metrics import EXPOSURE, UNREALIZED_PNL
+from position_tracker import PositionTracker
+from ratelimit import CircuitOpenError
+
+Key = tuple[str, str, float]
+
+
+def quote_mark(entry: dict) -> float | None:
+    """Return the mark from one quotes response entry.
+
+    Falls back to the bid/ask midpoint and then the last price when Schwab
+    does not send a mark.
+    """
+    quote = entry.get("quote") or entry
+    mark = quote.get("mark")
+    if mark is None:
+        bid, ask = quote.get("bidPrice"), quote.get("askPrice")
+        if bid is not None and ask is not None:
+            mark = (bid + ask) / 2
+        else:
+            mark = quote.get("lastPrice")
+    return float(mark) if mark is not None else None
+
+
+class QuoteCache:
+    """Last mark per symbol with the time it was fetched.
+
+    :meth:`mark` keeps returning a quote after it expires, since a stale
+    mark is a better estimate than none; :meth:`stale` lists the symbols
+    older than ``ttl`` seconds so they can be refreshed.
+    """
+
+    def __init__(self, ttl: float = 15, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self.quotes: dict[str, tuple[float, float]] = {}
+
+    def mark(self, symbol: str) -> float | None:
+        quote = self.quotes.get(symbol)
+        return quote[0] if quote is not None else None
+
+    def stale(self, symbols) -> list[str]:
+        cutoff = self.clock() - self.ttl
+        quotes = self.quotes
+        return [
+            symbol
+            for symbol in symbols
+            if symbol not in quotes or quotes[symbol][1] <= cutoff
+        ]
+
+    def store(self, marks: dict[str, float]) -> None:
+        now = self.clock()
+        for symbol, mark in marks.items():
+            self.quotes[symbol] = (mark, now)
+
+
+class Portfolio:
+    """Unrealized PnL and exposure of a :class:`PositionTracker`.
+
+    Each open contract's contribution is kept, so a fill or a new quote
+    only subtracts the contract's old contribution from the totals and adds
+    the new one. Contracts without a quote count at cost: no unrealized
+    PnL and exposure equal to their cost basis. Short positions have
+    negative exposure, and options count ``option_multiplier`` units per
+    contract.
+    """
+
+    def __init__(
+        self,
+        position_tracker: PositionTracker,
+        quotes: QuoteCache,
+        account: str = "",
+    ):
+        self.position_tracker = position_tracker
+        self.quotes = quotes
+        self.account = account
+        # key -> (unrealized, exposure)
+        self.values: dict[Key, tuple[float, float]] = {}
+        self.by_symbol: dict[str, set[Key]] = {}
+        self.unrealized = 0.0
+        self.exposure = 0.0
+
+    def update(
+        self,
+        symbol: str,
+        expiration: str | None = None,
+        strike: float | None = None,
+    ) -> tuple[float | None, float]:
+        """Revalue one contract and return its mark and unrealized PnL."""
+        return self._update(
+            PositionTracker._build_key(symbol, expiration, strike)
+        )
+
+    def _update(self, key: Key) -> tuple[float | None, float]:
+        old_unrealized, old_exposure = self.values.pop(key, (0.0, 0.0))
+        queue = self.position_tracker.positions.get(key)
+        mark = self.quotes.mark(key[0])
+        unrealized = exposure = 0.0
+        if queue is not None and abs(queue.qty) > queue.EPSILON:
+            multiplier = self.position_tracker.multiplier(key)
+            if mark is None:
+                exposure = queue.cost * multiplier
+            else:
+                exposure = queue.qty * mark * multiplier
+                unrealized = exposure - queue.cost * multiplier
+            self.values[key] = (unrealized, exposure)
+            self.by_symbol.setdefault(key[0], set()).add(key)
+        else:
+            keys = self.by_symbol.get(key[0])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.by_symbol[key[0]]
+        self.unrealized += unrealized - old_unrealized
+        self.exposure += exposure - old_exposure
+        return mark, unrealized
+
+    def sync(self) -> None:
+        """Revalue every contract, e.g. after state is restored."""
+        for key in list(self.position_tracker.positions):
+            self._update(key)
+
+    def apply_marks(self, symbols) -> None:
+        """Revalue the contracts of ``symbols`` after their quotes changed."""
+        for symbol in symbols:
+            for key in list(self.by_symbol.get(symbol, ())):
+                self._update(key)
+
+    def open_symbols(self) -> set[str]:
+        return set(self.by_symbol)
+
+    def publish(self) -> None:
+        UNREALIZED_PNL.set(self.unrealized, account=self.account)
+        EXPOSURE.set(self.exposure, account=self.account)
+
+
+class MarkTracker:
+    """Refresh quotes for every open contract in the background.
+
+    Every ``interval`` seconds the symbols open in any registered portfolio
+    whose quotes are older than ``ttl`` are requested in batches of
+    ``batch_size`` through ``client.get_quotes``, and the affected
+    portfolios are revalued.
+    """
+
+    def __init__(
+        self,
+        client,
+        ttl: float = 15,
+        interval: float | None = None,
+        batch_size: int = 100,
+    ):
+        self.client = client
+        self.quotes = QuoteCache(ttl)
+        self.interval = ttl if interval is None else interval
+        self.batch_size = batch_size
+        self.portfolios: list[Portfolio] = []
+
+    def portfolio(
+        self, position_tracker: PositionTracker, account: str = ""
+    ) -> Portfolio:
+        """Return a registered :class:`Portfolio` for ``position_tracker``."""
+        portfolio = Portfolio(position_tracker, self.quotes, account)
+        portfolio.sync()
+        self.portfolios.append(portfolio)
+        return portfolio
+
+    async def _get_quotes(self, symbols: list[str]) -> dict:
+        func = self.client.get_quotes
+        if inspect.iscoroutinefunction(func):
+            return await func(symbols)
+        return await asyncio.to_thread(func, symbols)
+
+    async def refresh(self) -> int:
+        """Fetch stale quotes for open contracts; return how many changed."""
+        symbols = set()
+        for portfolio in self.portfolios:
+            symbols |= portfolio.open_symbols()
+        stale = sorted(self.quotes.stale(symbols))
+        updated: dict[str, float] = {}
+        for start in range(0, len(stale), self.batch_size):
+            batch = stale[start:start + self.batch_size]
+            response = await self._get_quotes(batch) or {}
+            for symbol, entry in response.items():
+                if not isinstance(entry, dict):
+                    continue
+                mark = quote_mark(entry)
+                if mark is not None:
+                    updated[symbol] = mark
+        self.quotes.store(updated)
+        for portfolio in self.portfolios:
+            if updated:
+                portfolio.apply_marks(updated)
+            portfolio.publish()
+            logging.info(
+                "Portfolio %s unrealized %.2f exposure %.2f",
+                portfolio.account or "all",
+                portfolio.unrealized,
+                portfolio.exposure,
+            )
+        return len(updated)
+
+    async def run(self) -> None:
+        """Refresh quotes every ``interval`` seconds until cancelled."""
+        while True:
+            try:
+                await self.refresh()
+            except CircuitOpenError as exc:
+                logging.warning("Skipping quote refresh: %s", exc)
+            except Exception as exc:  # pragma: no cover - logging only
+                logging.error("Quote refresh error: %s", exc)
+            await asyncio.sleep(self.interval)
@@ -1,11 +1,120 @@
 from collections import defaultdict
+from string import Formatter
 
+from flatten import TRADE_MAPPING, Leg
 
-def format_trade(template: str, **values) -> str:
-    """Fill ``template`` with values from ``values``.
+# Values the poller adds to each flattened trade before formatting
+COMPUTED_FIELDS = (
+    "ticker", "pct_change", "open_qty", "pnl", "account", "fills", "mark",
+    "unrealized", "spread_pnl", "day_realized", "week_realized",
+    *(
+        f"{group}_{total}"
+        for group in ("underlying", "expiration", "account")
+        for total in (
+            "long_shares", "short_shares", "long_contracts",
+            "short_contracts", "realized",
+        )
+    ),
+)
+KNOWN_FIELDS = frozenset((*TRADE_MAPPING, "multi_leg", *COMPUTED_FIELDS))
 
-    Missing keys are replaced with an empty string rather than raising
-    ``KeyError``.
+_MISSING = object()
+_CONVERSIONS = {None: "", "s": "str", "r": "repr", "a": "ascii"}
+# template string -> compiled renderer
+_COMPILED_TEMPLATES: dict[str, "CompiledTemplate"] = {}
+
+
+class CompiledTemplate:
+    """A message template parsed once into a rendering function.
+
+    Rendering looks each placeholder up in a mapping and formats it with the
+    placeholder's conversion and format spec. Missing keys render as an empty
+    string without applying the format spec, so ``{pnl:.2f}`` with no
+    ``pnl`` gives ``""`` rather than an error. Templates using positional,
+    attribute or index fields, or nested format specs, fall back to
+    ``str.format_map``.
+    """
+
+    __slots__ = ("template", "fields", "render")
+
+    def __init__(self, template: str):
+        self.template = template
+        parsed = list(Formatter().parse(template))
+        self.fields = frozenset(
+            field for _, field, _, _ in parsed if field is not None
+        )
+        if all(
+            field is None
+            or (field.isidentifier() and "{" not in (spec or ""))
+            for _, field, spec, _ in parsed
+        ):
+            self.render = self._compile(parsed)
+        else:
+            self.render = self._format_map
+
+    def _format_map(self, values) -> str:
+        return self.template.format_map(defaultdict(str, values))
+
+    @staticmethod
+    def _compile(parsed):
+        lines = ["def render(values):", "    get = values.get"]
+        pieces = []
+        for index, (literal, field, spec, conversion) in enumerate(parsed):
+            if literal:
+                pieces.append(repr(literal))
+            if field is None:
+                continue
+            lines.append(f"    v{index} = get({field!r}, MISSING)")
+            value = f"v{index}"
+            if _CONVERSIONS[conversion]:
+                value = f"{_CONVERSIONS[conversion]}({value})"
+            pieces.append(
+                f"('' if v{index} is MISSING else format({value}, {spec!r}))"
+            )
+        lines.append(f"    return ''.join([{', '.join(pieces)}])")
+        namespace = {"MISSING": _MISSING}
+        exec("\n".join(lines), namespace)
+        return namespace["render"]
+
+    def unknown_fields(self, known=KNOWN_FIELDS) -> set[str]:
+        """Return placeholders that are not in ``known``."""
+        return {
+            field
+            for field in self.fields
+            if field.split(".", 1)[0].split("[", 1)[0] not in known
+        }
+
+
+def compile_template(template: str) -> CompiledTemplate:
+    """Return the cached :class:`CompiledTemplate` for ``template``."""
+    compiled = _COMPILED_TEMPLATES.get(template)
+    if compiled is None:
+        compiled = _COMPILED_TEMPLATES[template] = CompiledTemplate(template)
+    return compiled
+
+
+def validate_template(template: str, known=KNOWN_FIELDS) -> CompiledTemplate:
+    """Compile ``template`` and check its placeholders against ``known``.
+
+    Raises ``ValueError`` for malformed templates or unknown placeholders,
+    so a typo is reported at startup instead of as blank messages.
+    """
+    compiled = compile_template(template)
+    unknown = compiled.unknown_fields(known)
+    if unknown:
+        raise ValueError(
+            "Unknown template placeholders: "
+            + ", ".join(sorted(unknown))
+        )
+    return compiled
+
+
+def format_trade(template: str, trade: Leg | None = None, **values) -> str:
+    """Fill ``template`` with the fields of ``trade`` and ``values``.
+
+    ``values`` take precedence over the fields of ``trade``. Missing keys
+    are replaced with an empty string rather than raising ``KeyError``.
     """
-    mapping = defaultdict(str, values)
-    return template.format_map(mapping)
+    if trade is not None:
+        values = {**trade.as_dict(), **values}
+    return compile_template(template).render(values)
@@ -0,0 +1,371 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds in seconds shared by every latency histogram
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1, 2.5, 5, 10, 30, 60, 300,
+)
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra=()) -> str:
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    inner = ",".join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"'),
+        )
+        for name, value in pairs
+    )
+    return "{" + inner + "}"
+
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if not labels:
+            return ()
+        return tuple([labels.get(name, "") for name in self.label_names])
+
+    def samples(self):  # pragma: no cover - overridden
+        return []
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for suffix, key, extra, value in self.samples():
+            labels = _format_labels(self.label_names, key, extra)
+            lines.append(
+                f"{self.name}{suffix}{labels} {_format_value(value)}"
+            )
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        return [("_total", key, (), value) for key, value in items]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, such as a queue depth."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self.values: dict[tuple, float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def value(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        return [("", key, (), value) for key, value in items]
+
+
+class Histogram(_Metric):
+    """Distribution of observations in cumulative ``buckets``.
+
+    Observing is a bisect and three additions under a lock, cheap enough to
+    call for every trade leg.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets=DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [per-bucket counts (last is +Inf), sum, count]
+        self.series: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        self.observe_many((value,), **labels)
+
+    def observe_many(self, values, **labels) -> None:
+        """Record every value in ``values`` under one lock acquisition."""
+        if not values:
+            return
+        key = self._key(labels)
+        buckets = self.buckets
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+            counts = series[0]
+            for value in values:
+                counts[bisect_left(buckets, value)] += 1
+                series[1] += value
+            series[2] += len(values)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time spent inside the ``with`` block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        series = self.series.get(self._key(labels))
+        return series[2] if series else 0
+
+    def sum(self, **labels) -> float:
+        series = self.series.get(self._key(labels))
+        return series[1] if series else 0.0
+
+    def samples(self):
+        with self.lock:
+            items = sorted(
+                (key, (list(counts), total, count))
+                for key, (counts, total, count) in self.series.items()
+            )
+        samples = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket in zip((*self.buckets, float("inf")), counts):
+                cumulative += bucket
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                samples.append(("_bucket", key, (("le", le),), cumulative))
+            samples.append(("_sum", key, (), total))
+            samples.append(("_count", key, (), count))
+        return samples
+
+
+class Registry:
+    """Collection of metrics rendered together in Prometheus text format."""
+
+    def __init__(self):
+        self.metrics: dict[str, _Metric] = {}
+        # callables that refresh gauges just before rendering
+        self.collectors: list = []
+
+    def add_collector(self, collector) -> None:
+        """Call ``collector()`` before each :meth:`render`."""
+        self.collectors.append(collector)
+
+    def _get(self, cls, name: str, help: str, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, help, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"{name} is already registered as {metric.kind}")
+        return metric
+
+    def counter(self, name: str, help: str, labels=()) -> Counter:
+        return self._get(Counter, name, help, labels=labels)
+
+    def gauge(self, name: str, help: str, labels=()) -> Gauge:
+        return self._get(Gauge, name, help, labels=labels)
+
+    def histogram(
+        self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._get(
+            Histogram, name, help, labels=labels, buckets=buckets
+        )
+
+    def render(self) -> str:
+        """Return every metric in the Prometheus text exposition format."""
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception as exc:  # pragma: no cover - logging only
+                logging.error("Metrics collector failed: %s", exc)
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "tracker_stage_seconds",
+    "Time spent in each pipeline stage per call",
+    labels=("stage",),
+)
+TRADES = REGISTRY.counter(
+    "tracker_trades",
+    "Trade legs processed",
+    labels=("account",),
+)
+NOTIFICATIONS = REGISTRY.counter(
+    "tracker_notifications",
+    "Trade notifications handed to Discord",
+    labels=("account",),
+)
+QUARANTINED_LEGS = REGISTRY.counter(
+    "tracker_quarantined_legs",
+    "Trade legs rejected by normalization, by malformed field",
+    labels=("field",),
+)
+DEDUP_HITS = REGISTRY.counter(
+    "tracker_dedup_hits",
+    "Trade legs skipped because they were already notified",
+)
+RETRIES = REGISTRY.counter(
+    "tracker_request_retries",
+    "Schwab requests retried after an error",
+)
+RATE_LIMITED = REGISTRY.counter(
+    "tracker_rate_limited",
+    "Schwab responses with status 429",
+)
+CIRCUIT_OPEN = REGISTRY.gauge(
+    "tracker_circuit_open",
+    "1 while the Schwab circuit breaker is rejecting requests",
+)
+SEND_FAILURES = REGISTRY.counter(
+    "tracker_send_failures",
+    "Discord messages that could not be delivered",
+)
+FILL_LAG_SECONDS = REGISTRY.histogram(
+    "tracker_fill_lag_seconds",
+    "Delay from a fill's execution time to its notification",
+    buckets=(0.5, 1, 2, 5, 10, 15, 30, 60, 120, 300, 900, 3600),
+)
+POLL_INTERVAL = REGISTRY.gauge(
+    "tracker_poll_interval_seconds",
+    "Delay before the next poll of each account",
+    labels=("account",),
+)
+DISCORD_QUEUE = REGISTRY.gauge(
+    "tracker_discord_queue_depth",
+    "Messages waiting in the Discord queue",
+)
+UNREALIZED_PNL = REGISTRY.gauge(
+    "tracker_unrealized_pnl",
+    "Unrealized PnL of open positions at the cached marks",
+    labels=("account",),
+)
+EXPOSURE = REGISTRY.gauge(
+    "tracker_exposure",
+    "Market value of open positions, at cost where no quote is cached",
+    labels=("account",),
+)
+TIME_TO_READY = REGISTRY.gauge(
+    "tracker_time_to_ready_seconds",
+    "Seconds from process start until state was restored and caught up",
+)
+STREAM_CONNECTED = REGISTRY.gauge(
+    "tracker_stream_connected",
+    "1 while subscribed to the Schwab account activity stream",
+)
+STREAM_EVENTS = REGISTRY.counter(
+    "tracker_stream_events",
+    "Account activity messages received from the Schwab stream",
+    labels=("type",),
+)
+
+
+async def _handle_request(reader, writer, registry: Registry) -> None:
+    try:
+        request = await reader.readline()
+        # drain the headers; the path is ignored
+        while (await reader.readline()).strip():
+            pass
+        if request.split(b" ")[0] not in (b"GET", b"HEAD"):
+            status, body = "405 Method Not Allowed", b""
+        else:
+            status, body = "200 OK", registry.render().encode()
+        writer.write(
+            (
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n"
+            ).encode()
+            + (body if request.startswith(b"GET") else b"")
+        )
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_metrics(
+    port: int, host: str = "127.0.0.1", registry: Registry = REGISTRY
+) -> asyncio.AbstractServer:
+    """Serve ``registry`` over HTTP on ``host:port`` for Prometheus scrapes."""
+    server = await asyncio.start_server(
+        lambda reader, writer: _handle_request(reader, writer, registry),
+        host,
+        port,
+    )
+    logging.info("Serving metrics on %s:%s", host, port)
+    return server
+
+
+def write_metrics(path: str, registry: Registry = REGISTRY) -> None:
+    """Atomically write ``registry`` to ``path`` in the text format."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as fh:
+        fh.write(registry.render())
+    os.replace(tmp, path)
+
+
+async def dump_metrics(
+    path: str, interval_secs: float = 60, registry: Registry = REGISTRY
+) -> None:
+    """Rewrite ``path`` with the current metrics every ``interval_secs``."""
+    while True:
+        await asyncio.sleep(interval_secs)
+        try:
+            await asyncio.to_thread(write_metrics, path, registry)
+        except OSError as exc:  # pragma: no cover - logging only
+            logging.error("Failed to write metrics: %s", exc)
@@ -1,12 +1,15 @@
 import logging
 import os
-from dotenv import load_dotenv
+
+from lazy import lazy_import
+
+dotenv = lazy_import("dotenv")
 
 
 def get_secret(key: str, path: str = "./"):
     """Load a single secret from the given dotenv path."""
     try:
-        load_dotenv(path)
+        dotenv.load_dotenv(path)
         value = os.getenv(key)
         if value is None:
             raise Exception("Key not found / is None")
@@ -0,0 +1,199 @@
+"""Convert flattened legs to their final types once, at ingestion.
+
+:func:`normalize_legs` sits between :func:`flatten.iter_flatten_legs` and
+the trackers. Each filled leg is converted in place by
+:func:`normalize_leg`: numbers become finite floats, the instruction an
+:class:`Instruction`, the execution time epoch seconds, and symbols and
+expirations are interned so the many legs and keys of one contract share a
+single string. Everything downstream uses the fields as they are. Legs
+with a value that cannot be converted are set aside in a
+:class:`Quarantine` and counted in
+:data:`metrics.QUARANTINED_LEGS` instead of failing the poll.
+"""
+import logging
+import math
+import sys
+from collections import deque
+from enum import StrEnum
+from functools import lru_cache
+
+from cursor import parse_time
+from flatten import Leg
+from metrics import QUARANTINED_LEGS
+
+
+class Instruction(StrEnum):
+    """Order leg instructions sent by Schwab."""
+
+    BUY = "BUY"
+    SELL = "SELL"
+    BUY_TO_OPEN = "BUY_TO_OPEN"
+    BUY_TO_CLOSE = "BUY_TO_CLOSE"
+    SELL_TO_OPEN = "SELL_TO_OPEN"
+    SELL_TO_CLOSE = "SELL_TO_CLOSE"
+    SELL_SHORT = "SELL_SHORT"
+    BUY_TO_COVER = "BUY_TO_COVER"
+    SELL_SHORT_EXEMPT = "SELL_SHORT_EXEMPT"
+    EXCHANGE = "EXCHANGE"
+
+
+_INSTRUCTIONS = {member.value: member for member in Instruction}
+
+
+def parse_instruction(value) -> Instruction | None:
+    """Return the :class:`Instruction` for ``value``, ignoring case."""
+    if not isinstance(value, str):
+        return None
+    instruction = _INSTRUCTIONS.get(value)
+    if instruction is None:
+        instruction = _INSTRUCTIONS.get(value.strip().upper())
+    return instruction
+
+
+_NUMBER_ERRORS = (TypeError, ValueError, OverflowError)
+
+
+def _number(value) -> float:
+    """Return ``value`` as a finite float; raise ``ValueError`` if not."""
+    if value.__class__ is not float:
+        if isinstance(value, bool):
+            raise ValueError("boolean is not a number")
+        value = float(value)
+    if not math.isfinite(value):
+        raise ValueError("number is not finite")
+    return value
+
+
+@lru_cache(maxsize=4096)
+def _parse_epoch(value: str) -> int | None:
+    moment = parse_time(value)
+    return int(moment.timestamp()) if moment is not None else None
+
+
+def _epoch(value) -> int:
+    """Return ``value`` as epoch seconds; raise ``ValueError`` if invalid."""
+    if isinstance(value, str):
+        epoch = _parse_epoch(value)
+        if epoch is None:
+            raise ValueError("invalid timestamp")
+        return epoch
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    return int(_number(value))
+
+
+def normalize_leg(leg: Leg) -> str | None:
+    """Convert the fields of ``leg`` to their final types in place.
+
+    Returns ``None`` on success or the name of the first malformed field,
+    in which case ``leg`` may be partly converted. ``symbol`` and ``price``
+    are required; the other fields may be missing but, when present, must
+    be valid. Quantities must be positive and prices not negative.
+    Normalizing a leg twice leaves it unchanged.
+    """
+    # every leg passes through here, so values that already have their
+    # final type skip the conversion calls
+    intern = sys.intern
+    isfinite = math.isfinite
+    symbol = leg.symbol
+    if not isinstance(symbol, str) or not symbol:
+        return "symbol"
+    leg.symbol = intern(symbol)
+    price = leg.price
+    if price.__class__ is not float or not isfinite(price):
+        try:
+            price = leg.price = _number(price)
+        except _NUMBER_ERRORS:
+            return "price"
+    if price < 0:
+        return "price"
+    qty = leg.qty
+    if qty is not None:
+        if qty.__class__ is not float or not isfinite(qty):
+            try:
+                qty = leg.qty = _number(qty)
+            except _NUMBER_ERRORS:
+                return "qty"
+        if qty <= 0:
+            return "qty"
+    instruction = leg.instruction
+    if instruction is not None:
+        try:
+            member = _INSTRUCTIONS.get(instruction)
+        except TypeError:
+            member = None
+        if member is None:
+            member = parse_instruction(instruction)
+            if member is None:
+                return "instruction"
+        leg.instruction = member
+    strike = leg.strike
+    if strike is not None and (
+        strike.__class__ is not float or not isfinite(strike)
+    ):
+        try:
+            leg.strike = _number(strike)
+        except _NUMBER_ERRORS:
+            return "strike"
+    underlying = leg.underlying
+    if underlying is not None:
+        if not isinstance(underlying, str):
+            return "underlying"
+        leg.underlying = intern(underlying)
+    expiration = leg.expiration
+    if expiration is not None:
+        if not isinstance(expiration, str):
+            return "expiration"
+        leg.expiration = intern(expiration)
+    moment = leg.time
+    if moment is not None and moment.__class__ is not int:
+        try:
+            leg.time = _epoch(moment)
+        except _NUMBER_ERRORS:
+            return "time"
+    return None
+
+
+class Quarantine:
+    """The most recent ``maxlen`` malformed legs and a count per field."""
+
+    def __init__(self, maxlen: int = 100):
+        # (field, leg) in arrival order
+        self.legs: deque[tuple[str, Leg]] = deque(maxlen=maxlen)
+        self.counts: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return sum(self.counts.values())
+
+    def add(self, leg: Leg, field: str) -> None:
+        self.legs.append((field, leg))
+        self.counts[field] = self.counts.get(field, 0) + 1
+        QUARANTINED_LEGS.inc(field=field)
+        logging.warning(
+            "Quarantined leg of order %s with malformed %s: %r",
+            leg.order_id,
+            field,
+            getattr(leg, field, None),
+        )
+
+
+# quarantine used when none is passed to :func:`normalize_legs`
+QUARANTINE = Quarantine()
+
+
+def normalize_legs(legs, quarantine: Quarantine | None = None):
+    """Yield the filled legs of ``legs`` normalized by :func:`normalize_leg`.
+
+    Legs without a price have not been filled and are skipped. Malformed
+    legs go to ``quarantine``, by default :data:`QUARANTINE`.
+    """
+    if quarantine is None:
+        quarantine = QUARANTINE
+    for leg in legs:
+        if leg.price is None:
+            continue
+        field = normalize_leg(leg)
+        if field is None:
+            yield leg
+        else:
+            quarantine.add(leg, field)
@@ -1,96 +1,595 @@
 import asyncio
+import inspect
 import logging
+import time
 
-from client import SchwabClient
-from flatten import flatten_dataset
+from accounts import Account
+from aggregates import AggregateIndex
+from client import AsyncSchwabClient, SchwabClient
+from cursor import OrderCursor
+from dedup import DedupIndex
+from flatten import Leg, iter_flatten_legs
+from marks import Portfolio
+from normalize import normalize_legs
 from tracker import PriceTracker
 from position_tracker import PositionTracker
-from discord_client import send_message
-from messaging import format_trade
+from ratelimit import CircuitOpenError
+from state_store import StateStore
+from discord_client import DiscordDispatcher, record_fill_lag, send_message
+from messaging import compile_template, validate_template
+from metrics import (
+    DEDUP_HITS,
+    NOTIFICATIONS,
+    POLL_INTERVAL,
+    STAGE_SECONDS,
+    TRADES,
+)
 
+DEFAULT_TEMPLATE = "Contract {ticker} change {pct_change:.2f}%"
 
-async def poll_schwab(
-    client: SchwabClient,
-    interval_secs: float = 5,
-    tracker: PriceTracker | None = None,
-    position_tracker: PositionTracker | None = None,
-    template: str = "Contract {ticker} change {pct_change:.2f}%",
-    sent_trade_ids: set[
-        tuple[int | None, str | None, str | None]
-    ] | None = None,
-) -> None:
-    """Continuously poll ``client`` for account positions.
 
-    Each fetched trade is flattened, fed into ``tracker`` and
-    ``position_tracker`` to compute open quantity and realized PnL. The percent
-    change from the previous price is logged. Trades are only sent to Discord
-    once per process based on their order ID and timestamp.
+async def call_client(
+    client: SchwabClient | AsyncSchwabClient, method: str, **kwargs
+):
+    """Call ``client.<method>`` without blocking the event loop.
+
+    Async clients are awaited directly; synchronous clients are run in the
+    default executor so their HTTP calls and retry sleeps happen off-loop.
+    """
+    func = getattr(client, method)
+    if inspect.iscoroutinefunction(func):
+        return await func(**kwargs)
+    return await asyncio.to_thread(func, **kwargs)
+
+
+async def fetch_orders(client: SchwabClient | AsyncSchwabClient, **kwargs):
+    """Fetch orders from ``client`` without blocking the event loop."""
+    return await call_client(client, "get_account_positions", **kwargs)
+
+
+def combine_legs(legs: list[dict]) -> dict:
+    """Merge one contract's new leg values into one for notification.
+
+    ``qty`` is the total quantity, ``price`` the quantity-weighted average,
+    ``time`` the last fill and ``fills`` the number of legs merged. When the
+    legs disagree on ``instruction`` or ``order_id`` the value is
+    ``"MIXED"``.
+    """
+    combined = dict(legs[-1])
+    total_qty = 0.0
+    notional = 0.0
+    for leg in legs:
+        qty = float(leg.get("qty") or 0)
+        total_qty += qty
+        notional += qty * float(leg["price"])
+    if total_qty:
+        combined["qty"] = total_qty
+        combined["price"] = notional / total_qty
+    for field in ("instruction", "order_id"):
+        if len({leg.get(field) for leg in legs}) > 1:
+            combined[field] = "MIXED"
+    combined["fills"] = len(legs)
+    return combined
+
+
+# template fields filled from each group's quantities and realized PnL
+_GROUP_FIELDS = {
+    group: tuple(
+        f"{group}_{total}"
+        for total in (
+            "long_shares", "short_shares", "long_contracts",
+            "short_contracts", "realized",
+        )
+    )
+    for group in ("account", "underlying", "expiration")
+}
+
+
+def _group_values(values: dict, group: str, total) -> None:
+    values.update(
+        zip(_GROUP_FIELDS[group], (*total.quantities, total.realized))
+    )
+
+
+def aggregate_values(
+    aggregates: AggregateIndex,
+    underlying: str | None = None,
+    expiration: str | None = None,
+    when: float | None = None,
+) -> dict:
+    """Return the aggregate template values for one contract's fills.
+
+    ``underlying_*`` and ``expiration_*`` cover every contract on the same
+    underlying or expiration, ``account_*`` the whole account, and
+    ``day_realized`` and ``week_realized`` the UTC day and week of
+    ``when``. Each group has its gross long and short quantities, shares
+    and option contracts apart, and its realized PnL. Groups that are not
+    given are left out.
+    """
+    values = {}
+    _group_values(values, "account", aggregates.total)
+    if underlying is not None:
+        _group_values(
+            values, "underlying", aggregates.underlying_total(underlying)
+        )
+    if expiration is not None:
+        _group_values(
+            values, "expiration", aggregates.expiration_total(expiration)
+        )
+    if when is not None:
+        values["day_realized"] = aggregates.day_total(when).realized
+        values["week_realized"] = aggregates.week_total(when).realized
+    return values
+
+
+async def process_orders(
+    orders,
+    tracker: PriceTracker,
+    position_tracker: PositionTracker,
+    template: str,
+    sent_trade_ids,
+    dispatcher: DiscordDispatcher | None = None,
+    account: str = "",
+    combine: bool = False,
+    marks: Portfolio | None = None,
+    cursor: OrderCursor | None = None,
+) -> int:
+    """Flatten ``orders`` and run each contract's legs through tracking.
+
+    Orders are flattened into :class:`flatten.Leg` records and normalized
+    once by :func:`normalize.normalize_legs`, which drops unfilled legs and
+    quarantines malformed ones; only legs that are notified are expanded
+    into a dict of template values. Positions are updated first, in fill
+    order, from the legs not already in ``sent_trade_ids``, with the legs
+    of each multi-leg order applied together by
+    :meth:`PositionTracker.add_spread`, whose return fills the
+    ``spread_pnl`` placeholder. The legs are then grouped by contract: each
+    contract's prices are tracked in one pass, and its open quantity, PnL
+    and the totals from :func:`aggregate_values` are looked up once and
+    shared by all of its messages.
+    With ``combine`` a contract's new legs are sent as one notification
+    built by :func:`combine_legs` instead of one per leg. With ``marks``
+    each contract is revalued at its cached quote, which fills the
+    ``mark`` and ``unrealized`` placeholders once a quote has been cached;
+    no quote is fetched here. With ``cursor``, legs in its ``applied`` set
+    are skipped as well and new legs are added to it, so fills of working
+    orders are not applied again once ``sent_trade_ids`` forgets them.
+
+    Returns the number of new legs, i.e. legs not already in
+    ``sent_trade_ids``. The time spent flattening (including
+    normalization),
+    tracking, formatting and notifying is added up over the batch and
+    recorded once per stage in :data:`metrics.STAGE_SECONDS`; counters are
+    likewise updated once per batch to keep the per-leg cost low.
+    """
+    render = compile_template(template).render
+    perf = time.perf_counter
+    start = perf()
+    # (symbol, expiration, strike) -> legs in fill order
+    contracts: dict[tuple, list[Leg]] = {}
+    # legs that change positions in fill order, with the legs of each
+    # multi-leg order in one list to be applied as a unit
+    fills: list[Leg | list[Leg]] = []
+    # id() of legs already in sent_trade_ids; orders are fetched again as
+    # later executions arrive, and these legs were notified and applied
+    repeats: set[int] = set()
+    applied = cursor.applied if cursor is not None else None
+    for trade in normalize_legs(iter_flatten_legs(orders)):
+        key = (trade.symbol, trade.expiration, trade.strike)
+        legs = contracts.get(key)
+        if legs is None:
+            contracts[key] = [trade]
+        else:
+            legs.append(trade)
+        trade_id = (trade.order_id, trade.time, trade.symbol)
+        if trade_id in sent_trade_ids or (
+            applied is not None and trade_id in applied
+        ):
+            repeats.add(id(trade))
+            continue
+        sent_trade_ids.add(trade_id)
+        if applied is not None:
+            applied.add(trade_id)
+        if trade.qty is not None and trade.instruction is not None:
+            # the legs of an order are flattened one after another
+            last = fills[-1] if trade.multi_leg and fills else None
+            if isinstance(last, list):
+                if last[0].order_id == trade.order_id:
+                    last.append(trade)
+                    continue
+            elif (
+                last is not None
+                and last.multi_leg
+                and last.order_id == trade.order_id
+            ):
+                fills[-1] = [last, trade]
+                continue
+            fills.append(trade)
+    tracked = perf()
+    flatten_secs = tracked - start
+    # order_id -> realized PnL percentage of each multi-leg order
+    spread_pnl: dict = {}
+    for fill in fills:
+        try:
+            if not isinstance(fill, list):
+                position_tracker.add_leg(fill)
+            else:
+                realized, basis = position_tracker.add_spread(fill)
+                spread_pnl[fill[0].order_id] = (
+                    realized / basis * 100 if basis else 0.0
+                )
+        except ValueError as exc:
+            logging.error("Position tracking error: %s", exc)
+    track_secs = perf() - tracked
+    format_secs = notify_secs = 0.0
+    processed = new_legs = notifications = 0
+    for (symbol, expiration, strike), legs in contracts.items():
+        tracked = perf()
+        processed += len(legs)
+        changes = []
+        for trade in legs:
+            changes.append(tracker.update_and_get_change(symbol, trade.price))
+        open_qty = position_tracker.get_open_quantity(
+            symbol, expiration, strike
+        )
+        pnl = position_tracker.calculate_pnl(symbol, expiration, strike)
+        underlying = legs[-1].underlying or symbol
+        totals = aggregate_values(
+            position_tracker.aggregates,
+            underlying,
+            expiration or "",
+            legs[-1].time,
+        )
+        mark = None
+        if marks is not None:
+            mark, unrealized = marks.update(symbol, expiration, strike)
+        formatted = perf()
+        track_secs += formatted - tracked
+
+        fresh = []
+        fill_times = []
+        for trade, change in zip(legs, changes):
+            if id(trade) in repeats:
+                continue
+            values = trade.as_dict()
+            values["ticker"] = symbol
+            values["pct_change"] = change
+            values["open_qty"] = open_qty
+            values["pnl"] = pnl
+            values["account"] = account
+            values["fills"] = 1
+            values.update(totals)
+            if trade.multi_leg and trade.order_id in spread_pnl:
+                values["spread_pnl"] = spread_pnl[trade.order_id]
+            if mark is not None:
+                values["mark"] = mark
+                values["unrealized"] = unrealized
+            fresh.append(values)
+            fill_times.append(trade.time)
+        new_legs += len(fresh)
+        if combine and len(fresh) > 1:
+            combined = combine_legs(fresh)
+            growth = 1.0
+            for change in changes:
+                growth *= 1 + change / 100
+            combined["pct_change"] = (growth - 1) * 100
+            messages = [render(combined)]
+            # one message reporting every fill
+            fill_times = [tuple(fill_times)]
+        else:
+            messages = [render(values) for values in fresh]
+        notified = perf()
+        format_secs += notified - formatted
+        # sent per contract so a poll's messages are never all held at once
+        for message, when in zip(messages, fill_times):
+            if not isinstance(when, tuple):
+                when = (when,)
+            if dispatcher is not None:
+                await dispatcher.send(message, when)
+            elif send_message(message):
+                record_fill_lag(when)
+        notify_secs += perf() - notified
+        notifications += len(messages)
+        logging.info(
+            "Contract %s change %.2f%% open %s PnL %.2f%%; "
+            "%s shares +%g/-%g contracts +%g/-%g realized %.2f",
+            symbol,
+            changes[-1],
+            open_qty,
+            pnl,
+            underlying,
+            totals["underlying_long_shares"],
+            totals["underlying_short_shares"],
+            totals["underlying_long_contracts"],
+            totals["underlying_short_contracts"],
+            totals["underlying_realized"],
+        )
+    if contracts:
+        totals = aggregate_values(
+            position_tracker.aggregates, when=time.time()
+        )
+        logging.info(
+            "Account %s shares +%g/-%g contracts +%g/-%g realized %.2f "
+            "today %.2f this week %.2f",
+            account or "all",
+            totals["account_long_shares"],
+            totals["account_short_shares"],
+            totals["account_long_contracts"],
+            totals["account_short_contracts"],
+            totals["account_realized"],
+            totals["day_realized"],
+            totals["week_realized"],
+        )
+    TRADES.inc(processed, account=account)
+    NOTIFICATIONS.inc(notifications, account=account)
+    DEDUP_HITS.inc(len(repeats))
+    STAGE_SECONDS.observe(flatten_secs, stage="flatten")
+    STAGE_SECONDS.observe(track_secs, stage="track")
+    STAGE_SECONDS.observe(format_secs, stage="format")
+    STAGE_SECONDS.observe(notify_secs, stage="notify")
+    return new_legs
+
+
+async def poll_account(
+    client: SchwabClient | AsyncSchwabClient,
+    account: Account,
+    template: str,
+    sent_trade_ids,
+    dispatcher: DiscordDispatcher | None = None,
+    store: StateStore | None = None,
+    combine: bool = False,
+) -> int:
+    """Run one fetch/process/persist cycle for ``account``.
+
+    Returns the number of new legs seen.
     """
-    tracker = tracker or PriceTracker()
-    position_tracker = position_tracker or PositionTracker()
-    sent_trade_ids = sent_trade_ids or set()
+    started = time.perf_counter()
+    kwargs = {}
+    if account.account_hash is not None:
+        kwargs["account_hash"] = account.account_hash
+    cursor = account.cursor
+    with STAGE_SECONDS.time(stage="fetch"):
+        if cursor is not None:
+            data = await fetch_orders(
+                client, since=cursor.start_time(), **kwargs
+            )
+            data = cursor.iter_new(data) if data is not None else None
+        else:
+            data = await fetch_orders(client, **kwargs)
+    new_legs = 0
+    if data:
+        new_legs = await process_orders(
+            data,
+            account.tracker,
+            account.position_tracker,
+            template,
+            sent_trade_ids,
+            dispatcher,
+            account.name,
+            combine,
+            account.marks,
+            cursor,
+        )
+    persisted = time.perf_counter()
+    if store is not None:
+        dedup = None
+        if isinstance(sent_trade_ids, DedupIndex):
+            dedup = sent_trade_ids
+        store.flush(
+            account.tracker, account.position_tracker, dedup, account.key
+        )
+    if cursor is not None:
+        cursor.save()
+    finished = time.perf_counter()
+    STAGE_SECONDS.observe(finished - persisted, stage="persist")
+    STAGE_SECONDS.observe(finished - started, stage="poll")
+    return new_legs
 
+
+async def catch_up(
+    client: SchwabClient | AsyncSchwabClient,
+    accounts: list[Account],
+    template: str = DEFAULT_TEMPLATE,
+    sent_trade_ids: DedupIndex | set | None = None,
+    dispatcher: DiscordDispatcher | None = None,
+    store: StateStore | None = None,
+    combine: bool = False,
+) -> int:
+    """Poll every account once, concurrently, and return the new legs seen.
+
+    Used at startup to fetch the fills missed while the tracker was down
+    before it reports ready. Each account's next poll is then scheduled
+    ``interval_secs`` later; failures are logged and leave it due at once.
+    """
+    if sent_trade_ids is None:
+        sent_trade_ids = DedupIndex()
+    results = await asyncio.gather(
+        *(
+            poll_account(
+                client,
+                account,
+                template,
+                sent_trade_ids,
+                dispatcher,
+                store,
+                combine,
+            )
+            for account in accounts
+        ),
+        return_exceptions=True,
+    )
+    finished = time.monotonic()
+    new_legs = 0
+    for account, result in zip(accounts, results):
+        if isinstance(result, Exception):
+            logging.error(
+                "Catch-up failed for account %s: %s",
+                account.name or "all",
+                result,
+            )
+            continue
+        new_legs += result
+        account.next_poll = finished + account.interval_secs
+    return new_legs
+
+
+async def poll_accounts(
+    client: SchwabClient | AsyncSchwabClient,
+    accounts: list[Account],
+    template: str = DEFAULT_TEMPLATE,
+    sent_trade_ids: DedupIndex | set | None = None,
+    dispatcher: DiscordDispatcher | None = None,
+    store: StateStore | None = None,
+    combine: bool = False,
+    stream=None,
+) -> None:
+    """Continuously poll every account in ``accounts`` on its own schedule.
+
+    Accounts that are due are fetched concurrently, so a cycle takes about as
+    long as the slowest account. When several accounts are due the access
+    token is refreshed once up front rather than by each request. Accounts
+    with a ``scheduler`` pick their next delay from the activity just seen
+    instead of using a fixed ``interval_secs``.
+
+    ``stream`` is a running :class:`streamer.ActivityStream`. While it is
+    connected, accounts are polled as soon as it reports a fill and
+    otherwise only every ``stream.reconcile_secs``; while it is down the
+    normal cadence applies.
+
+    ``template`` is validated before the first poll; unknown placeholders
+    raise ``ValueError``.
+    """
+    if not accounts:
+        logging.error("No accounts to poll")
+        return
+    validate_template(template)
+    if sent_trade_ids is None:
+        sent_trade_ids = DedupIndex()
     while True:
         try:
-            data = client.get_account_positions()
-            if data:
-                trades = flatten_dataset(data)
-                for trade in trades:
-                    symbol = trade.get("symbol")
-                    price = trade.get("price")
-                    qty = trade.get("qty")
-                    side = trade.get("instruction")
-                    expiration = trade.get("expiration")
-                    strike = trade.get("strike")
-                    if symbol is None or price is None:
-                        continue
-                    change = tracker.update_and_get_change(
-                        symbol, float(price)
-                    )
-                    if qty is not None and side is not None:
-                        try:
-                            position_tracker.add_trade(
-                                symbol,
-                                float(qty),
-                                float(price),
-                                side,
-                                expiration,
-                                strike,
-                            )
-                        except ValueError as exc:  # pragma: no cover
-                            logging.error("Position tracking error: %s", exc)
-                    open_qty = position_tracker.get_open_quantity(
-                        symbol, expiration, strike
-                    )
-                    pnl = position_tracker.calculate_pnl(
-                        symbol, expiration, strike
-                    )
-                    message = format_trade(
+            if isinstance(sent_trade_ids, DedupIndex):
+                sent_trade_ids.expire()
+            now = time.monotonic()
+            if stream is not None:
+                for account in stream.take_due(accounts):
+                    account.next_poll = now
+            due = [account for account in accounts if account.next_poll <= now]
+            if len(due) > 1 and hasattr(client, "refresh_tokens"):
+                try:
+                    await call_client(client, "refresh_tokens")
+                except Exception as exc:  # pragma: no cover - logging only
+                    logging.error("Token refresh error: %s", exc)
+            results = await asyncio.gather(
+                *(
+                    poll_account(
+                        client,
+                        account,
                         template,
-                        ticker=symbol,
-                        pct_change=change,
-                        open_qty=open_qty,
-                        pnl=pnl,
-                        **trade,
+                        sent_trade_ids,
+                        dispatcher,
+                        store,
+                        combine,
                     )
-                    trade_id = (
-                        trade.get("order_id"),
-                        trade.get("time"),
-                        symbol,
+                    for account in due
+                ),
+                return_exceptions=True,
+            )
+            finished = time.monotonic()
+            for account, result in zip(due, results):
+                if isinstance(result, CircuitOpenError):
+                    logging.warning(
+                        "Skipping account %s: %s",
+                        account.name or "all",
+                        result,
                     )
-                    if trade_id not in sent_trade_ids:
-                        sent_trade_ids.add(trade_id)
-                        send_message(message)
-                    logging.info(
-                        "Contract %s change %.2f%% open %s PnL %.2f%%",
-                        symbol,
-                        change,
-                        open_qty,
-                        pnl,
+                    result = 0
+                elif isinstance(result, Exception):
+                    logging.error(
+                        "Polling error for account %s: %s",
+                        account.name or "all",
+                        result,
                     )
+                    result = 0
+                interval = account.interval_secs
+                if account.scheduler is not None:
+                    interval = account.scheduler.next_interval(result)
+                if stream is not None and stream.connected:
+                    interval = max(interval, stream.reconcile_secs)
+                account.next_poll = finished + interval
+                POLL_INTERVAL.set(interval, account=account.name)
+        except asyncio.CancelledError:
+            break
         except Exception as exc:  # pragma: no cover - logging only
             logging.error("Polling error: %s", exc)
+        next_poll = min(account.next_poll for account in accounts)
+        delay = max(0.0, next_poll - time.monotonic())
         try:
-            await asyncio.sleep(interval_secs)
+            if stream is not None:
+                await stream.wait(delay)
+            else:
+                await asyncio.sleep(delay)
         except asyncio.CancelledError:
             break
+
+
+async def poll_schwab(
+    client: SchwabClient | AsyncSchwabClient,
+    interval_secs: float = 5,
+    tracker: PriceTracker | None = None,
+    position_tracker: PositionTracker | None = None,
+    template: str = DEFAULT_TEMPLATE,
+    sent_trade_ids: DedupIndex | set[
+        tuple[int | None, str | None, str | None]
+    ] | None = None,
+    cursor: OrderCursor | None = None,
+    dispatcher: DiscordDispatcher | None = None,
+    store: StateStore | None = None,
+    combine: bool = False,
+    stream=None,
+) -> None:
+    """Continuously poll ``client`` for account positions.
+
+    Each fetched trade is flattened, fed into ``tracker`` and
+    ``position_tracker`` to compute open quantity and realized PnL. The percent
+    change from the previous price is logged. Trades are only sent to Discord
+    once based on their order ID and timestamp; ``sent_trade_ids`` defaults
+    to a :class:`DedupIndex` that forgets IDs once they leave the fetch
+    window.
+
+    When ``cursor`` is given, only orders entered after its high-water mark
+    are requested and orders whose fills were already processed are dropped
+    before flattening.
+
+    A poll's legs are grouped by contract and each contract is tracked and
+    notified in one pass.
+
+    When ``dispatcher`` is given, messages are queued for background
+    delivery instead of being posted inline.
+
+    When ``store`` is given, tracker changes and new sent trade IDs are
+    written to it in one batch at the end of every poll.
+
+    With ``combine``, each contract's new fills in a poll are sent as one
+    notification instead of one per fill.
+
+    With ``stream``, fills reported by the account activity stream are
+    fetched immediately; see :func:`poll_accounts`.
+
+    This is :func:`poll_accounts` for a single implicit account.
+    """
+    account = Account(
+        interval_secs=interval_secs,
+        tracker=tracker or PriceTracker(),
+        position_tracker=position_tracker or PositionTracker(),
+        cursor=cursor,
+    )
+    await poll_accounts(
+        client,
+        [account],
+        template,
+        sent_trade_ids,
+        dispatcher,
+        store,
+        combine,
+        stream,
+    )
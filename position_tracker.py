@@ -1,28 +1,180 @@
+from collections import deque
+from dataclasses import dataclass
+from functools import lru_cache
+
+from aggregates import AggregateIndex
+
+# units of the underlying covered by one option contract
+OPTION_MULTIPLIER = 100.0
+
+# instruction -> (1 to buy or -1 to sell, whether it may only close)
+INSTRUCTION_SIDES: dict[str, tuple[int, bool]] = {
+    "BUY": (1, False),
+    "BUY_TO_OPEN": (1, False),
+    "BUY_TO_CLOSE": (1, True),
+    "BUY_TO_COVER": (1, True),
+    "SELL": (-1, True),
+    "SELL_TO_OPEN": (-1, False),
+    "SELL_TO_CLOSE": (-1, True),
+    "SELL_SHORT": (-1, False),
+    "SELL_SHORT_EXEMPT": (-1, False),
+}
+
+
+@dataclass(slots=True)
+class Lot:
+    """An open lot of ``qty`` opened at ``price``.
+
+    ``qty`` is negative for a short lot. Slotted, so each lot is smaller
+    than the ``[qty, price]`` list it replaces; ``qty`` shrinks towards zero
+    in place as the lot is partially closed.
+    """
+
+    qty: float
+    price: float
+
+
+# residual quantity below which a partially closed lot is discarded
+_EPSILON = 1e-9
+# realized PnL and basis of a fill that closed nothing
+_NOTHING_CLOSED = (0.0, 0.0)
+
+
+class LotQueue:
+    """FIFO queue of open lots with running quantity and cost totals.
+
+    Each lot is a :class:`Lot`. Opening appends to the right and closing
+    consumes from the left, so both are amortized O(1), and the open
+    quantity and cost basis are available without summing the lots. A queue
+    is either long or short: quantities and cost are signed, and every lot
+    has the sign of ``qty``.
+    """
+
+    __slots__ = ("lots", "qty", "cost")
+
+    EPSILON = _EPSILON
+
+    def __init__(self):
+        self.lots: deque[Lot] = deque()
+        self.qty = 0.0
+        self.cost = 0.0
+
+    def __len__(self) -> int:
+        return len(self.lots)
+
+    @classmethod
+    def from_lots(cls, lots) -> "LotQueue":
+        """Return a queue holding ``lots``, ``[qty, price]`` pairs in order."""
+        queue = cls()
+        for qty, price in lots:
+            queue.lots.append(Lot(qty, price))
+            queue.qty += qty
+            queue.cost += qty * price
+        return queue
+
+    def to_list(self) -> list[list[float]]:
+        """Return the lots as ``[qty, price]`` pairs, e.g. for JSON."""
+        return [[lot.qty, lot.price] for lot in self.lots]
+
+    def push(self, qty: float, price: float) -> None:
+        """Open a new lot of ``qty`` at ``price``."""
+        self.lots.append(Lot(qty, price))
+        self.qty += qty
+        self.cost += qty * price
+
+    def close(self, qty: float) -> float:
+        """Close ``qty`` FIFO and return the cost basis of what was closed.
+
+        ``qty`` is the unsigned quantity to close, from a long or a short
+        queue alike, and the basis returned is unsigned too. Raises
+        ``ValueError`` without modifying the queue when ``qty`` exceeds the
+        open quantity.
+        """
+        short = self.qty < 0
+        if qty > (-self.qty if short else self.qty) + _EPSILON:
+            raise ValueError("close quantity exceeds open quantity")
+        lots = self.lots
+        basis = 0.0
+        remaining = qty
+        while remaining > _EPSILON and lots:
+            lot = lots[0]
+            size = -lot.qty if short else lot.qty
+            if remaining < size:
+                basis += lot.price * remaining
+                if size - remaining > _EPSILON:
+                    lot.qty += remaining if short else -remaining
+                else:
+                    lots.popleft()
+                break
+            basis += lot.price * size
+            remaining -= size
+            lots.popleft()
+        if lots:
+            self.qty += qty if short else -qty
+            self.cost += basis if short else -basis
+        else:
+            # reset to avoid accumulating floating point drift
+            self.qty = 0.0
+            self.cost = 0.0
+        return basis
+
+    def average_cost(self) -> float:
+        """Return the average price of the open lots."""
+        if -self.EPSILON <= self.qty <= self.EPSILON:
+            return 0.0
+        return self.cost / self.qty
+
+
 class PositionTracker:
     """Track open positions and realized PnL using FIFO cost basis.
 
     Positions are keyed by ``symbol``, ``expiration`` and ``strike`` so that
     multiple option contracts for the same underlying can be tracked
-    independently.
+    independently. Each contract is long or short: a fill first closes lots
+    on the opposite side and opens whatever is left, so every fill costs
+    amortized O(1) however many lots are open. Instructions that may only
+    close, such as ``SELL_TO_CLOSE``, are rejected when they exceed the
+    open position. Contracts with an expiration are options, whose realized
+    PnL and closed basis are in dollars of ``option_multiplier`` units per
+    contract; lots keep per-unit prices. Every fill also updates the
+    totals by underlying, expiration and day in ``aggregates``.
     """
 
-    def __init__(self):
+    def __init__(self, option_multiplier: float = OPTION_MULTIPLIER):
+        self.option_multiplier = option_multiplier
         # queue of lots per (symbol, expiration, strike)
-        self.positions: dict[
-            tuple[str, str, float], list[dict[str, float]]
-        ] = {}
+        self.positions: dict[tuple[str, str, float], LotQueue] = {}
         # realized profit in dollars per key
         self.realized_pnl: dict[tuple[str, str, float], float] = {}
         # total cost basis for closed lots per key
         self.closed_basis: dict[tuple[str, str, float], float] = {}
+        # keys changed since the state was last persisted
+        self.dirty: set[tuple[str, str, float]] = set()
+        self.aggregates = AggregateIndex()
 
     @staticmethod
+    @lru_cache(maxsize=4096)
     def _build_key(
         symbol: str, expiration: str | None, strike: float | None
     ) -> tuple[str, str, float]:
-        """Return a normalized composite key for internal dictionaries."""
+        """Return a normalized composite key for internal dictionaries.
+
+        Cached because every trade and lookup for a contract rebuilds the
+        same key.
+        """
         return (symbol, expiration or "", float(strike or 0.0))
 
+    def multiplier(self, key: tuple[str, str, float]) -> float:
+        """Return the dollar value of one unit of price for ``key``."""
+        return self.option_multiplier if key[1] else 1.0
+
+    @staticmethod
+    def _side(instruction: str) -> tuple[int, bool]:
+        side = INSTRUCTION_SIDES.get(instruction)
+        if side is None:
+            raise ValueError(f"Unsupported instruction {instruction}")
+        return side
+
     def add_trade(
         self,
         symbol: str,
@@ -31,6 +183,8 @@ class PositionTracker:
         side: str,
         expiration: str | None = None,
         strike: float | None = None,
+        underlying: str | None = None,
+        when: float | None = None,
     ) -> None:
         """Record a trade and update FIFO positions.
 
@@ -43,40 +197,145 @@ class PositionTracker:
         price: float
             Trade price.
         side: str
-            ``"BUY"`` to open/add, ``"SELL"`` to close.
+            Any instruction in :data:`INSTRUCTION_SIDES`, e.g. ``"BUY"``,
+            ``"SELL"`` or ``"SELL_TO_OPEN"``.
         expiration: str | None, optional
             Option expiration date.
         strike: float | None, optional
             Option strike price.
+        underlying: str | None, optional
+            Underlying symbol the contract is aggregated under; defaults
+            to ``symbol``.
+        when: float | None, optional
+            Execution time in epoch seconds, for the daily totals.
         """
-        side = side.upper()
-        if side not in {"BUY", "SELL"}:
-            raise ValueError("side must be BUY or SELL")
+        direction, closing = self._side(side.upper())
+        self._apply(
+            self._build_key(symbol, expiration, strike),
+            float(qty),
+            float(price),
+            direction,
+            closing,
+            when,
+            underlying,
+        )
 
-        key = self._build_key(symbol, expiration, strike)
-        queue = self.positions.setdefault(key, [])
-        if side == "BUY":
-            queue.append({"qty": float(qty), "price": float(price)})
-            return
-
-        # SELL path - close existing lots using FIFO
-        qty_remaining = float(qty)
-        while qty_remaining > 0:
-            if not queue:
+    def add_leg(self, leg) -> None:
+        """Record a leg normalized by :func:`normalize.normalize_leg`.
+
+        The leg's fields are used as they are, without the conversions
+        :meth:`add_trade` applies to its arguments.
+        """
+        side = INSTRUCTION_SIDES.get(leg.instruction)
+        if side is None:
+            raise ValueError(f"Unsupported instruction {leg.instruction}")
+        self._apply(
+            (leg.symbol, leg.expiration or "", leg.strike or 0.0),
+            leg.qty,
+            leg.price,
+            side[0],
+            side[1],
+            leg.time,
+            leg.underlying,
+        )
+
+    def add_spread(self, legs) -> tuple[float, float]:
+        """Record the normalized legs of one multi-leg order as a unit.
+
+        Every leg is checked before any is applied, so an order with a leg
+        that would close more than is open is rejected as a whole with
+        ``ValueError``. Returns the realized PnL of the whole order and the
+        net debit or credit paid for the lots it closed, whose ratio is the
+        spread's return.
+        """
+        fills = []
+        # signed quantity each contract will hold after the earlier legs
+        held: dict[tuple[str, str, float], float] = {}
+        for leg in legs:
+            direction, closing = self._side(leg.instruction)
+            key = (leg.symbol, leg.expiration or "", leg.strike or 0.0)
+            qty = held.get(key)
+            if qty is None:
+                queue = self.positions.get(key)
+                qty = queue.qty if queue is not None else 0.0
+            if closing and leg.qty > qty * -direction + _EPSILON:
                 raise ValueError(
-                    f"Attempting to sell more than open quantity for {symbol}"
+                    f"Spread order {leg.order_id} closes more than the open "
+                    f"quantity of {key[0]}"
                 )
-            lot = queue[0]
-            close_qty = min(qty_remaining, lot["qty"])
-            lot["qty"] -= close_qty
-            if lot["qty"] == 0:
-                queue.pop(0)
-            pnl = (price - lot["price"]) * close_qty
-            self.realized_pnl[key] = self.realized_pnl.get(key, 0.0) + pnl
-            self.closed_basis[key] = (
-                self.closed_basis.get(key, 0.0) + lot["price"] * close_qty
+            held[key] = qty + leg.qty * direction
+            fills.append((key, leg, direction))
+        realized = basis = 0.0
+        for key, leg, direction in fills:
+            closed = self._apply(
+                key,
+                leg.qty,
+                leg.price,
+                direction,
+                False,
+                leg.time,
+                leg.underlying,
             )
-            qty_remaining -= close_qty
+            realized += closed[0]
+            # a buy closes short lots, whose premium was received
+            basis -= closed[1] * direction
+        return realized, abs(basis)
+
+    def _apply(
+        self,
+        key: tuple[str, str, float],
+        qty: float,
+        price: float,
+        direction: int,
+        closing: bool,
+        when: float | None = None,
+        underlying: str | None = None,
+    ) -> tuple[float, float]:
+        """Fill ``qty`` in ``direction``; return realized PnL and basis."""
+        queue = self.positions.get(key)
+        if queue is None:
+            queue = self.positions[key] = LotQueue()
+        # quantity held on the opposite side, which this fill closes first
+        opposite = -queue.qty if direction > 0 else queue.qty
+        if closing and qty > opposite + _EPSILON:
+            action = "buy" if direction > 0 else "sell"
+            raise ValueError(
+                f"Attempting to {action} more than open quantity for "
+                f"{key[0]}"
+            )
+        self.dirty.add(key)
+        multiplier = self.option_multiplier if key[1] else 1.0
+        if opposite <= _EPSILON:
+            qty = qty if direction > 0 else -qty
+            queue.push(qty, price)
+            self.aggregates.opened(
+                key, qty, qty * price * multiplier, underlying
+            )
+            return _NOTHING_CLOSED
+
+        open_qty, open_cost = queue.qty, queue.cost
+        close_qty = qty if qty < opposite else opposite
+        basis = queue.close(close_qty)
+        # buying back a short gains when the price fell, selling a long
+        # when it rose
+        realized = (basis - price * close_qty) * direction * multiplier
+        basis *= multiplier
+        self.realized_pnl[key] = self.realized_pnl.get(key, 0.0) + realized
+        self.closed_basis[key] = self.closed_basis.get(key, 0.0) + basis
+        if qty - close_qty > _EPSILON:
+            qty -= close_qty
+            queue.push(qty if direction > 0 else -qty, price)
+        self.aggregates.closed(
+            key,
+            open_qty,
+            queue.qty,
+            (queue.cost - open_cost) * multiplier,
+            realized,
+            basis,
+            when,
+            underlying,
+        )
+        return realized, basis
 
     def get_open_quantity(
         self,
@@ -85,9 +344,18 @@ class PositionTracker:
         strike: float | None = None,
     ) -> float:
         """Return the remaining open quantity for the given contract."""
-        key = self._build_key(symbol, expiration, strike)
-        queue = self.positions.get(key, [])
-        return sum(lot["qty"] for lot in queue)
+        queue = self.positions.get(self._build_key(symbol, expiration, strike))
+        return queue.qty if queue is not None else 0.0
+
+    def get_average_cost(
+        self,
+        symbol: str,
+        expiration: str | None = None,
+        strike: float | None = None,
+    ) -> float:
+        """Return the average price of the open lots for the contract."""
+        queue = self.positions.get(self._build_key(symbol, expiration, strike))
+        return queue.average_cost() if queue is not None else 0.0
 
     def calculate_pnl(
         self,
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import threading
+import time
+
+from metrics import CIRCUIT_OPEN
+
+
+class TokenBucket:
+    """Thread-safe token bucket used as a shared API request budget.
+
+    The bucket holds up to ``capacity`` tokens and refills at ``rate`` tokens
+    per second. :meth:`acquire` waits with ``asyncio.sleep`` and
+    :meth:`acquire_sync` with ``time.sleep`` until a token is available, so
+    the same bucket can pace both event-loop code and worker threads.
+    """
+
+    def __init__(self, capacity: float, rate: float, clock=time.monotonic):
+        self.capacity = capacity
+        self.rate = rate
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, requests: float) -> "TokenBucket":
+        """Return a bucket allowing ``requests`` per minute with no burst."""
+        return cls(requests, requests / 60)
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+
+    def pause(self, seconds: float) -> None:
+        """Empty the bucket so no token is available for ``seconds``.
+
+        Used when the server answers 429 so every caller sharing the bucket
+        backs off, not just the one that was throttled.
+        """
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0.0, 1 - seconds * self.rate)
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """Take ``tokens`` if available and return 0, else the wait needed."""
+        with self.lock:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.0
+            return (tokens - self.tokens) / self.rate
+
+    async def acquire(self, tokens: float = 1) -> None:
+        """Wait on the event loop until ``tokens`` can be taken."""
+        while (wait := self.try_acquire(tokens)) > 0:
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self, tokens: float = 1) -> None:
+        """Block the calling thread until ``tokens`` can be taken."""
+        while (wait := self.try_acquire(tokens)) > 0:
+            time.sleep(wait)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of sending a request while the circuit is open."""
+
+
+class CircuitBreaker:
+    """Stop calling a failing API and let a single probe test recovery.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    :meth:`allow` rejects requests for ``reset_timeout`` seconds. It then
+    goes half-open and lets one trial request through; success closes the
+    circuit and failure reopens it for twice as long, up to
+    ``max_reset_timeout``.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30,
+        max_reset_timeout: float = 300,
+        clock=time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    def retry_in(self) -> float:
+        """Return seconds until a trial request will be allowed."""
+        if self.state == self.CLOSED:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - self.clock())
+
+    def allow(self) -> bool:
+        """Return whether a request may be sent now.
+
+        The first caller after the reset timeout gets the half-open trial;
+        everyone else is rejected until that trial reports back, or until
+        another reset timeout passes without it doing so.
+        """
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.retry_in() == 0:
+                self.state = self.HALF_OPEN
+                self.opened_at = self.clock()
+                logging.info("Circuit half-open, sending a trial request")
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self.lock:
+            if self.state != self.CLOSED:
+                logging.info("Circuit closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.reset_timeout = self.base_reset_timeout
+            CIRCUIT_OPEN.set(0)
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN:
+                self.reset_timeout = min(
+                    self.max_reset_timeout, self.reset_timeout * 2
+                )
+            elif (
+                self.state == self.OPEN
+                or self.failures < self.failure_threshold
+            ):
+                return
+            self.state = self.OPEN
+            self.opened_at = self.clock()
+            CIRCUIT_OPEN.set(1)
+            logging.warning(
+                "Circuit open after %s failures, retrying in %.0fs",
+                self.failures,
+                self.reset_timeout,
+            )
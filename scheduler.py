@@ -0,0 +1,121 @@
+import logging
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+
+def parse_clock(value: str) -> time:
+    """Parse ``"HH:MM"`` into a :class:`datetime.time`."""
+    hours, minutes = value.split(":")
+    return time(int(hours), int(minutes))
+
+
+class MarketCalendar:
+    """Regular trading session used to slow polling outside market hours.
+
+    The session runs from ``open_time`` to ``close_time`` in ``timezone`` on
+    ``weekdays`` (Monday is 0), excluding the dates in ``holidays``.
+    """
+
+    def __init__(
+        self,
+        open_time: time = time(9, 30),
+        close_time: time = time(16, 0),
+        timezone: str = "America/New_York",
+        weekdays=(0, 1, 2, 3, 4),
+        holidays=(),
+    ):
+        self.open_time = open_time
+        self.close_time = close_time
+        try:
+            self.tz = ZoneInfo(timezone)
+        except ZoneInfoNotFoundError:
+            logging.warning("Unknown timezone %s, using UTC", timezone)
+            self.tz = ZoneInfo("UTC")
+        self.weekdays = frozenset(weekdays)
+        self.holidays = frozenset(holidays)
+
+    def _is_session_day(self, day: date) -> bool:
+        return day.weekday() in self.weekdays and day not in self.holidays
+
+    def is_open(self, now: datetime | None = None) -> bool:
+        """Return whether the market is open at ``now``."""
+        local = (now or datetime.now(self.tz)).astimezone(self.tz)
+        return (
+            self._is_session_day(local.date())
+            and self.open_time <= local.time() < self.close_time
+        )
+
+    def seconds_until_open(self, now: datetime | None = None) -> float:
+        """Return seconds until the next session opens, 0 when open."""
+        local = (now or datetime.now(self.tz)).astimezone(self.tz)
+        if self.is_open(local):
+            return 0.0
+        day = local.date()
+        for _ in range(366):
+            if self._is_session_day(day):
+                opens = datetime.combine(day, self.open_time, self.tz)
+                if opens > local:
+                    return (opens - local).total_seconds()
+            day += timedelta(days=1)
+        return float("inf")
+
+
+class AdaptiveScheduler:
+    """Choose the delay before the next poll from recent activity.
+
+    New fills drop the interval to ``min_interval``; each quiet poll
+    multiplies it by ``backoff`` up to ``max_interval``. While ``calendar``
+    says the market is closed, quiet polls wait until the open but never
+    longer than ``closed_interval`` so after-hours fills are still seen.
+    Request budgets are enforced by the client's limiter, not here. The
+    current cadence is exposed as ``interval``.
+    """
+
+    def __init__(
+        self,
+        base_interval: float = 5,
+        min_interval: float = 1,
+        max_interval: float = 60,
+        backoff: float = 2,
+        closed_interval: float = 300,
+        calendar: MarketCalendar | None = None,
+    ):
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.closed_interval = closed_interval
+        self.calendar = calendar
+        self.interval = base_interval
+        self.market_open = True
+
+    def next_interval(
+        self, new_fills: int, now: datetime | None = None
+    ) -> float:
+        """Update and return the interval after a poll saw ``new_fills``."""
+        previous = self.interval
+        was_open = self.market_open
+        self.market_open = self.calendar is None or self.calendar.is_open(now)
+        if new_fills:
+            self.interval = self.min_interval
+        elif not self.market_open:
+            self.interval = max(
+                self.min_interval,
+                min(
+                    self.closed_interval,
+                    self.calendar.seconds_until_open(now),
+                ),
+            )
+        elif not was_open:
+            # first poll after the open starts from the base cadence
+            self.interval = self.base_interval
+        else:
+            self.interval = min(
+                self.max_interval,
+                max(self.base_interval, previous * self.backoff),
+            )
+        if self.interval != previous:
+            logging.debug(
+                "Poll interval %.2fs -> %.2fs", previous, self.interval
+            )
+        return self.interval
@@ -0,0 +1,119 @@
+"""Compact snapshot of tracker state for fast restarts.
+
+The snapshot holds every account's prices, FIFO lots, realized PnL and
+daily realized totals plus the sent trade IDs as zlib-compressed JSON
+behind a magic header. It is written on shutdown after the final
+:class:`StateStore` flush and tagged with the store's last flush stamp, so
+on startup it is only trusted while the database has not been written
+since; otherwise state is loaded from the database as before.
+"""
+import json
+import logging
+import os
+import zlib
+
+from aggregates import Aggregate
+from position_tracker import LotQueue
+
+# bumped when the meaning of the state changes, e.g. option PnL in dollars
+MAGIC = b"ATSNAP3\n"
+
+
+def _account_state(account) -> dict:
+    position_tracker = account.position_tracker
+    aggregates = position_tracker.aggregates
+    positions = []
+    for key, queue in position_tracker.positions.items():
+        positions.append([
+            *key,
+            position_tracker.realized_pnl.get(key, 0.0),
+            position_tracker.closed_basis.get(key, 0.0),
+            queue.to_list(),
+            aggregates.underlyings.get(key, ""),
+        ])
+    return {
+        "prices": account.tracker.last_prices,
+        "positions": positions,
+        "days": [
+            [day, total.realized, total.basis]
+            for day, total in aggregates.by_day.items()
+        ],
+    }
+
+
+def write_snapshot(
+    path: str, accounts, sent_trade_ids=None, stamp: str | None = None
+) -> int:
+    """Atomically write the state of ``accounts`` to ``path``.
+
+    ``stamp`` identifies the database state the snapshot matches. Returns
+    the number of bytes written.
+    """
+    state = {
+        "stamp": stamp,
+        "accounts": {
+            account.key: _account_state(account) for account in accounts
+        },
+        "sent": (
+            list(sent_trade_ids.entries.items())
+            if sent_trade_ids is not None
+            else []
+        ),
+    }
+    payload = MAGIC + zlib.compress(
+        json.dumps(state, separators=(",", ":")).encode(), 6
+    )
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(payload)
+    os.replace(tmp, path)
+    return len(payload)
+
+
+def read_snapshot(path: str) -> dict | None:
+    """Return the decoded snapshot at ``path`` or ``None`` if unusable."""
+    try:
+        with open(path, "rb") as fh:
+            payload = fh.read()
+    except FileNotFoundError:
+        return None
+    if not payload.startswith(MAGIC):
+        logging.warning("Ignoring snapshot %s with an unknown format", path)
+        return None
+    try:
+        return json.loads(zlib.decompress(payload[len(MAGIC):]))
+    except (zlib.error, ValueError) as exc:
+        logging.warning("Ignoring corrupt snapshot %s: %s", path, exc)
+        return None
+
+
+def restore_snapshot(
+    snapshot: dict, accounts, sent_trade_ids=None
+) -> bool:
+    """Load ``snapshot`` into ``accounts`` and ``sent_trade_ids``.
+
+    Returns ``False`` without changing anything when an account is missing
+    from the snapshot, so the caller can fall back to the database.
+    """
+    states = snapshot.get("accounts", {})
+    if any(account.key not in states for account in accounts):
+        return False
+    for account in accounts:
+        state = states[account.key]
+        account.tracker.last_prices.update(state["prices"])
+        position_tracker = account.position_tracker
+        aggregates = position_tracker.aggregates
+        for row in state["positions"]:
+            symbol, expiration, strike, realized, basis, lots, underlying = row
+            key = (symbol, expiration, strike)
+            position_tracker.positions[key] = LotQueue.from_lots(lots)
+            position_tracker.realized_pnl[key] = realized
+            position_tracker.closed_basis[key] = basis
+            if underlying:
+                aggregates.underlyings[key] = underlying
+        aggregates.rebuild(position_tracker)
+        for day, realized, basis in state["days"]:
+            aggregates.by_day[day] = Aggregate(realized=realized, basis=basis)
+    if sent_trade_ids is not None:
+        sent_trade_ids.load(snapshot["sent"])
+    return True
@@ -0,0 +1,271 @@
+import json
+import logging
+import sqlite3
+import time
+
+from aggregates import Aggregate
+from dedup import DedupIndex
+from position_tracker import OPTION_MULTIPLIER, LotQueue, PositionTracker
+from tracker import PriceTracker
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prices (
+    account TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    price REAL NOT NULL,
+    PRIMARY KEY (account, symbol)
+);
+CREATE TABLE IF NOT EXISTS positions (
+    account TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    expiration TEXT NOT NULL,
+    strike REAL NOT NULL,
+    realized REAL NOT NULL,
+    basis REAL NOT NULL,
+    lots TEXT NOT NULL,
+    underlying TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (account, symbol, expiration, strike)
+);
+CREATE TABLE IF NOT EXISTS realized_days (
+    account TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    realized REAL NOT NULL,
+    basis REAL NOT NULL,
+    PRIMARY KEY (account, day)
+);
+CREATE TABLE IF NOT EXISTS sent_keys (
+    key INTEGER PRIMARY KEY,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# stored in ``PRAGMA user_version``; 1 records option PnL in dollars, 2
+# adds the underlying of each position
+SCHEMA_VERSION = 2
+
+
+class StateStore:
+    """Persist tracker state and sent trade IDs in a local SQLite database.
+
+    The database runs in WAL mode with ``synchronous=NORMAL`` so each flush
+    is a single cheap transaction. Trackers record which keys changed and
+    :meth:`flush` writes only those rows, so the cost per poll depends on
+    how many contracts traded rather than on the size of the history.
+
+    Tracker rows are namespaced by ``account`` so several accounts can share
+    one database; the default empty name is the single implicit account.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _columns(self, table: str) -> list[str]:
+        return [
+            row[1]
+            for row in self.conn.execute(f"PRAGMA table_info({table})")
+        ]
+
+    def _migrate(self) -> None:
+        """Bring databases written by older versions up to date."""
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        migrated = 0
+        with self.conn:
+            self.conn.execute("BEGIN")
+            for table in ("prices", "positions"):
+                if "account" not in self._columns(table):
+                    self._namespace(table)
+            if version < 1:
+                # option PnL used to be stored per unit, not per contract
+                migrated = self.conn.execute(
+                    "UPDATE positions SET realized = realized * ?, "
+                    "basis = basis * ? WHERE expiration != ''",
+                    (OPTION_MULTIPLIER, OPTION_MULTIPLIER),
+                ).rowcount
+            if "underlying" not in self._columns("positions"):
+                self.conn.execute(
+                    "ALTER TABLE positions "
+                    "ADD COLUMN underlying TEXT NOT NULL DEFAULT ''"
+                )
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        if migrated:
+            logging.info(
+                "Scaled PnL of %s option positions in %s to dollars",
+                migrated,
+                self.path,
+            )
+
+    def _namespace(self, table: str) -> None:
+        """Move ``table``'s rows from before accounts to the default one.
+
+        ``account`` leads the primary key and rows are inserted by
+        position, so the table is rebuilt rather than altered.
+        """
+        columns = ", ".join(self._columns(table))
+        self.conn.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+        for statement in SCHEMA.split(";"):
+            if f"EXISTS {table} (" in statement:
+                self.conn.execute(statement)
+        self.conn.execute(
+            f"INSERT INTO {table} (account, {columns}) "
+            f"SELECT '', {columns} FROM {table}_old"
+        )
+        self.conn.execute(f"DROP TABLE {table}_old")
+        logging.info("Moved %s in %s to the default account", table, self.path)
+
+    def load(
+        self,
+        tracker: PriceTracker | None = None,
+        position_tracker: PositionTracker | None = None,
+        sent_trade_ids: DedupIndex | None = None,
+        account: str = "",
+    ) -> None:
+        """Restore tracker state and unexpired sent trade IDs.
+
+        The position tracker's aggregates are rebuilt from the restored
+        positions.
+        """
+        if tracker is not None:
+            tracker.last_prices.update(
+                self.conn.execute(
+                    "SELECT symbol, price FROM prices WHERE account = ?",
+                    (account,),
+                )
+            )
+        if position_tracker is not None:
+            aggregates = position_tracker.aggregates
+            rows = self.conn.execute(
+                "SELECT symbol, expiration, strike, realized, basis, lots, "
+                "underlying FROM positions WHERE account = ?",
+                (account,),
+            )
+            for row in rows:
+                symbol, expiration, strike, realized, basis, lots = row[:6]
+                key = (symbol, expiration, strike)
+                position_tracker.positions[key] = LotQueue.from_lots(
+                    json.loads(lots)
+                )
+                position_tracker.realized_pnl[key] = realized
+                position_tracker.closed_basis[key] = basis
+                if row[6]:
+                    aggregates.underlyings[key] = row[6]
+            aggregates.rebuild(position_tracker)
+            for day, realized, basis in self.conn.execute(
+                "SELECT day, realized, basis FROM realized_days "
+                "WHERE account = ?",
+                (account,),
+            ):
+                aggregates.by_day[day] = Aggregate(
+                    realized=realized, basis=basis
+                )
+        if sent_trade_ids is not None:
+            sent_trade_ids.load(
+                self.conn.execute("SELECT key, expires FROM sent_keys")
+            )
+        logging.info(
+            "Restored state for account %s from %s: %s prices, "
+            "%s positions, %s sent trades",
+            account or "all",
+            self.path,
+            len(tracker.last_prices) if tracker is not None else 0,
+            (
+                len(position_tracker.positions)
+                if position_tracker is not None
+                else 0
+            ),
+            len(sent_trade_ids) if sent_trade_ids is not None else 0,
+        )
+
+    def flush(
+        self,
+        tracker: PriceTracker | None = None,
+        position_tracker: PositionTracker | None = None,
+        sent_trade_ids: DedupIndex | None = None,
+        account: str = "",
+    ) -> None:
+        """Write changed tracker rows and new sent IDs in one batch.
+
+        Sent IDs that have expired from ``sent_trade_ids`` are deleted from
+        the database in the same transaction.
+        """
+        price_rows = []
+        if tracker is not None and tracker.dirty:
+            price_rows = [
+                (account, symbol, tracker.last_prices[symbol])
+                for symbol in tracker.dirty
+            ]
+        position_rows = []
+        day_rows = []
+        if position_tracker is not None and position_tracker.dirty:
+            aggregates = position_tracker.aggregates
+            for key in position_tracker.dirty:
+                queue = position_tracker.positions.get(key)
+                lots = queue.to_list() if queue is not None else []
+                position_rows.append((
+                    account,
+                    *key,
+                    position_tracker.realized_pnl.get(key, 0.0),
+                    position_tracker.closed_basis.get(key, 0.0),
+                    json.dumps(lots),
+                    aggregates.underlyings.get(key, ""),
+                ))
+            for day in aggregates.dirty_days:
+                total = aggregates.by_day[day]
+                day_rows.append((account, day, total.realized, total.basis))
+        sent_rows = []
+        if sent_trade_ids is not None:
+            sent_rows = sent_trade_ids.drain_pending()
+        if not (price_rows or position_rows or sent_rows):
+            return
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO prices VALUES (?, ?, ?)", price_rows
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO positions "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                position_rows,
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO realized_days VALUES (?, ?, ?, ?)",
+                day_rows,
+            )
+            if sent_rows:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO sent_keys VALUES (?, ?)",
+                    sent_rows,
+                )
+                self.conn.execute(
+                    "DELETE FROM sent_keys WHERE expires <= ?", (now,)
+                )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('last_flush', ?)",
+                (str(now),),
+            )
+        if tracker is not None:
+            tracker.dirty.clear()
+        if position_tracker is not None:
+            position_tracker.dirty.clear()
+            position_tracker.aggregates.dirty_days.clear()
+
+    def last_flush(self) -> str | None:
+        """Return the stamp written by the most recent :meth:`flush`."""
+        row = self.conn.execute(
+            "SELECT value FROM meta WHERE key = 'last_flush'"
+        ).fetchone()
+        return row[0] if row else None
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self.conn.close()
@@ -0,0 +1,192 @@
+"""Event-driven ingestion from the Schwab account activity stream.
+
+:class:`ActivityStream` logs in to the Schwab streamer and subscribes to
+``ACCT_ACTIVITY``. Activity messages only describe what happened to an
+order, not the order itself, so each fill marks its account for an
+immediate incremental REST fetch through the usual flatten/track/notify
+path. While the stream is up, polling slows to a reconciliation interval;
+whenever it connects or drops, every account is fetched at once so nothing
+is missed across the gap.
+"""
+import asyncio
+import inspect
+import json
+import logging
+
+from lazy import lazy_import
+from metrics import STREAM_CONNECTED, STREAM_EVENTS
+
+try:
+    websockets = lazy_import("websockets")
+except ImportError:  # pragma: no cover - schwabdev depends on websockets
+    websockets = None
+
+ACTIVITY_SERVICE = "ACCT_ACTIVITY"
+# ``pending`` entry meaning every account is due
+ALL_ACCOUNTS = "*"
+# activity message types sent when an order executes
+FILL_MESSAGE_TYPES = frozenset({
+    "ExecutionCreated",
+    "OrderFillCompleted",
+    "OrderPartialFill",
+})
+
+
+class StreamError(RuntimeError):
+    """The streamer rejected a login or subscription."""
+
+
+class ActivityStream:
+    """Wake the poller for accounts with new fills.
+
+    ``client`` must provide ``get_streamer_info()`` returning the
+    ``streamerInfo`` preferences entry with an ``accessToken`` added, as
+    :class:`client.SchwabClient` does. Run :meth:`run` as a task and pass
+    the stream to :func:`poller.poll_accounts`. Dropped connections are
+    retried with exponential backoff from ``reconnect_delay`` up to
+    ``max_reconnect_delay`` seconds; polling carries on at its normal
+    cadence meanwhile. ``connect`` replaces ``websockets.connect``.
+    """
+
+    def __init__(
+        self,
+        client,
+        reconcile_secs: float = 300,
+        reconnect_delay: float = 1,
+        max_reconnect_delay: float = 60,
+        connect=None,
+    ):
+        self.client = client
+        self.reconcile_secs = reconcile_secs
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.connect = connect
+        self.connected = False
+        # account numbers with unfetched activity, or ALL_ACCOUNTS
+        self.pending: set[str] = set()
+        self.wake = asyncio.Event()
+        self._request_id = 0
+
+    def _mark(self, account: str) -> None:
+        self.pending.add(account)
+        self.wake.set()
+
+    def _set_connected(self, connected: bool) -> None:
+        if connected != self.connected:
+            self.connected = connected
+            STREAM_CONNECTED.set(int(connected))
+            # catch up over REST whichever way the state changed
+            self._mark(ALL_ACCOUNTS)
+
+    def take_due(self, accounts) -> list:
+        """Return the ``accounts`` with pending activity and clear it."""
+        pending, self.pending = self.pending, set()
+        if not pending:
+            return []
+        if ALL_ACCOUNTS in pending:
+            return list(accounts)
+        return [
+            account
+            for account in accounts
+            if account.account_hash is None or account.key in pending
+        ]
+
+    async def wait(self, timeout: float) -> None:
+        """Sleep up to ``timeout`` seconds or until activity arrives."""
+        if not self.pending:
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self.wake.clear()
+
+    def handle(self, message: dict) -> None:
+        """Process one decoded streamer message."""
+        for data in message.get("data") or []:
+            if data.get("service") != ACTIVITY_SERVICE:
+                continue
+            for content in data.get("content") or []:
+                kind = str(content.get("2", ""))
+                STREAM_EVENTS.inc(type=kind)
+                if kind in FILL_MESSAGE_TYPES:
+                    logging.debug("Stream fill activity: %s", kind)
+                    self._mark(str(content.get("1", "")) or ALL_ACCOUNTS)
+
+    def _request(self, info: dict, service: str, command: str, parameters):
+        request = {
+            "service": service,
+            "command": command,
+            "requestid": self._request_id,
+            "SchwabClientCustomerId": info.get("schwabClientCustomerId"),
+            "SchwabClientCorrelId": info.get("schwabClientCorrelId"),
+            "parameters": parameters,
+        }
+        self._request_id += 1
+        return json.dumps(request)
+
+    @staticmethod
+    async def _expect_ok(ws, command: str) -> None:
+        """Wait for the response to ``command``, raising if it failed."""
+        while True:
+            message = json.loads(await ws.recv())
+            for response in message.get("response") or []:
+                if response.get("command") != command:
+                    continue
+                content = response.get("content") or {}
+                if content.get("code", 0) != 0:
+                    raise StreamError(
+                        f"{command} failed: {content.get('msg', content)}"
+                    )
+                return
+
+    async def _get_info(self) -> dict:
+        func = self.client.get_streamer_info
+        if inspect.iscoroutinefunction(func):
+            return await func()
+        return await asyncio.to_thread(func)
+
+    async def _session(self) -> None:
+        """Log in, subscribe and handle messages until disconnected."""
+        info = await self._get_info()
+        if not info:
+            raise StreamError("No streamer info available")
+        connect = self.connect or websockets.connect
+        async with connect(info["streamerSocketUrl"]) as ws:
+            await ws.send(self._request(info, "ADMIN", "LOGIN", {
+                "Authorization": info.get("accessToken", ""),
+                "SchwabClientChannel": info.get("schwabClientChannel"),
+                "SchwabClientFunctionId": info.get("schwabClientFunctionId"),
+            }))
+            await self._expect_ok(ws, "LOGIN")
+            await ws.send(self._request(info, ACTIVITY_SERVICE, "SUBS", {
+                "keys": "Account Activity",
+                "fields": "0,1,2,3",
+            }))
+            await self._expect_ok(ws, "SUBS")
+            logging.info("Subscribed to Schwab account activity")
+            self._set_connected(True)
+            async for raw in ws:
+                self.handle(json.loads(raw))
+
+    async def run(self) -> None:
+        """Stay subscribed, reconnecting with backoff, until cancelled."""
+        if websockets is None and self.connect is None:
+            raise ImportError("the activity stream requires websockets")
+        delay = self.reconnect_delay
+        while True:
+            try:
+                await self._session()
+                logging.warning("Schwab stream closed")
+            except asyncio.CancelledError:
+                self._set_connected(False)
+                raise
+            except Exception as exc:
+                logging.warning("Schwab stream error: %s", exc)
+            if self.connected:
+                delay = self.reconnect_delay
+            self._set_connected(False)
+            logging.info(
+                "Polling over REST; reconnecting stream in %.0fs", delay
+            )
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
@@ -0,0 +1,49 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from accounts import parse_account_spec, resolve_accounts  # noqa: E402
+
+HASHES = {"11112222": "HASH-A", "33334444": "HASH-B"}
+
+
+def test_parse_account_spec_with_intervals():
+    assert parse_account_spec("1234:2.5, 5678,", 5) == [
+        ("1234", 2.5),
+        ("5678", 5),
+    ]
+
+
+def test_resolve_accounts_by_number_suffix_and_hash():
+    accounts = resolve_accounts("2222:1,HASH-B", HASHES, 5)
+    assert [(a.name, a.account_hash, a.interval_secs) for a in accounts] == [
+        ("…2222", "HASH-A", 1.0),
+        ("…4444", "HASH-B", 5),
+    ]
+    # the full number keys local state but is never displayed
+    assert [a.key for a in accounts] == ["11112222", "33334444"]
+    # each account gets its own tracker namespace
+    assert accounts[0].tracker is not accounts[1].tracker
+    assert accounts[0].position_tracker is not accounts[1].position_tracker
+
+
+def test_resolve_accounts_skips_unknown(caplog):
+    with caplog.at_level("ERROR"):
+        accounts = resolve_accounts("9999", HASHES, 5)
+    assert accounts == []
+    assert "9999" in caplog.text
+
+
+def test_resolve_accounts_shows_more_digits_when_suffixes_clash():
+    hashes = {"91231234": "HASH-A", "85551234": "HASH-B"}
+    accounts = resolve_accounts("HASH-A,HASH-B", hashes, 5)
+    assert [a.name for a in accounts] == ["…31234", "…51234"]
+
+
+def test_resolve_accounts_skips_duplicates(caplog):
+    hashes = {"9991234": "HASH-A"}
+    with caplog.at_level("WARNING"):
+        accounts = resolve_accounts("1234,1234,HASH-A", hashes, 5)
+    assert [a.name for a in accounts] == ["…1234"]
+    assert "listed more than once" in caplog.text
@@ -0,0 +1,107 @@
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pytest  # noqa: E402
+
+from aggregates import AggregateIndex, day_of, week_of  # noqa: E402
+from position_tracker import PositionTracker  # noqa: E402
+
+# Friday 2024-01-19 15:30 UTC
+FRIDAY = 1705678200
+
+
+def test_fills_update_every_group():
+    tracker = PositionTracker()
+    tracker.add_trade("SPY 470C", 2, 1.5, "BUY_TO_OPEN", "2024-01-19", 470,
+                      underlying="SPY", when=FRIDAY)
+    tracker.add_trade("SPY 480P", 1, 2.0, "SELL_TO_OPEN", "2024-01-26", 480,
+                      underlying="SPY", when=FRIDAY)
+    tracker.add_trade("SPY", 10, 470.0, "BUY", when=FRIDAY)
+    tracker.add_trade("SPY 470C", 1, 2.5, "SELL_TO_CLOSE", "2024-01-19", 470,
+                      when=FRIDAY + 60)
+    aggregates = tracker.aggregates
+
+    spy = aggregates.underlying_total("SPY")
+    assert spy.quantities == [10, 0, 1, 1]
+    assert spy.open_cost == pytest.approx(150 - 200 + 4700)
+    assert spy.realized == pytest.approx(100.0)
+    assert spy.pnl() == pytest.approx(100 / 150 * 100)
+    friday = aggregates.expiration_total("2024-01-19")
+    assert (friday.long_contracts, friday.realized) == (
+        1, pytest.approx(100.0)
+    )
+    assert aggregates.expiration_total("2024-01-26").short_contracts == 1
+    assert aggregates.expiration_total("").long_shares == 10
+    assert aggregates.total.quantities == [10, 0, 1, 1]
+    assert aggregates.day_total(FRIDAY).realized == pytest.approx(100.0)
+    assert aggregates.week_total(FRIDAY + 2 * 86400).realized == (
+        pytest.approx(100.0)
+    )
+    assert aggregates.week_total(FRIDAY + 3 * 86400).realized == 0.0
+
+
+def test_fills_crossing_zero_move_between_long_and_short():
+    tracker = PositionTracker()
+    tracker.add_trade("AAPL", 5, 100.0, "BUY")
+    tracker.add_trade("AAPL", 8, 101.0, "SELL_SHORT")
+    total = tracker.aggregates.total
+    assert (total.long_shares, total.short_shares) == (0, 3)
+    tracker.add_trade("AAPL", 3, 99.0, "BUY")
+    assert total.quantities == [0, 0, 0, 0]
+
+
+def test_expiring_covers_a_range_of_dates():
+    tracker = PositionTracker()
+    for expiration, qty in [
+        ("2024-01-19", 1), ("2024-01-26", 2), ("2024-02-16", 4),
+    ]:
+        tracker.add_trade("X", qty, 1.0, "BUY", expiration, 1)
+    aggregates = tracker.aggregates
+    assert aggregates.expirations == ["2024-01-19", "2024-01-26", "2024-02-16"]
+    assert aggregates.expiring("2024-01-19", "2024-01-20").long_contracts == 1
+    assert aggregates.expiring("2024-01-01", "2024-02-01").long_contracts == 3
+    assert aggregates.expiring("2024-03-01", "2024-04-01").long_contracts == 0
+
+
+def test_week_starts_on_monday():
+    monday = day_of(FRIDAY) - 4
+    assert week_of(FRIDAY) == monday
+    assert week_of(monday * 86400) == monday
+    assert week_of(monday * 86400 - 1) == monday - 7
+
+
+def test_rebuild_matches_incremental_totals():
+    rng = random.Random(3)
+    tracker = PositionTracker()
+    contracts = [
+        ("SPY A", "2024-01-19", 470.0, "SPY"),
+        ("SPY B", "2024-01-26", 480.0, "SPY"),
+        ("QQQ A", "2024-01-19", 400.0, "QQQ"),
+        ("AAPL", None, None, None),
+    ]
+    for _ in range(500):
+        symbol, expiration, strike, underlying = rng.choice(contracts)
+        side = rng.choice(["BUY_TO_OPEN", "SELL_TO_OPEN", "BUY", "SELL"])
+        try:
+            tracker.add_trade(symbol, rng.choice([1, 2, 3]),
+                              rng.uniform(1, 5), side, expiration, strike,
+                              underlying=underlying)
+        except ValueError:
+            pass
+    incremental = tracker.aggregates
+    rebuilt = AggregateIndex()
+    rebuilt.underlyings.update(incremental.underlyings)
+    rebuilt.rebuild(tracker)
+    assert rebuilt.by_underlying.keys() == {"SPY", "QQQ", "AAPL"}
+    assert rebuilt.expirations == incremental.expirations
+    for name in ("by_underlying", "by_expiration"):
+        for group, total in getattr(rebuilt, name).items():
+            other = getattr(incremental, name)[group]
+            assert (*total.quantities, total.open_cost, total.realized,
+                    total.basis) == pytest.approx((
+                        *other.quantities, other.open_cost, other.realized,
+                        other.basis,
+                    ))
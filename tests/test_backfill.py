@@ -0,0 +1,138 @@
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+np = pytest.importorskip("numpy")
+
+from backfill import backfill, load_legs  # noqa: E402
+from flatten import Leg  # noqa: E402
+from normalize import normalize_legs  # noqa: E402
+from position_tracker import PositionTracker  # noqa: E402
+
+
+def track(legs) -> PositionTracker:
+    tracker = PositionTracker()
+    for leg in legs:
+        try:
+            tracker.add_trade(
+                leg["symbol"],
+                float(leg["qty"]),
+                float(leg["price"]),
+                leg["instruction"],
+                leg.get("expiration"),
+                leg.get("strike"),
+            )
+        except ValueError:
+            pass
+    return tracker
+
+
+# instructions with the same direction as BUY and SELL
+SHORT_SIDES = {
+    "BUY": ["BUY_TO_OPEN", "BUY_TO_CLOSE", "BUY_TO_COVER"],
+    "SELL": ["SELL_TO_OPEN", "SELL_TO_CLOSE", "SELL_SHORT"],
+}
+
+
+def random_legs(
+    count: int, seed: int, oversell: bool = False, shorts: bool = False
+) -> list[dict]:
+    rng = random.Random(seed)
+    contracts = [
+        ("SPY", "2024-01-19", 470.0),
+        ("SPY", "2024-01-19", 475.0),
+        ("AAPL", None, None),
+        ("TSLA", "2024-02-16", 200.0),
+    ]
+    open_qty = dict.fromkeys(contracts, 0.0)
+    legs = []
+    for _ in range(count):
+        contract = rng.choice(contracts)
+        qty = rng.choice([1, 2, 3, 0.5, 5])
+        side = "BUY"
+        if rng.random() < 0.5 and (oversell or open_qty[contract] >= qty):
+            side = "SELL"
+        open_qty[contract] += qty if side == "BUY" else -qty
+        symbol, expiration, strike = contract
+        legs.append({
+            "symbol": symbol,
+            "expiration": expiration,
+            "strike": strike,
+            "qty": qty,
+            "price": round(rng.uniform(0.1, 10), 2),
+            "instruction": side,
+        })
+    if shorts:
+        for leg in legs:
+            leg["instruction"] = rng.choice(SHORT_SIDES[leg["instruction"]])
+    return legs
+
+
+@pytest.mark.parametrize(
+    "oversell, shorts", [(False, False), (True, False), (True, True)]
+)
+def test_backfill_matches_position_tracker(oversell, shorts):
+    legs = random_legs(2000, seed=7, oversell=oversell, shorts=shorts)
+    tracker = track(legs)
+    result = backfill(load_legs(legs))
+    assert result.mismatches(tracker) == []
+    rebuilt = result.to_position_tracker()
+    for key, queue in tracker.positions.items():
+        rebuilt_lots = rebuilt.positions[key].lots
+        assert [lot.qty for lot in rebuilt_lots] == pytest.approx(
+            [lot.qty for lot in queue.lots]
+        )
+        assert rebuilt.calculate_pnl(*key) == pytest.approx(
+            tracker.calculate_pnl(*key)
+        )
+
+
+def test_backfill_applies_spreads_as_a_unit():
+    rng = random.Random(11)
+    legs = random_legs(2000, seed=11, oversell=True, shorts=True)
+    # pair up legs into two-leg orders, some of which close too much
+    for order_id, start in enumerate(range(0, len(legs) - 1, 3)):
+        if rng.random() < 0.6:
+            for leg in legs[start:start + 2]:
+                leg.update(order_id=order_id, multi_leg=True)
+    tracker = PositionTracker()
+    records = list(normalize_legs(map(Leg.from_dict, legs)))
+    index = 0
+    rejected = 0
+    while index < len(records):
+        unit = records[index:index + 2]
+        if not unit[0].multi_leg:
+            unit = unit[:1]
+        index += len(unit)
+        try:
+            if len(unit) == 1:
+                tracker.add_leg(unit[0])
+            else:
+                tracker.add_spread(unit)
+        except ValueError:
+            rejected += len(unit) > 1
+    assert rejected
+    result = backfill(load_legs(legs))
+    assert result.mismatches(tracker) == []
+
+
+def test_backfill_partial_fifo_close():
+    legs = [
+        {"symbol": "A", "qty": 2, "price": 1.0, "instruction": "BUY"},
+        {"symbol": "A", "qty": 2, "price": 3.0, "instruction": "BUY"},
+        {"symbol": "A", "qty": 3, "price": 4.0, "instruction": "SELL"},
+        {"symbol": "A", "qty": 1, "price": 9.0, "instruction": "BUY_TO_OPEN"},
+        {"symbol": "A", "qty": 1, "price": 9.0, "instruction": "EXCHANGE"},
+        {"symbol": "B", "qty": None, "price": 9.0, "instruction": "BUY"},
+    ]
+    result = backfill(load_legs(legs))
+    assert result.keys == [("A", "", 0.0)]
+    assert result.closed_basis[0] == pytest.approx(5.0)
+    assert result.realized_pnl[0] == pytest.approx(7.0)
+    assert result.open_qty[0] == pytest.approx(2.0)
+    assert result.lots == [[[1.0, 3.0], [1.0, 9.0]]]
+    assert result.pnl_percent()[0] == pytest.approx(140.0)
@@ -0,0 +1,34 @@
+import sys
+from pathlib import Path
+from unittest.mock import Mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "benchmarks"))
+sys.modules.setdefault("schwabdev", Mock())
+
+from bench_pipeline import compare, run_benchmarks  # noqa: E402
+from synthetic import generate_orders  # noqa: E402
+
+
+def test_generate_orders_mixes_shapes_deterministically():
+    orders = generate_orders(200, seed=1)
+    assert orders == generate_orders(200, seed=1)
+    legs = [len(order["orderLegCollection"]) for order in orders]
+    assert min(legs) == 1 and max(legs) > 1
+    assert {order["status"] for order in orders} == {"FILLED", "WORKING"}
+
+
+def test_run_benchmarks_reports_every_stage():
+    report = run_benchmarks(sizes=[20], repeat=1)
+    results = report["results"]["20"]
+    for stage in ("flatten", "track", "format", "poll"):
+        assert results[stage]["seconds"] > 0
+        assert "peak_kib" in results[stage]
+
+
+def test_compare_flags_regressions_past_threshold():
+    baseline = {"results": {"10": {"legs": 5, "poll": {"seconds": 1.0}}}}
+    slower = {"results": {"10": {"legs": 5, "poll": {"seconds": 1.2}}}}
+    much_slower = {"results": {"10": {"legs": 5, "poll": {"seconds": 2.0}}}}
+    assert compare(slower, baseline, 0.25) == []
+    assert len(compare(much_slower, baseline, 0.25)) == 1
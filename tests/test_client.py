@@ -36,3 +36,209 @@ def test_get_account_positions_retries(mock_sleep, mock_create):
     assert result == {'ok': True}
     assert mock_api.account_orders_all.call_count == 3
     assert mock_sleep.call_count == 2
+
+
+@patch('client.create_schwab_client')
+def test_async_client_retries_without_blocking(mock_create):
+    import asyncio
+
+    from client import AsyncSchwabClient
+
+    mock_api = Mock()
+    mock_create.return_value = mock_api
+
+    success_response = Mock()
+    success_response.status_code = 200
+    success_response.json.return_value = [{'orderId': 1}]
+    mock_api.account_orders_all.side_effect = [
+        requests.exceptions.RequestException('fail'),
+        success_response,
+    ]
+
+    real_sleep = asyncio.sleep
+
+    async def run():
+        client = AsyncSchwabClient(SchwabClient('key', 'secret'))
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await real_sleep(0)
+
+        delays = []
+
+        async def fake_sleep(delay):
+            delays.append(delay)
+            await real_sleep(0)
+
+        ticker_task = asyncio.create_task(ticker())
+        with patch('client.asyncio.sleep', fake_sleep):
+            result = await client.get_account_positions(hours=2)
+        ticker_task.cancel()
+        client.close()
+        return result, ticks, len(delays)
+
+    result, ticks, sleeps = asyncio.run(run())
+    assert result == [{'orderId': 1}]
+    assert sleeps == 1
+    assert ticks > 0
+    assert mock_api.account_orders_all.call_count == 2
+
+
+@patch('client.create_schwab_client')
+def test_async_orders_are_decoded_in_the_executor(mock_create):
+    import asyncio
+    import threading
+
+    from client import AsyncSchwabClient
+
+    mock_api = Mock()
+    mock_create.return_value = mock_api
+    threads = []
+
+    def decode():
+        threads.append(threading.current_thread().name)
+        return [{'orderId': 1}]
+
+    response = Mock()
+    response.status_code = 200
+    response.json.side_effect = decode
+    mock_api.account_orders_all.return_value = response
+
+    async def run():
+        client = AsyncSchwabClient(SchwabClient('key', 'secret'))
+        try:
+            return await client.get_account_positions()
+        finally:
+            client.close()
+
+    assert asyncio.run(run()) == [{'orderId': 1}]
+    assert threads[0].startswith('schwab')
+
+
+@patch('client.create_schwab_client')
+def test_account_hash_uses_account_orders(mock_create):
+    mock_api = Mock()
+    mock_create.return_value = mock_api
+    response = Mock()
+    response.status_code = 200
+    response.json.return_value = []
+    mock_api.account_orders.return_value = response
+    linked = Mock()
+    linked.status_code = 200
+    linked.json.return_value = [
+        {'accountNumber': '1234', 'hashValue': 'HASH'}
+    ]
+    mock_api.account_linked.return_value = linked
+
+    client = SchwabClient('key', 'secret')
+    assert client.get_account_positions(account_hash='HASH') == []
+    assert mock_api.account_orders.call_args.args[0] == 'HASH'
+    mock_api.account_orders_all.assert_not_called()
+    assert client.get_account_hashes() == {'1234': 'HASH'}
+
+
+def make_response(status, headers=None):
+    response = Mock()
+    response.status_code = status
+    response.headers = headers or {}
+    response.json.return_value = [{'orderId': status}]
+    return response
+
+
+@patch('client.create_schwab_client')
+@patch('client.time.sleep', return_value=None)
+def test_retry_honours_status_and_retry_after(mock_sleep, mock_create):
+    from ratelimit import TokenBucket
+
+    mock_api = Mock()
+    mock_create.return_value = mock_api
+    mock_api.account_orders_all.side_effect = [
+        make_response(429, {'Retry-After': '7'}),
+        make_response(503),
+        make_response(200),
+    ]
+    now = [0.0]
+    mock_sleep.side_effect = lambda delay: now.__setitem__(0, now[0] + delay)
+    limiter = TokenBucket(100, 1, clock=lambda: now[0])
+    client = SchwabClient('key', 'secret', limiter=limiter)
+
+    assert client.get_account_positions() == [{'orderId': 200}]
+    first, second = [call.args[0] for call in mock_sleep.call_args_list]
+    assert 7 <= first <= 8
+    # second delay is the doubled backoff with equal jitter
+    assert 5 <= second <= 10
+    # the 429 emptied the shared bucket, which refilled while waiting
+    assert limiter.tokens < 100 - 2
+
+
+@patch('client.create_schwab_client')
+@patch('client.time.sleep', return_value=None)
+def test_client_errors_are_not_retried(mock_sleep, mock_create):
+    mock_api = Mock()
+    mock_create.return_value = mock_api
+    mock_api.account_orders_all.return_value = make_response(401)
+
+    client = SchwabClient('key', 'secret')
+    assert client.get_account_positions() is None
+    assert mock_api.account_orders_all.call_count == 1
+    assert mock_sleep.call_count == 0
+
+
+@patch('client.create_schwab_client')
+@patch('client.time.sleep', return_value=None)
+def test_circuit_breaker_fails_fast(mock_sleep, mock_create):
+    import pytest
+
+    from ratelimit import CircuitBreaker, CircuitOpenError
+
+    mock_api = Mock()
+    mock_create.return_value = mock_api
+    mock_api.account_orders_all.return_value = make_response(500)
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    client = SchwabClient('key', 'secret', breaker=breaker)
+
+    with pytest.raises(CircuitOpenError):
+        client.get_account_positions()
+    assert mock_api.account_orders_all.call_count == 2
+    with pytest.raises(CircuitOpenError):
+        client.get_account_positions()
+    assert mock_api.account_orders_all.call_count == 2
+
+    mock_api.account_linked.return_value = make_response(200)
+    breaker.opened_at -= 60
+    assert breaker.allow()
+    assert client.probe()
+    assert breaker.state == breaker.CLOSED
+
+
+@patch('client.create_schwab_client')
+def test_async_client_probes_in_background(mock_create):
+    import asyncio
+
+    import pytest
+
+    from client import AsyncSchwabClient
+    from ratelimit import CircuitBreaker, CircuitOpenError
+
+    mock_api = Mock()
+    mock_create.return_value = mock_api
+    mock_api.account_linked.return_value = make_response(200)
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+
+    async def run():
+        client = AsyncSchwabClient(
+            SchwabClient('key', 'secret', breaker=breaker)
+        )
+        with pytest.raises(CircuitOpenError):
+            await client.get_account_positions()
+        await asyncio.wait_for(client._probe_task, 1)
+        client.close()
+
+    asyncio.run(run())
+    assert breaker.state == breaker.CLOSED
+    assert mock_api.account_orders_all.call_count == 0
+    assert mock_api.account_linked.call_count == 1
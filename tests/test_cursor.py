@@ -0,0 +1,113 @@
+import json
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from cursor import OrderCursor, parse_time  # noqa: E402
+
+FIXTURE = Path(__file__).parent / "fixtures" / "sample_orders.json"
+
+with open(FIXTURE) as f:
+    SAMPLE_ORDERS = json.load(f)
+
+
+def make_order(order_id, close_time, activities=1):
+    return {
+        "orderId": order_id,
+        "closeTime": close_time,
+        "orderActivityCollection": [{}] * activities,
+    }
+
+
+def test_parse_time_formats():
+    expected = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    assert parse_time("2024-01-01T00:00:00.000Z") == expected
+    assert parse_time("2024-01-01T00:00:00+0000") == expected
+    assert parse_time("garbage") is None
+    assert parse_time(None) is None
+
+
+def test_start_time_defaults_to_window():
+    cursor = OrderCursor()
+    start = cursor.start_time(hours=2)
+    expected = datetime.now(timezone.utc) - timedelta(hours=2)
+    assert abs((start - expected).total_seconds()) < 5
+
+
+def test_filter_new_skips_seen_fills_and_advances():
+    cursor = OrderCursor(overlap_secs=30)
+    first = make_order(1, "2024-01-01T10:00:00+0000")
+    second = make_order(2, "2024-01-01T10:05:00+0000")
+    assert cursor.filter_new([first, second]) == [first, second]
+    assert cursor.high_water == parse_time("2024-01-01T10:05:00+0000")
+    assert cursor.start_time() == parse_time("2024-01-01T10:04:30+0000")
+
+    # the same orders come back inside the overlap window
+    assert cursor.filter_new([second]) == []
+
+    # a new fill on an existing order is passed through again
+    refilled = make_order(2, "2024-01-01T10:06:00+0000", activities=2)
+    assert cursor.filter_new([refilled]) == [refilled]
+
+
+def test_filter_new_ignores_orders_without_fills():
+    cursor = OrderCursor()
+    working = make_order(3, "2024-01-01T10:00:00+0000", activities=0)
+    assert cursor.filter_new([working]) == []
+    filled = make_order(3, "2024-01-01T10:01:00+0000")
+    assert cursor.filter_new([filled]) == [filled]
+
+
+def test_start_time_reaches_back_to_working_orders():
+    cursor = OrderCursor(overlap_secs=30)
+    working = {
+        "orderId": 4,
+        "status": "WORKING",
+        "enteredTime": "2024-01-01T09:00:00+0000",
+        "orderActivityCollection": [],
+    }
+    later = make_order(5, "2024-01-01T10:00:00+0000")
+    assert cursor.filter_new([working, later]) == [later]
+    assert cursor.start_time() == parse_time("2024-01-01T09:00:00+0000")
+
+    # the order stays in the window until it fills, then the cursor moves on
+    cursor.filter_new([working, make_order(6, "2024-01-01T12:00:00+0000")])
+    assert 4 in cursor.seen
+    filled = dict(
+        working,
+        status="FILLED",
+        closeTime="2024-01-01T12:05:00+0000",
+        orderActivityCollection=[{}],
+    )
+    assert cursor.filter_new([filled]) == [filled]
+    assert cursor.start_time() == parse_time("2024-01-01T12:04:30+0000")
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = tmp_path / "cursor.json"
+    cursor = OrderCursor(str(path))
+    cursor.filter_new([
+        make_order(1, "2024-01-01T10:00:00+0000"),
+        {"orderId": 2, "status": "QUEUED",
+         "enteredTime": "2024-01-01T09:00:00+0000"},
+    ])
+    assert cursor.working
+    cursor.applied.add((2, 1704099600, "A"))
+    cursor.save()
+
+    restored = OrderCursor(str(path))
+    restored.load()
+    assert restored.high_water == cursor.high_water
+    assert restored.working == cursor.working
+    assert restored.applied == {(2, 1704099600, "A")}
+    assert restored.filter_new(
+        [make_order(1, "2024-01-01T10:00:00+0000")]
+    ) == []
+
+
+def test_filter_new_with_fixture_orders():
+    cursor = OrderCursor()
+    assert cursor.filter_new(SAMPLE_ORDERS) == SAMPLE_ORDERS
+    assert cursor.filter_new(SAMPLE_ORDERS) == []
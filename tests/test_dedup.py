@@ -0,0 +1,70 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from dedup import DedupIndex, trade_key  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_trade_key_is_stable_signed_64_bit():
+    key = trade_key((1, "2024-01-01T00:00:00.000Z", "AAPL"))
+    assert key == trade_key((1, "2024-01-01T00:00:00.000Z", "AAPL"))
+    assert key != trade_key((2, "2024-01-01T00:00:00.000Z", "AAPL"))
+    assert -(2 ** 63) <= key < 2 ** 63
+
+
+def test_membership_and_hit_count():
+    index = DedupIndex()
+    trade = (1, "t", "AAPL")
+    assert trade not in index
+    index.add(trade)
+    assert trade in index
+    assert index.stats() == {"size": 1, "hits": 1, "evictions": 0}
+
+
+def test_expire_drops_only_old_entries():
+    clock = FakeClock()
+    index = DedupIndex(window_secs=60, margin_secs=10, clock=clock)
+    index.add((1, "t", "AAPL"))
+    clock.now = 30
+    index.add((2, "t", "AAPL"))
+    clock.now = 71
+    assert index.expire() == 1
+    assert (1, "t", "AAPL") not in index
+    assert (2, "t", "AAPL") in index
+    clock.now = 101
+    assert index.expire() == 1
+    assert len(index) == 0
+    assert index.evictions == 2
+
+
+def test_readding_refreshes_expiry():
+    clock = FakeClock()
+    index = DedupIndex(window_secs=10, margin_secs=0, clock=clock)
+    index.add((1, "t", "AAPL"))
+    index.add((2, "t", "AAPL"))
+    clock.now = 5
+    index.add((1, "t", "AAPL"))
+    clock.now = 12
+    assert index.expire() == 1
+    assert (1, "t", "AAPL") in index
+
+
+def test_drain_pending_and_load_round_trip():
+    clock = FakeClock(100)
+    index = DedupIndex(window_secs=10, margin_secs=0, clock=clock)
+    index.add((1, "t", "AAPL"))
+    rows = index.drain_pending()
+    assert index.drain_pending() == []
+
+    restored = DedupIndex(window_secs=10, margin_secs=0, clock=clock)
+    restored.load(rows)
+    assert (1, "t", "AAPL") in restored
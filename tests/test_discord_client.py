@@ -8,24 +8,149 @@ sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 from discord_client import send_message  # noqa: E402
 
 
-@patch('discord_client.requests.post')
-def test_send_message_posts(mock_post):
+@patch('discord_client.get_session')
+def test_send_message_posts(mock_session):
     os.environ['DISCORD_BOT_TOKEN'] = 'abc123'
     os.environ['DISCORD_CHANNEL_ID'] = '42'
-    send_message('hi')
-    mock_post.assert_called_once_with(
+    mock_session.return_value.post.return_value.status_code = 200
+    assert send_message('hi')
+    mock_session.return_value.post.assert_called_once_with(
         'https://discord.com/api/v10/channels/42/messages',
         json={'content': 'hi'},
         headers={'Authorization': 'Bot abc123'},
-        timeout=10,
     )
 
 
-@patch('discord_client.requests.post')
-def test_send_message_missing_vars(mock_post, caplog, monkeypatch):
+@patch('discord_client.get_session')
+def test_send_message_reports_rejected_posts(mock_session, caplog):
+    from metrics import SEND_FAILURES
+
+    os.environ['DISCORD_BOT_TOKEN'] = 'abc123'
+    os.environ['DISCORD_CHANNEL_ID'] = '42'
+    response = mock_session.return_value.post.return_value
+    response.status_code = 500
+    response.text = 'oops'
+    failures = SEND_FAILURES.value()
+    with caplog.at_level('ERROR'):
+        assert not send_message('hi')
+    assert SEND_FAILURES.value() == failures + 1
+    assert 'Discord rejected message: 500 oops' in caplog.text
+
+
+@patch('discord_client.get_session')
+def test_send_message_missing_vars(mock_session, caplog, monkeypatch):
     monkeypatch.delenv('DISCORD_BOT_TOKEN', raising=False)
     monkeypatch.delenv('DISCORD_CHANNEL_ID', raising=False)
     with caplog.at_level('ERROR'):
         send_message('hi')
-    mock_post.assert_not_called()
+    mock_session.return_value.post.assert_not_called()
     assert 'DISCORD_BOT_TOKEN or DISCORD_CHANNEL_ID not set' in caplog.text
+
+
+def test_coalesce_messages_respects_limits():
+    from discord_client import (
+        MAX_CONTENT_LENGTH, MAX_EMBEDS, coalesce_messages,
+    )
+
+    lines = ['x' * 900, 'y' * 900, 'z' * 900]
+    payloads = coalesce_messages(lines)
+    assert [p['content'] for p in payloads] == [
+        'x' * 900 + '\n' + 'y' * 900,
+        'z' * 900,
+    ]
+
+    long = coalesce_messages(['a' * (MAX_CONTENT_LENGTH + 5)])
+    assert all(len(p['content']) <= MAX_CONTENT_LENGTH for p in long)
+    assert len(long) == 2
+
+    embeds = coalesce_messages([{'title': str(i)} for i in range(12)])
+    assert [len(p['embeds']) for p in embeds] == [MAX_EMBEDS, 2]
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, headers=None, body=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = ''
+        self._body = body or {}
+
+    def json(self):
+        return self._body
+
+
+def test_dispatcher_batches_and_retries_rate_limit():
+    import asyncio
+    from unittest.mock import Mock
+
+    from discord_client import DiscordDispatcher
+
+    session = Mock()
+    session.post.side_effect = [
+        FakeResponse(429, body={'retry_after': 0.01}),
+        FakeResponse(200, headers={
+            'X-RateLimit-Remaining': '4',
+            'X-RateLimit-Reset-After': '1',
+        }),
+    ]
+
+    async def run():
+        dispatcher = DiscordDispatcher(
+            token='abc', channel_id='42', batch_delay=0.01, session=session
+        )
+        worker = asyncio.create_task(dispatcher.run())
+        await dispatcher.send('first')
+        await dispatcher.send('second')
+        await asyncio.sleep(0)
+        await dispatcher.close()
+        assert worker.done()
+
+    asyncio.run(run())
+    assert session.post.call_count == 2
+    assert session.post.call_args.kwargs['json'] == {
+        'content': 'first\nsecond'
+    }
+    session.close.assert_called_once()
+
+
+def test_dispatcher_records_fill_lag_after_delivery():
+    import asyncio
+    import time
+    from unittest.mock import Mock
+
+    import metrics
+    from discord_client import MAX_CONTENT_LENGTH, DiscordDispatcher
+
+    session = Mock()
+    # the first payload is rejected and the second delivered
+    session.post.side_effect = [FakeResponse(400), FakeResponse(200)]
+    before = metrics.FILL_LAG_SECONDS.count()
+    executed = time.time() - 5
+
+    async def run():
+        dispatcher = DiscordDispatcher(
+            token='abc', channel_id='42', batch_delay=0.01, session=session
+        )
+        worker = asyncio.create_task(dispatcher.run())
+        long = 'x' * (MAX_CONTENT_LENGTH - 10)
+        await dispatcher.send(long, (executed,))
+        await dispatcher.send(long, (executed, executed, None))
+        await asyncio.sleep(0)
+        await dispatcher.close()
+        assert worker.done()
+
+    asyncio.run(run())
+    assert session.post.call_count == 2
+    assert metrics.FILL_LAG_SECONDS.count() == before + 2
+
+
+def test_dispatcher_waits_for_exhausted_bucket():
+    import time
+
+    from discord_client import DiscordDispatcher
+
+    dispatcher = DiscordDispatcher(token='abc', channel_id='42')
+    dispatcher._update_bucket(FakeResponse(headers={
+        'X-RateLimit-Remaining': '0',
+        'X-RateLimit-Reset-After': '2.5',
+    }))
+    assert 2 < dispatcher.blocked_until - time.monotonic() <= 2.5
@@ -0,0 +1,121 @@
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest.mock import Mock
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "benchmarks"))
+sys.modules.setdefault("schwabdev", Mock())
+
+from fake_schwab import (  # noqa: E402
+    ACCOUNT_HASH,
+    FakeSchwabServer,
+    FaultInjector,
+    FillGenerator,
+    OrderBook,
+    shift_order,
+)
+from synthetic import generate_orders  # noqa: E402
+
+from client import (  # noqa: E402
+    HttpSchwabClient,
+    SchwabClient,
+    create_schwab_client,
+    format_time,
+)
+from cursor import parse_time  # noqa: E402
+
+
+@pytest.fixture
+def server():
+    server = FakeSchwabServer()
+    server.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_create_schwab_client_uses_base_url():
+    client = create_schwab_client("key", "secret", "http://localhost:1/")
+    assert isinstance(client, HttpSchwabClient)
+    assert client.base_url == "http://localhost:1"
+
+
+def test_shift_order_moves_every_timestamp():
+    order = generate_orders(1)[0]
+    shifted = shift_order(order, timedelta(hours=1))
+    assert parse_time(shifted["enteredTime"]) == parse_time(
+        order["enteredTime"]
+    ) + timedelta(hours=1)
+    leg = shifted["orderActivityCollection"][0]["executionLegs"][0]
+    original = order["orderActivityCollection"][0]["executionLegs"][0]
+    assert parse_time(leg["time"]) - parse_time(original["time"]) == (
+        timedelta(hours=1)
+    )
+
+
+def test_replay_rebases_orders_to_now():
+    book = OrderBook()
+    book.replay(generate_orders(5))
+    newest = max(parse_time(order["enteredTime"]) for order in book.orders)
+    assert abs(datetime.now(timezone.utc) - newest) < timedelta(seconds=5)
+
+
+def test_orders_are_filtered_by_entered_time(server):
+    server.book.replay(generate_orders(10))
+    client = SchwabClient(None, None, base_url=server.url)
+    since = parse_time(server.book.orders[5]["enteredTime"])
+    orders = client.get_account_positions(since=since)
+    assert [order["orderId"] for order in orders] == [
+        order["orderId"] for order in server.book.orders[5:]
+    ]
+    assert client.get_account_hashes() == {"12345678": ACCOUNT_HASH}
+    orders = client.get_account_positions(
+        since=since, account_hash=ACCOUNT_HASH
+    )
+    assert len(orders) == 5
+
+
+def test_newest_first_reverses_results():
+    book = OrderBook(newest_first=True)
+    book.replay(generate_orders(3))
+    assert book.query(None, None) == book.orders[::-1]
+    assert book.query(None, None, max_results=1) == book.orders[-1:]
+
+
+def test_injected_throttling_and_errors(server):
+    client = HttpSchwabClient(server.url)
+    start = format_time(datetime.now(timezone.utc) - timedelta(hours=1))
+    end = format_time(datetime.now(timezone.utc))
+
+    server.faults = FaultInjector(throttle_rate=1.0, retry_after=7)
+    response = client.account_orders_all(start, end)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "7"
+
+    server.faults = FaultInjector(error_rate=1.0)
+    assert client.account_orders_all(start, end).status_code == 503
+
+    server.faults = FaultInjector(quota=1)
+    assert client.account_orders_all(start, end).status_code == 200
+    assert client.account_orders_all(start, end).status_code == 429
+    assert server.stats["throttled"] == 2
+    assert server.stats["errors"] == 1
+
+
+def test_fill_generator_streams_fresh_orders():
+    book = OrderBook()
+    generator = FillGenerator(book, rate=200, pool_size=10)
+    generator.start()
+    try:
+        while generator.generated < 15:
+            generator.stopped.wait(0.01)
+    finally:
+        generator.stop()
+        generator.join()
+    ids = [order["orderId"] for order in book.orders]
+    assert len(ids) == len(set(ids)) >= 15
+    newest = parse_time(book.orders[-1]["enteredTime"])
+    assert abs(datetime.now(timezone.utc) - newest) < timedelta(seconds=5)
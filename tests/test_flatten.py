@@ -5,7 +5,19 @@ sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
 import json  # noqa: E402
 
-from flatten import flatten_data, flatten_dataset  # noqa: E402
+import pytest  # noqa: E402
+
+from flatten import (  # noqa: E402
+    TRADE_MAPPING,
+    Leg,
+    compile_mapping,
+    extract_and_append,
+    flatten_data,
+    flatten_dataset,
+    flatten_legs,
+    iter_flatten_dataset,
+    iter_flatten_legs,
+)
 
 FIXTURE = Path(__file__).parent / "fixtures" / "sample_orders.json"
 
@@ -71,3 +83,65 @@ def test_flatten_dataset_full():
         }
     ]
     assert result == expected
+
+
+def test_compiled_mapping_matches_interpreter():
+    getter = compile_mapping(TRADE_MAPPING)
+    broken = {"orderId": 3, "orderLegCollection": [{"instrument": None}]}
+    for trade in SAMPLE_ORDERS + [broken]:
+        for leg in range(len(trade["orderLegCollection"])):
+            assert getter(trade, leg) == extract_and_append(
+                trade, TRADE_MAPPING, leg
+            )
+
+
+def test_compile_mapping_is_cached_by_contents():
+    mapping = {"order_id": ["orderId"]}
+    getter = compile_mapping(mapping)
+    assert compile_mapping(mapping) is getter
+    assert compile_mapping(dict(mapping)) is getter
+    mapping["status"] = ["status"]
+    assert compile_mapping(mapping) is not getter
+    assert compile_mapping(mapping)({"orderId": 1}, 0) == {
+        "order_id": 1, "status": None,
+    }
+
+
+def test_compile_mapping_rejects_unknown_placeholder():
+    with pytest.raises(ValueError):
+        compile_mapping({"bad": ["orderLegCollection", "{activity}"]})
+
+
+def test_iter_flatten_dataset_streams_legs():
+    consumed = []
+
+    def orders():
+        for order in SAMPLE_ORDERS:
+            consumed.append(order["orderId"])
+            yield order
+
+    legs = iter_flatten_dataset(orders())
+    first = next(legs)
+    assert first["symbol"] == "AAPL"
+    assert consumed == [1]
+    assert [first] + list(legs) == flatten_dataset(SAMPLE_ORDERS)
+
+
+def test_flatten_legs_matches_flatten_data():
+    legs = flatten_legs(SAMPLE_ORDERS[0])
+    assert legs == [Leg(
+        symbol="AAPL",
+        underlying="AAPL",
+        instruction="BUY",
+        qty=10,
+        price=100.0,
+        expiration="2024-01-19",
+        strike=170.0,
+        order_id=1,
+        time="2024-01-01T00:00:00.000Z",
+        multi_leg=False,
+    )]
+    assert list(iter_flatten_legs(SAMPLE_ORDERS)) == [
+        Leg.from_dict(leg) for leg in flatten_dataset(SAMPLE_ORDERS)
+    ]
+    assert not hasattr(legs[0], "__dict__")
@@ -0,0 +1,91 @@
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import http_session  # noqa: E402
+from http_session import HttpSession  # noqa: E402
+from metrics import Registry  # noqa: E402
+
+
+class OkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # client ports seen, one per TCP connection
+    ports: set = set()
+
+    def do_GET(self):
+        self.ports.add(self.client_address[1])
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    OkHandler.ports = set()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), OkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_connections_are_reused(server):
+    session = HttpSession(pool_size=2)
+    for _ in range(5):
+        assert session.get(server).text == "ok"
+    stats = session.stats()["127.0.0.1"]
+    assert stats == {"opened": 1, "idle": 1, "requests": 5}
+    assert len(OkHandler.ports) == 1
+    session.close()
+
+
+def test_keepalive_disabled_sends_connection_close(server):
+    session = HttpSession(keepalive=False)
+    for _ in range(3):
+        session.get(server)
+    assert len(OkHandler.ports) == 3
+    session.close()
+
+
+def test_default_timeout_applies():
+    session = HttpSession(timeout=0.2, connect_timeout=0.2)
+    with pytest.raises(requests.RequestException):
+        # a non-routable address never completes the handshake
+        session.get("http://10.255.255.1/")
+    session.close()
+
+
+def test_http2_without_httpx_falls_back(monkeypatch, caplog):
+    monkeypatch.setitem(sys.modules, "httpx", None)
+    with caplog.at_level("WARNING"):
+        session = HttpSession(http2=True)
+    assert not session.http2
+    assert isinstance(session.client, requests.Session)
+    assert "httpx is not installed" in caplog.text
+
+
+def test_shared_session_is_reused_and_closed(monkeypatch):
+    monkeypatch.setenv("HTTP_POOL_SIZE", "3")
+    monkeypatch.setattr(http_session, "_session", None)
+    session = http_session.get_session()
+    assert session is http_session.get_session()
+    assert session.pool_size == 3
+    http_session.close_session()
+    assert http_session._session is None
+
+
+def test_registry_runs_collectors_before_render():
+    registry = Registry()
+    gauge = registry.gauge("pool", "connections")
+    registry.add_collector(lambda: gauge.set(4))
+    assert "pool 4" in registry.render()
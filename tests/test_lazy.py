@@ -0,0 +1,21 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from lazy import lazy_import  # noqa: E402
+
+
+def test_lazy_import_defers_execution(monkeypatch):
+    monkeypatch.delitem(sys.modules, "colorsys", raising=False)
+    module = lazy_import("colorsys")
+    assert sys.modules["colorsys"] is module
+    assert module.rgb_to_hsv(1, 0, 0) == (0.0, 1.0, 1)
+    assert lazy_import("colorsys") is module
+
+
+def test_lazy_import_missing_module():
+    with pytest.raises(ImportError):
+        lazy_import("no_such_module_here")
@@ -0,0 +1,115 @@
+import asyncio
+import sys
+from pathlib import Path
+from unittest.mock import Mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.modules.setdefault("schwabdev", Mock())
+
+from marks import MarkTracker, QuoteCache, quote_mark  # noqa: E402
+from poller import process_orders  # noqa: E402
+from position_tracker import PositionTracker  # noqa: E402
+from tracker import PriceTracker  # noqa: E402
+
+
+class QuoteClient:
+    def __init__(self, marks):
+        self.marks = marks
+        self.batches = []
+
+    async def get_quotes(self, symbols):
+        self.batches.append(list(symbols))
+        return {
+            symbol: {"quote": {"mark": self.marks[symbol]}}
+            for symbol in symbols
+            if symbol in self.marks
+        }
+
+
+def test_quote_mark_falls_back_to_mid_and_last():
+    assert quote_mark({"quote": {"mark": 1.5}}) == 1.5
+    assert quote_mark({"quote": {"bidPrice": 1.0, "askPrice": 2.0}}) == 1.5
+    assert quote_mark({"quote": {"lastPrice": 3}}) == 3.0
+    assert quote_mark({"quote": {}}) is None
+
+
+def test_quote_cache_expires_after_ttl():
+    now = [0.0]
+    cache = QuoteCache(ttl=10, clock=lambda: now[0])
+    cache.store({"A": 1.0})
+    assert cache.stale(["A", "B"]) == ["B"]
+    now[0] = 10
+    assert cache.stale(["A"]) == ["A"]
+    assert cache.mark("A") == 1.0
+
+
+def test_refresh_batches_and_values_portfolio():
+    client = QuoteClient({"A": 3.0, "B": 1.0, "C": 2.0})
+    marks = MarkTracker(client, ttl=60, batch_size=2)
+    tracker = PositionTracker()
+    tracker.add_trade("A", 2, 2.0, "BUY")
+    tracker.add_trade("B", 1, 1.5, "BUY")
+    tracker.add_trade("C", 1, 1.0, "BUY")
+    tracker.add_trade("C", 1, 1.2, "SELL")
+    portfolio = marks.portfolio(tracker, "123")
+    # no quotes yet: positions count at cost
+    assert portfolio.exposure == 5.5
+    assert portfolio.unrealized == 0.0
+
+    assert asyncio.run(marks.refresh()) == 2
+    # closed contract C is not quoted
+    assert client.batches == [["A", "B"]]
+    assert portfolio.exposure == 7.0
+    assert portfolio.unrealized == 1.5
+
+    # fresh quotes are not requested again
+    asyncio.run(marks.refresh())
+    assert len(client.batches) == 1
+
+    tracker.add_trade("A", 1, 2.0, "SELL")
+    mark, unrealized = portfolio.update("A")
+    assert (mark, unrealized) == (3.0, 1.0)
+    assert portfolio.unrealized == 0.5
+    assert portfolio.exposure == 4.0
+
+
+def test_short_options_are_valued_per_contract():
+    marks = MarkTracker(QuoteClient({}))
+    tracker = PositionTracker()
+    tracker.add_trade("SPY", 2, 1.5, "SELL_TO_OPEN", "2024-01-19", 470)
+    portfolio = marks.portfolio(tracker)
+    assert portfolio.exposure == -300.0
+    marks.quotes.store({"SPY": 1.0})
+    portfolio.apply_marks(["SPY"])
+    assert portfolio.exposure == -200.0
+    assert portfolio.unrealized == 100.0
+
+
+def test_process_orders_fills_mark_placeholders(monkeypatch):
+    marks = MarkTracker(QuoteClient({}))
+    tracker = PositionTracker()
+    portfolio = marks.portfolio(tracker)
+    marks.quotes.store({"SPY": 5.0})
+    sent = []
+    monkeypatch.setattr("poller.send_message", sent.append)
+    order = {
+        "orderId": 1,
+        "orderLegCollection": [{
+            "legId": 1,
+            "instruction": "BUY",
+            "quantity": 2,
+            "instrument": {"symbol": "SPY"},
+        }],
+        "orderActivityCollection": [{
+            "executionLegs": [{
+                "legId": 1, "price": 4.0, "quantity": 2,
+                "time": "2024-01-02T15:00:00+0000",
+            }],
+        }],
+    }
+    asyncio.run(process_orders(
+        [order], PriceTracker(), tracker, "{mark} {unrealized}", set(),
+        marks=portfolio,
+    ))
+    assert sent == ["5.0 2.0"]
+    assert portfolio.exposure == 10.0
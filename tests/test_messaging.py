@@ -3,10 +3,55 @@ import sys
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
-from messaging import format_trade  # noqa: E402
+import pytest  # noqa: E402
+
+from flatten import Leg  # noqa: E402
+from normalize import normalize_leg  # noqa: E402
+from messaging import (  # noqa: E402
+    compile_template,
+    format_trade,
+    validate_template,
+)
 
 
 def test_format_trade_basic():
     template = 'Stock {ticker} moved {pct_change:.2f}%'
     result = format_trade(template, ticker='AAPL', pct_change=1.23)
     assert result == 'Stock AAPL moved 1.23%'
+
+
+def test_format_trade_missing_keys_are_blank():
+    template = "{ticker} {pnl:.2f}% {open_qty!r}|"
+    assert format_trade(template, ticker="AAPL") == "AAPL % |"
+
+
+def test_format_trade_matches_format_map():
+    values = {"ticker": "SPY", "price": 1.5, "qty": 2}
+    template = "{{{ticker}}} {price:>6.2f} x{qty!s:<3}|"
+    assert format_trade(template, **values) == template.format(**values)
+
+
+def test_format_trade_falls_back_for_complex_fields():
+    assert format_trade("{price.real}|{qty}", price=2) == "2|"
+
+
+def test_compile_template_is_cached():
+    assert compile_template("{ticker}") is compile_template("{ticker}")
+
+
+def test_validate_template_rejects_unknown_fields():
+    validate_template("Contract {ticker} change {pct_change:.2f}%")
+    with pytest.raises(ValueError, match="tikcer"):
+        validate_template("{tikcer}")
+    with pytest.raises(ValueError):
+        validate_template("{ticker")
+
+
+def test_format_trade_accepts_leg_records():
+    leg = Leg(symbol="SPY", qty="2", price=1.5,
+              time="2024-01-02T15:30:00+0000")
+    assert normalize_leg(leg) is None
+    template = "{symbol} {qty} @ {price} {time} {ticker}"
+    assert format_trade(template, leg, ticker="X") == (
+        "SPY 2 @ 1.5 2024-01-02T15:30:00+0000 X"
+    )
@@ -0,0 +1,90 @@
+import asyncio
+import sys
+from pathlib import Path
+from unittest.mock import Mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.modules.setdefault("schwabdev", Mock())
+
+import metrics  # noqa: E402
+from flatten import Leg  # noqa: E402
+from metrics import Registry, serve_metrics, write_metrics  # noqa: E402
+from poller import process_orders  # noqa: E402
+from position_tracker import PositionTracker  # noqa: E402
+from tracker import PriceTracker  # noqa: E402
+
+
+def test_render_prometheus_text():
+    registry = Registry()
+    counter = registry.counter("sent", "Sent", labels=("account",))
+    counter.inc(account="A")
+    counter.inc(2, account="A")
+    registry.gauge("depth", "Depth").set(4)
+    histogram = registry.histogram("lat", "Latency", buckets=(0.1, 1))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+    text = registry.render()
+    assert '# TYPE sent counter\nsent_total{account="A"} 3' in text
+    assert "depth 4" in text
+    assert 'lat_bucket{le="0.1"} 1' in text
+    assert 'lat_bucket{le="1"} 2' in text
+    assert 'lat_bucket{le="+Inf"} 3' in text
+    assert "lat_sum 5.55" in text
+    assert "lat_count 3" in text
+
+
+def test_registry_reuses_metrics_by_name():
+    registry = Registry()
+    assert registry.counter("a", "A") is registry.counter("a", "A")
+
+
+def test_metrics_endpoint_and_file(tmp_path):
+    registry = Registry()
+    registry.counter("hits", "Hits").inc()
+
+    async def scrape():
+        server = await serve_metrics(0, registry=registry)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /metrics HTTP/1.1\r\nHost: x\r\n\r\n")
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return response.decode()
+
+    response = asyncio.run(scrape())
+    assert response.startswith("HTTP/1.1 200 OK")
+    assert response.endswith("hits_total 1\n")
+
+    path = tmp_path / "metrics.prom"
+    write_metrics(str(path), registry)
+    assert path.read_text() == registry.render()
+
+
+def test_process_orders_records_stages_lag_and_dedup(monkeypatch):
+    trade = Leg(
+        symbol="AAPL",
+        price=1.0,
+        order_id=1,
+        time="2024-01-02T15:30:00.000+0000",
+    )
+    monkeypatch.setattr("poller.iter_flatten_legs", lambda data: [trade])
+    monkeypatch.setattr("poller.send_message", lambda msg: True)
+    flatten_before = metrics.STAGE_SECONDS.count(stage="flatten")
+    lag_before = metrics.FILL_LAG_SECONDS.count()
+    hits_before = metrics.DEDUP_HITS.value()
+    sent = set()
+
+    async def run():
+        for _ in range(2):
+            await process_orders(
+                ["order"], PriceTracker(), PositionTracker(), "{ticker}", sent
+            )
+
+    asyncio.run(run())
+    assert metrics.STAGE_SECONDS.count(stage="flatten") == flatten_before + 2
+    assert metrics.FILL_LAG_SECONDS.count() == lag_before + 1
+    assert metrics.DEDUP_HITS.value() == hits_before + 1
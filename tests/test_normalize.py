@@ -0,0 +1,88 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pytest  # noqa: E402
+
+import metrics  # noqa: E402
+from flatten import Leg  # noqa: E402
+from normalize import (  # noqa: E402
+    Instruction,
+    Quarantine,
+    normalize_leg,
+    normalize_legs,
+    parse_instruction,
+)
+
+
+def raw_leg(**fields) -> Leg:
+    values = {
+        "symbol": "SPY   240119C00470000",
+        "underlying": "SPY",
+        "instruction": "BUY_TO_OPEN",
+        "qty": 2,
+        "price": "1.25",
+        "expiration": "2024-01-19",
+        "strike": 470,
+        "order_id": 7,
+        "time": "2024-01-02T15:30:00+0000",
+    }
+    values.update(fields)
+    return Leg(**values)
+
+
+def test_normalize_leg_converts_fields_once():
+    leg = raw_leg()
+    assert normalize_leg(leg) is None
+    assert leg.qty == 2.0 and isinstance(leg.qty, float)
+    assert leg.price == 1.25 and leg.strike == 470.0
+    assert leg.instruction is Instruction.BUY_TO_OPEN
+    assert leg.time == 1704209400
+    # symbols are interned, so every leg of a contract shares one string
+    other = raw_leg(symbol="".join(["SPY   240119", "C00470000"]))
+    normalize_leg(other)
+    assert other.symbol is leg.symbol
+    before = (leg.qty, leg.price, leg.instruction, leg.time)
+    assert normalize_leg(leg) is None
+    assert (leg.qty, leg.price, leg.instruction, leg.time) == before
+
+
+@pytest.mark.parametrize(
+    "fields, malformed",
+    [
+        ({"symbol": None}, "symbol"),
+        ({"price": "n/a"}, "price"),
+        ({"price": float("nan")}, "price"),
+        ({"qty": 0}, "qty"),
+        ({"qty": True}, "qty"),
+        ({"instruction": "HOLD"}, "instruction"),
+        ({"strike": [470]}, "strike"),
+        ({"expiration": 20240119}, "expiration"),
+        ({"time": "yesterday"}, "time"),
+    ],
+)
+def test_normalize_leg_reports_malformed_field(fields, malformed):
+    assert normalize_leg(raw_leg(**fields)) == malformed
+
+
+def test_parse_instruction_ignores_case():
+    assert parse_instruction("sell_to_close") is Instruction.SELL_TO_CLOSE
+    assert parse_instruction(None) is None
+    assert f"{Instruction.BUY}" == "BUY"
+
+
+def test_normalize_legs_skips_unfilled_and_quarantines_malformed():
+    quarantine = Quarantine(maxlen=1)
+    before = metrics.QUARANTINED_LEGS.value(field="qty")
+    legs = [
+        raw_leg(order_id=1),
+        raw_leg(order_id=2, price=None),
+        raw_leg(order_id=3, qty="-1"),
+        raw_leg(order_id=4, qty="x"),
+    ]
+    assert [leg.order_id for leg in normalize_legs(legs, quarantine)] == [1]
+    assert quarantine.counts == {"qty": 2}
+    assert len(quarantine) == 2
+    assert [leg.order_id for _, leg in quarantine.legs] == [4]
+    assert metrics.QUARANTINED_LEGS.value(field="qty") == before + 2
@@ -6,15 +6,21 @@ from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
+from flatten import Leg  # noqa: E402
 from poller import poll_schwab  # noqa: E402
 from tracker import PriceTracker  # noqa: E402
 
 
+def legs_of(flatten):
+    """Wrap a fake returning leg dicts to return :class:`Leg` records."""
+    return lambda data: [Leg.from_dict(leg) for leg in flatten(data)]
+
+
 def test_poll_schwab_calls_client_once(monkeypatch):
     client = Mock()
 
     async def run_poll():
-        monkeypatch.setattr("poller.flatten_dataset", lambda data: [])
+        monkeypatch.setattr("poller.iter_flatten_legs", lambda data: [])
         monkeypatch.setattr("poller.send_message", lambda msg: None)
         task = asyncio.create_task(poll_schwab(client, interval_secs=0))
         await asyncio.sleep(0.01)
@@ -47,7 +53,7 @@ def test_poll_schwab_tracks_changes(monkeypatch):
                 }
             ]
 
-        monkeypatch.setattr("poller.flatten_dataset", fake_flatten)
+        monkeypatch.setattr("poller.iter_flatten_legs", legs_of(fake_flatten))
         sent = []
 
         monkeypatch.setattr(
@@ -82,8 +88,8 @@ def test_poll_schwab_custom_template(monkeypatch):
                 return 5.5
 
         monkeypatch.setattr(
-            "poller.flatten_dataset",
-            lambda data: [{"symbol": "AAPL", "price": 1.0}],
+            "poller.iter_flatten_legs",
+            lambda data: [Leg(symbol="AAPL", price=1.0)],
         )
         sent = []
         monkeypatch.setattr(
@@ -131,7 +137,7 @@ def test_poll_schwab_updates_position_tracker(monkeypatch):
                 }
             ]
 
-        monkeypatch.setattr("poller.flatten_dataset", fake_flatten)
+        monkeypatch.setattr("poller.iter_flatten_legs", legs_of(fake_flatten))
         monkeypatch.setattr("poller.send_message", lambda msg: None)
 
         task = asyncio.create_task(
@@ -150,10 +156,12 @@ def test_poll_schwab_updates_position_tracker(monkeypatch):
             pass
 
     asyncio.run(run_poll())
-    assert position.add_trade.call_count >= 1
-    position.add_trade.assert_any_call(
-        "AAPL", 1.0, 100.0, "BUY", "2024-01-19", 170.0
-    )
+    assert position.add_leg.call_count >= 1
+    leg = position.add_leg.call_args.args[0]
+    assert (
+        leg.symbol, leg.qty, leg.price, leg.instruction, leg.expiration,
+        leg.strike,
+    ) == ("AAPL", 1.0, 100.0, "BUY", "2024-01-19", 170.0)
 
 
 def test_poll_schwab_logs_position_data(monkeypatch, caplog):
@@ -175,7 +183,7 @@ def test_poll_schwab_logs_position_data(monkeypatch, caplog):
                 }
             ]
 
-        monkeypatch.setattr("poller.flatten_dataset", fake_flatten)
+        monkeypatch.setattr("poller.iter_flatten_legs", legs_of(fake_flatten))
         monkeypatch.setattr("poller.send_message", lambda msg: None)
 
         with caplog.at_level("INFO"):
@@ -212,7 +220,7 @@ def test_poll_schwab_template_includes_position(monkeypatch):
                 }
             ]
 
-        monkeypatch.setattr("poller.flatten_dataset", fake_flatten)
+        monkeypatch.setattr("poller.iter_flatten_legs", legs_of(fake_flatten))
         sent = []
         monkeypatch.setattr(
             "poller.send_message",
@@ -257,7 +265,7 @@ def test_poll_schwab_only_sends_new_trades(monkeypatch):
                 }
             ]
 
-        monkeypatch.setattr("poller.flatten_dataset", fake_flatten)
+        monkeypatch.setattr("poller.iter_flatten_legs", legs_of(fake_flatten))
         sent = []
         monkeypatch.setattr(
             "poller.send_message",
@@ -277,3 +285,489 @@ def test_poll_schwab_only_sends_new_trades(monkeypatch):
 
     messages = asyncio.run(run_poll())
     assert len(messages) == 1
+
+
+def test_poll_schwab_incremental_cursor(monkeypatch):
+    """With a cursor the poller fetches since the mark and skips old fills."""
+    from cursor import OrderCursor
+
+    order = {
+        "orderId": 7,
+        "closeTime": "2024-01-01T00:00:00+0000",
+        "orderActivityCollection": [{}],
+    }
+    client = Mock()
+    client.get_account_positions.return_value = [order]
+    cursor = OrderCursor()
+    flattened = []
+
+    async def run_poll():
+        def fake_flatten(data):
+            flattened.append(list(data))
+            return []
+
+        monkeypatch.setattr("poller.iter_flatten_legs", legs_of(fake_flatten))
+        monkeypatch.setattr("poller.send_message", lambda msg: None)
+        task = asyncio.create_task(
+            poll_schwab(client, interval_secs=0, cursor=cursor)
+        )
+        await asyncio.sleep(0.02)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run_poll())
+    assert flattened[0] == [order]
+    assert all(batch == [] for batch in flattened[1:])
+    assert "since" in client.get_account_positions.call_args.kwargs
+
+
+def test_poll_schwab_queues_messages_on_dispatcher(monkeypatch):
+    client = Mock()
+    client.get_account_positions.return_value = ["dummy"]
+
+    class FakeDispatcher:
+        def __init__(self):
+            self.messages = []
+
+        async def send(self, message, fill_times=()):
+            self.messages.append(message)
+
+    dispatcher = FakeDispatcher()
+
+    async def run_poll():
+        monkeypatch.setattr(
+            "poller.iter_flatten_legs",
+            lambda data: [Leg(symbol="AAPL", price=1.0, order_id=1)],
+        )
+        monkeypatch.setattr(
+            "poller.send_message",
+            lambda msg: (_ for _ in ()).throw(AssertionError("inline send")),
+        )
+        task = asyncio.create_task(
+            poll_schwab(client, interval_secs=0, dispatcher=dispatcher)
+        )
+        await asyncio.sleep(0.01)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run_poll())
+    assert dispatcher.messages == ["Contract AAPL change 0.00%"]
+
+
+def test_poll_schwab_persists_sent_trades(monkeypatch, tmp_path):
+    from state_store import StateStore
+
+    client = Mock()
+    client.get_account_positions.return_value = ["dummy"]
+    store = StateStore(str(tmp_path / "state.db"))
+
+    async def run_poll():
+        monkeypatch.setattr(
+            "poller.iter_flatten_legs",
+            lambda data: [Leg(symbol="AAPL", price=1.0, order_id=1)],
+        )
+        monkeypatch.setattr("poller.send_message", lambda msg: None)
+        task = asyncio.create_task(
+            poll_schwab(client, interval_secs=0, store=store)
+        )
+        await asyncio.sleep(0.01)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run_poll())
+    from dedup import DedupIndex
+
+    restored = PriceTracker()
+    sent = DedupIndex()
+    store.load(restored, sent_trade_ids=sent)
+    assert (1, None, "AAPL") in sent
+    assert len(sent) == 1
+    assert restored.last_prices == {"AAPL": 1.0}
+    store.close()
+
+
+def test_poll_accounts_fetches_concurrently(monkeypatch):
+    from accounts import Account
+    from poller import poll_accounts
+
+    class SlowClient:
+        def __init__(self):
+            self.calls = []
+            self.refreshes = 0
+
+        async def refresh_tokens(self):
+            self.refreshes += 1
+
+        async def get_account_positions(self, account_hash=None, **kwargs):
+            self.calls.append(account_hash)
+            await asyncio.sleep(0.05)
+            return [{"account": account_hash}]
+
+    client = SlowClient()
+    accounts = [
+        Account(name="A", account_hash="HASH-A", interval_secs=60),
+        Account(name="B", account_hash="HASH-B", interval_secs=60),
+    ]
+
+    def fake_flatten(orders):
+        return [
+            {"symbol": order["account"], "price": 1.0} for order in orders
+        ]
+
+    async def run_poll():
+        monkeypatch.setattr("poller.iter_flatten_legs", legs_of(fake_flatten))
+        monkeypatch.setattr("poller.send_message", lambda msg: None)
+        task = asyncio.create_task(poll_accounts(client, accounts))
+        await asyncio.sleep(0.08)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run_poll())
+    # both fetches finished within one fetch latency, not two
+    assert sorted(client.calls) == ["HASH-A", "HASH-B"]
+    assert client.refreshes == 1
+    assert accounts[0].tracker.last_prices == {"HASH-A": 1.0}
+    assert accounts[1].tracker.last_prices == {"HASH-B": 1.0}
+
+
+def test_poll_accounts_scheduler_sets_cadence(monkeypatch):
+    from accounts import Account
+    from poller import poll_accounts
+    from scheduler import AdaptiveScheduler
+
+    client = Mock()
+    client.get_account_positions.return_value = ["dummy"]
+    account = Account(
+        interval_secs=60,
+        scheduler=AdaptiveScheduler(base_interval=60, min_interval=0.01),
+    )
+
+    def fake_flatten(data):
+        return [{"symbol": "AAPL", "price": 1.0, "order_id": 1}]
+
+    async def run_poll():
+        monkeypatch.setattr("poller.iter_flatten_legs", legs_of(fake_flatten))
+        monkeypatch.setattr("poller.send_message", lambda msg: None)
+        task = asyncio.create_task(poll_accounts(client, [account]))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run_poll())
+    # the first poll sent a new trade so the next came after min_interval;
+    # and the quiet poll after it returned to the base interval
+    assert client.get_account_positions.call_count == 2
+    assert account.scheduler.interval == 60
+
+
+def test_process_orders_groups_legs_by_contract(monkeypatch):
+    from position_tracker import PositionTracker
+
+    from poller import process_orders
+
+    legs = [
+        {"symbol": "A", "price": 1.0, "qty": 2, "instruction": "BUY",
+         "order_id": 1, "time": 1},
+        {"symbol": "B", "price": 5.0, "qty": 1, "instruction": "BUY",
+         "order_id": 2, "time": 2},
+        {"symbol": "A", "price": 2.0, "qty": 1, "instruction": "SELL",
+         "order_id": 1, "time": 3},
+    ]
+    monkeypatch.setattr(
+        "poller.iter_flatten_legs", lambda data: map(Leg.from_dict, legs)
+    )
+    sent = []
+    monkeypatch.setattr("poller.send_message", sent.append)
+    position = PositionTracker()
+    calls = []
+    monkeypatch.setattr(
+        position, "get_open_quantity",
+        lambda *key: calls.append(key) or PositionTracker.get_open_quantity(
+            position, *key
+        ),
+    )
+
+    new = asyncio.run(
+        process_orders(
+            ["order"],
+            PriceTracker(),
+            position,
+            "{ticker} {instruction} {open_qty} {pct_change:.0f}",
+            set(),
+        )
+    )
+    assert new == 3
+    # contracts are processed together, with one lookup each
+    assert sent == ["A BUY 1.0 0", "A SELL 1.0 100", "B BUY 1.0 0"]
+    assert calls == [("A", None, None), ("B", None, None)]
+
+
+def test_process_orders_combines_fills_per_contract(monkeypatch):
+    from position_tracker import PositionTracker
+
+    from poller import process_orders
+
+    legs = [
+        {"symbol": "A", "price": 1.0, "qty": 1, "instruction": "BUY",
+         "order_id": 1, "time": 1},
+        {"symbol": "A", "price": 2.0, "qty": 3, "instruction": "BUY",
+         "order_id": 1, "time": 2},
+        {"symbol": "B", "price": 4.0, "qty": 1, "instruction": "BUY",
+         "order_id": 2, "time": 3},
+    ]
+    monkeypatch.setattr(
+        "poller.iter_flatten_legs", lambda data: map(Leg.from_dict, legs)
+    )
+    sent = []
+    monkeypatch.setattr("poller.send_message", sent.append)
+    sent_ids = {(1, 1, "A")}
+
+    new = asyncio.run(
+        process_orders(
+            ["order"],
+            PriceTracker(),
+            PositionTracker(),
+            "{ticker} {qty} @ {price} x{fills} open {open_qty}",
+            sent_ids,
+            combine=True,
+        )
+    )
+    assert new == 2
+    # the already-sent fill is left out of the message and the positions
+    assert sent == ["A 3 @ 2.0 x1 open 3.0", "B 1 @ 4.0 x1 open 1.0"]
+
+    legs[0]["time"] = 4
+    sent.clear()
+    asyncio.run(
+        process_orders(
+            ["order"],
+            PriceTracker(),
+            PositionTracker(),
+            "{ticker} {qty} @ {price:.2f} x{fills}",
+            set(),
+            combine=True,
+        )
+    )
+    assert sent == ["A 4.0 @ 1.75 x2", "B 1 @ 4.00 x1"]
+
+
+def test_process_orders_applies_refetched_orders_once(monkeypatch):
+    from cursor import OrderCursor
+    from position_tracker import PositionTracker
+
+    from poller import process_orders
+
+    execution = {"executionLegs": [{"price": 2.0, "time": 1}]}
+    order = {
+        "orderId": 7,
+        "enteredTime": "2024-01-01T10:00:00+0000",
+        "orderLegCollection": [{
+            "instrument": {"symbol": "A"},
+            "instruction": "BUY",
+            "quantity": 10,
+        }],
+        "orderActivityCollection": [execution],
+    }
+    monkeypatch.setattr("poller.send_message", lambda message: None)
+    cursor = OrderCursor()
+    position = PositionTracker()
+    sent_ids = set()
+    # the second execution brings the whole order back
+    for activities in ([execution], [execution, execution]):
+        order = dict(order, orderActivityCollection=activities)
+        asyncio.run(
+            process_orders(
+                cursor.iter_new([order]),
+                PriceTracker(),
+                position,
+                "{ticker}",
+                sent_ids,
+            )
+        )
+    assert position.get_open_quantity("A") == 10
+
+
+def test_partial_fill_is_not_applied_again_after_dedup_expiry(monkeypatch):
+    from cursor import OrderCursor
+    from dedup import DedupIndex
+    from position_tracker import PositionTracker
+
+    from poller import process_orders
+
+    execution = {"executionLegs": [{"price": 2.0, "time": 1}]}
+    order = {
+        "orderId": 7,
+        "status": "WORKING",
+        "enteredTime": "2024-01-01T10:00:00+0000",
+        "orderLegCollection": [{
+            "instrument": {"symbol": "A"},
+            "instruction": "BUY_TO_OPEN",
+            "quantity": 10,
+        }],
+    }
+    sent = []
+    monkeypatch.setattr(
+        "poller.send_message", lambda message: sent.append(message)
+    )
+    now = [0.0]
+    dedup = DedupIndex(clock=lambda: now[0])
+    cursor = OrderCursor()
+    position = PositionTracker()
+    # the next execution arrives after the dedup index forgot the first
+    for activities in ([execution], [execution, execution]):
+        dedup.expire()
+        order = dict(order, orderActivityCollection=activities)
+        asyncio.run(
+            process_orders(
+                cursor.iter_new([order]),
+                PriceTracker(),
+                position,
+                "{ticker}",
+                dedup,
+                cursor=cursor,
+            )
+        )
+        now[0] += dedup.ttl + 1
+    assert position.get_open_quantity("A") == 10
+    assert sent == ["A"]
+
+
+def test_process_orders_applies_spreads_as_a_unit(monkeypatch):
+    from position_tracker import PositionTracker
+
+    from poller import process_orders
+
+    def spread(order_id, time, first, second, credit):
+        return [
+            {"symbol": "C470", "price": first, "qty": 1,
+             "instruction": "SELL_TO_CLOSE" if credit else "BUY_TO_OPEN",
+             "expiration": "2024-01-19", "strike": 470.0,
+             "order_id": order_id, "time": time, "multi_leg": True},
+            {"symbol": "C475", "price": second, "qty": 1,
+             "instruction": "BUY_TO_CLOSE" if credit else "SELL_TO_OPEN",
+             "expiration": "2024-01-19", "strike": 475.0,
+             "order_id": order_id, "time": time, "multi_leg": True},
+        ]
+
+    legs = spread(1, 1, 3.0, 1.0, False) + spread(2, 2, 4.5, 1.5, True)
+    monkeypatch.setattr(
+        "poller.iter_flatten_legs", lambda data: map(Leg.from_dict, legs)
+    )
+    sent = []
+    monkeypatch.setattr("poller.send_message", sent.append)
+    position = PositionTracker()
+    spreads = []
+    monkeypatch.setattr(
+        position, "add_spread",
+        lambda legs: spreads.append([leg.order_id for leg in legs])
+        or PositionTracker.add_spread(position, legs),
+    )
+
+    asyncio.run(
+        process_orders(
+            ["order"],
+            PriceTracker(),
+            position,
+            "{order_id} {ticker} {open_qty:g} {spread_pnl:.0f}",
+            set(),
+        )
+    )
+    assert spreads == [[1, 1], [2, 2]]
+    assert sent == [
+        "1 C470 0 0", "2 C470 0 50", "1 C475 0 0", "2 C475 0 50",
+    ]
+
+
+def test_process_orders_fills_aggregate_placeholders(monkeypatch, caplog):
+    from position_tracker import PositionTracker
+
+    from poller import process_orders
+
+    legs = [
+        {"symbol": "SPY C", "underlying": "SPY", "price": 1.0, "qty": 2,
+         "instruction": "BUY_TO_OPEN", "expiration": "2024-01-19",
+         "strike": 470.0, "order_id": 1, "time": 1705678200},
+        {"symbol": "SPY P", "underlying": "SPY", "price": 2.0, "qty": 1,
+         "instruction": "BUY_TO_OPEN", "expiration": "2024-01-26",
+         "strike": 460.0, "order_id": 2, "time": 1705678260},
+        {"symbol": "SPY C", "underlying": "SPY", "price": 1.5, "qty": 1,
+         "instruction": "SELL_TO_CLOSE", "expiration": "2024-01-19",
+         "strike": 470.0, "order_id": 3, "time": 1705678320},
+        {"symbol": "SPY", "price": 470.0, "qty": 100, "instruction": "BUY",
+         "order_id": 4, "time": 1705678380},
+        {"symbol": "SPY C480", "underlying": "SPY", "price": 0.5, "qty": 1,
+         "instruction": "SELL_TO_OPEN", "expiration": "2024-01-19",
+         "strike": 480.0, "order_id": 5, "time": 1705678440},
+    ]
+    monkeypatch.setattr(
+        "poller.iter_flatten_legs", lambda data: map(Leg.from_dict, legs)
+    )
+    sent = []
+    monkeypatch.setattr("poller.send_message", sent.append)
+
+    with caplog.at_level("INFO"):
+        asyncio.run(
+            process_orders(
+                ["order"],
+                PriceTracker(),
+                PositionTracker(),
+                "{ticker} {underlying_long_shares:g} "
+                "{underlying_long_contracts:g} "
+                "{underlying_short_contracts:g} "
+                "{expiration_long_contracts:g} "
+                "{expiration_short_contracts:g} "
+                "{account_realized:.0f} {week_realized:.0f}",
+                set(),
+            )
+        )
+    # shares and contracts, longs and shorts are counted apart
+    assert sent == [
+        "SPY C 100 2 1 1 1 50 50",
+        "SPY C 100 2 1 1 1 50 50",
+        "SPY P 100 2 1 1 0 50 50",
+        "SPY 100 2 1 0 0 50 50",
+        "SPY C480 100 2 1 1 1 50 50",
+    ]
+    assert any(
+        "SPY shares +100/-0 contracts +2/-1 realized 50.00" in record.message
+        for record in caplog.records
+    )
+
+
+def test_catch_up_polls_each_account_once(monkeypatch):
+    from accounts import Account
+    from poller import catch_up
+
+    class Client:
+        def __init__(self):
+            self.hashes = []
+
+        async def get_account_positions(self, account_hash=None, **kwargs):
+            self.hashes.append(account_hash)
+            if account_hash == "bad":
+                raise RuntimeError("boom")
+            return []
+
+    client = Client()
+    good = Account(name="1", account_hash="good", interval_secs=30)
+    bad = Account(name="2", account_hash="bad", interval_secs=30)
+    assert asyncio.run(catch_up(client, [good, bad])) == 0
+    assert sorted(client.hashes) == ["bad", "good"]
+    # the failed account stays due so the poll loop retries it first
+    assert good.next_poll > 0
+    assert bad.next_poll == 0
@@ -3,7 +3,11 @@ from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
-from position_tracker import PositionTracker  # noqa: E402
+import pytest  # noqa: E402
+
+from flatten import Leg  # noqa: E402
+from normalize import Instruction  # noqa: E402
+from position_tracker import Lot, LotQueue, PositionTracker  # noqa: E402
 
 
 def test_open_partial_close_and_full_close():
@@ -37,3 +41,143 @@ def test_fifo_by_contract():
     pnl_second = tracker.calculate_pnl("AAPL", "2024-02-16", 175.0)
     assert round(pnl_first, 2) == round(200 / 1000 * 100, 2)
     assert pnl_second == 0.0
+
+
+def test_running_totals_and_average_cost():
+    tracker = PositionTracker()
+    tracker.add_trade("AAPL", 2, 10.0, "BUY")
+    tracker.add_trade("AAPL", 2, 20.0, "BUY")
+    assert tracker.get_open_quantity("AAPL") == 4
+    assert tracker.get_average_cost("AAPL") == 15.0
+    tracker.add_trade("AAPL", 3, 30.0, "SELL")
+    assert tracker.get_open_quantity("AAPL") == 1
+    assert tracker.get_average_cost("AAPL") == 20.0
+    assert len(tracker.positions[("AAPL", "", 0.0)]) == 1
+
+
+def test_oversell_leaves_position_untouched():
+    tracker = PositionTracker()
+    tracker.add_trade("AAPL", 1, 10.0, "BUY")
+    with pytest.raises(ValueError):
+        tracker.add_trade("AAPL", 2, 12.0, "SELL")
+    assert tracker.get_open_quantity("AAPL") == 1
+    assert tracker.calculate_pnl("AAPL") == 0.0
+
+
+def test_many_small_lots_close_fifo():
+    tracker = PositionTracker()
+    for i in range(1000):
+        tracker.add_trade("SPY", 1, 1.0 + i, "BUY")
+    tracker.add_trade("SPY", 999, 2000.0, "SELL")
+    assert tracker.get_open_quantity("SPY") == 1
+    assert tracker.get_average_cost("SPY") == 1000.0
+    assert tracker.closed_basis[("SPY", "", 0.0)] == sum(
+        1.0 + i for i in range(999)
+    )
+
+
+def test_lot_queue_resets_after_full_close():
+    queue = LotQueue()
+    queue.push(0.1, 1.0)
+    queue.push(0.2, 1.0)
+    assert round(queue.close(0.3), 9) == 0.3
+    assert queue.qty == 0.0 and queue.cost == 0.0 and len(queue) == 0
+
+
+def test_lots_are_records_closed_in_place():
+    queue = LotQueue()
+    queue.push(3.0, 1.5)
+    queue.push(2.0, 2.0)
+    head = queue.lots[0]
+    queue.close(1.0)
+    assert list(queue.lots) == [Lot(2.0, 1.5), Lot(2.0, 2.0)]
+    assert queue.lots[0] is head
+    assert queue.to_list() == [[2.0, 1.5], [2.0, 2.0]]
+    assert list(LotQueue.from_lots(queue.to_list()).lots) == list(queue.lots)
+
+
+def test_add_leg_records_flattened_leg():
+    tracker = PositionTracker()
+    tracker.add_leg(Leg(symbol="SPY", instruction="BUY", qty=2.0, price=1.0,
+                        expiration="2024-01-19", strike=470.0))
+    assert tracker.get_open_quantity("SPY", "2024-01-19", 470) == 2.0
+
+
+def test_short_positions_open_and_cover_fifo():
+    tracker = PositionTracker()
+    tracker.add_trade("TSLA", 2, 10.0, "SELL_SHORT")
+    tracker.add_trade("TSLA", 1, 12.0, "SELL_SHORT")
+    assert tracker.get_open_quantity("TSLA") == -3
+    assert tracker.get_average_cost("TSLA") == pytest.approx(32 / 3)
+    tracker.add_trade("TSLA", 2, 8.0, "BUY_TO_COVER")
+    assert tracker.get_open_quantity("TSLA") == -1
+    assert tracker.realized_pnl[("TSLA", "", 0.0)] == 4.0
+    assert tracker.calculate_pnl("TSLA") == 20.0
+    # a buy larger than the short covers it and opens a long
+    tracker.add_trade("TSLA", 3, 11.0, "BUY")
+    assert tracker.get_open_quantity("TSLA") == 2
+    assert tracker.get_average_cost("TSLA") == 11.0
+    assert tracker.realized_pnl[("TSLA", "", 0.0)] == 5.0
+
+
+def test_option_instructions_apply_contract_multiplier():
+    tracker = PositionTracker()
+    contract = ("SPY", "2024-01-19", 470.0)
+    tracker.add_trade("SPY", 2, 1.5, "SELL_TO_OPEN", *contract[1:])
+    tracker.add_trade("SPY", 2, 1.0, "BUY_TO_CLOSE", *contract[1:])
+    assert tracker.get_open_quantity(*contract) == 0
+    assert tracker.realized_pnl[contract] == pytest.approx(100.0)
+    assert tracker.closed_basis[contract] == pytest.approx(300.0)
+    tracker.add_trade("SPY", 1, 2.0, "BUY_TO_OPEN", *contract[1:])
+    tracker.add_trade("SPY", 1, 2.5, "SELL_TO_CLOSE", *contract[1:])
+    assert tracker.realized_pnl[contract] == pytest.approx(150.0)
+    assert PositionTracker(option_multiplier=10).multiplier(contract) == 10
+
+
+def test_closing_instructions_cannot_open():
+    tracker = PositionTracker()
+    tracker.add_trade("SPY", 1, 1.0, "SELL_TO_OPEN", "2024-01-19", 470)
+    with pytest.raises(ValueError):
+        tracker.add_trade("SPY", 2, 1.0, "BUY_TO_CLOSE", "2024-01-19", 470)
+    with pytest.raises(ValueError):
+        tracker.add_trade("SPY", 1, 1.0, "SELL_TO_CLOSE", "2024-01-19", 470)
+    with pytest.raises(ValueError):
+        tracker.add_trade("SPY", 1, 1.0, "EXCHANGE")
+    assert tracker.get_open_quantity("SPY", "2024-01-19", 470) == -1
+
+
+def test_spread_is_applied_as_a_unit():
+    tracker = PositionTracker()
+    opening = [
+        Leg(symbol="C470", instruction=Instruction.BUY_TO_OPEN, qty=1.0,
+            price=3.0, expiration="2024-01-19", strike=470.0, order_id=1),
+        Leg(symbol="C475", instruction=Instruction.SELL_TO_OPEN, qty=1.0,
+            price=1.0, expiration="2024-01-19", strike=475.0, order_id=1),
+    ]
+    assert tracker.add_spread(opening) == (0.0, 0.0)
+    closing = [
+        Leg(symbol="C470", instruction=Instruction.SELL_TO_CLOSE, qty=1.0,
+            price=4.5, expiration="2024-01-19", strike=470.0, order_id=2),
+        Leg(symbol="C475", instruction=Instruction.BUY_TO_CLOSE, qty=2.0,
+            price=1.5, expiration="2024-01-19", strike=475.0, order_id=2),
+    ]
+    # closing more of one leg than is open rejects the whole order
+    with pytest.raises(ValueError):
+        tracker.add_spread(closing)
+    assert tracker.get_open_quantity("C470", "2024-01-19", 470) == 1
+    closing[1].qty = 1.0
+    realized, basis = tracker.add_spread(closing)
+    # net debit of 2.00 closed for a credit of 3.00 on one contract
+    assert realized == pytest.approx(100.0)
+    assert basis == pytest.approx(200.0)
+    assert tracker.get_open_quantity("C475", "2024-01-19", 475) == 0
+
+
+def test_short_lots_close_fifo_in_place():
+    queue = LotQueue.from_lots([[-2.0, 1.0], [-1.0, 3.0]])
+    assert queue.close(1.0 - 1e-12) == pytest.approx(1.0)
+    assert queue.close(1.0) == pytest.approx(1.0)
+    assert queue.to_list() == [[-1.0, 3.0]]
+    assert (queue.qty, queue.cost) == pytest.approx((-1.0, -3.0))
+    with pytest.raises(ValueError):
+        queue.close(2.0)
@@ -0,0 +1,92 @@
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from ratelimit import CircuitBreaker, TokenBucket  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_spends_and_refills():
+    clock = FakeClock()
+    bucket = TokenBucket(2, 1, clock=clock)
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 1.0
+    clock.now = 0.5
+    assert bucket.try_acquire() == 0.5
+    clock.now = 10
+    assert bucket.try_acquire() == 0
+    assert bucket.tokens == 1
+
+
+def test_async_acquire_waits_for_refill():
+    bucket = TokenBucket(1, 100)
+
+    async def run():
+        await bucket.acquire()
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await bucket.acquire()
+        return loop.time() - start
+
+    assert asyncio.run(run()) >= 0.005
+
+
+def test_per_minute():
+    bucket = TokenBucket.per_minute(120)
+    assert bucket.capacity == 120
+    assert bucket.rate == 2
+
+
+def test_pause_blocks_every_caller():
+    clock = FakeClock()
+    bucket = TokenBucket(10, 2, clock=clock)
+    bucket.pause(3)
+    assert bucket.try_acquire() == 3.0
+    clock.now = 3
+    assert bucket.try_acquire() == 0
+
+
+def test_circuit_breaker_opens_probes_and_closes():
+    clock = FakeClock()
+    breaker = CircuitBreaker(
+        failure_threshold=2, reset_timeout=10, clock=clock
+    )
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == breaker.OPEN
+    assert not breaker.allow()
+    assert breaker.retry_in() == 10
+    clock.now = 10
+    assert breaker.allow()
+    # only one trial while half-open
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == breaker.OPEN
+    assert breaker.retry_in() == 20
+    clock.now = 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == breaker.CLOSED
+    assert breaker.reset_timeout == 10
+    assert breaker.allow()
+
+
+def test_circuit_breaker_retries_a_lost_trial():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=5, clock=clock)
+    breaker.record_failure()
+    clock.now = 5
+    assert breaker.allow()
+    clock.now = 10
+    assert breaker.allow()
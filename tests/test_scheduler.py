@@ -0,0 +1,61 @@
+import sys
+from datetime import date, datetime, time
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from scheduler import (  # noqa: E402
+    AdaptiveScheduler,
+    MarketCalendar,
+    parse_clock,
+)
+
+NY = ZoneInfo("America/New_York")
+
+
+def at(*args):
+    return datetime(*args, tzinfo=NY)
+
+
+def test_calendar_sessions_and_holidays():
+    calendar = MarketCalendar(holidays=[date(2024, 7, 4)])
+    assert calendar.is_open(at(2024, 7, 3, 10, 0))
+    assert not calendar.is_open(at(2024, 7, 3, 16, 0))
+    assert not calendar.is_open(at(2024, 7, 4, 10, 0))
+    assert not calendar.is_open(at(2024, 7, 6, 10, 0))
+    # Wednesday after the close -> Friday open, skipping the holiday
+    wait = calendar.seconds_until_open(at(2024, 7, 3, 17, 0))
+    assert wait == (at(2024, 7, 5, 9, 30) - at(2024, 7, 3, 17, 0)).seconds + (
+        86400
+    )
+
+
+def test_parse_clock():
+    assert parse_clock("09:30") == time(9, 30)
+
+
+def test_backoff_and_activity():
+    scheduler = AdaptiveScheduler(
+        base_interval=5, min_interval=1, max_interval=30, backoff=2
+    )
+    assert scheduler.next_interval(0) == 10
+    assert scheduler.next_interval(0) == 20
+    assert scheduler.next_interval(0) == 30
+    assert scheduler.next_interval(0) == 30
+    assert scheduler.next_interval(3) == 1
+    assert scheduler.next_interval(0) == 5
+    assert scheduler.interval == 5
+
+
+def test_closed_market_waits_until_open_capped():
+    scheduler = AdaptiveScheduler(
+        base_interval=5, closed_interval=300, calendar=MarketCalendar()
+    )
+    assert scheduler.next_interval(0, at(2024, 7, 3, 20, 0)) == 300
+    assert scheduler.next_interval(0, at(2024, 7, 5, 9, 29)) == 60
+    # fills after hours still speed polling up
+    assert scheduler.next_interval(2, at(2024, 7, 5, 9, 29)) == 1
+    # the first quiet poll after the open resets to the base cadence
+    scheduler.next_interval(0, at(2024, 7, 5, 9, 29))
+    assert scheduler.next_interval(0, at(2024, 7, 5, 9, 31)) == 5
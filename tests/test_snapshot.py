@@ -0,0 +1,88 @@
+import sys
+from pathlib import Path
+from unittest.mock import Mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.modules.setdefault("schwabdev", Mock())
+
+from accounts import Account  # noqa: E402
+from dedup import DedupIndex  # noqa: E402
+from main import restore_state  # noqa: E402
+from snapshot import (  # noqa: E402
+    MAGIC,
+    read_snapshot,
+    restore_snapshot,
+    write_snapshot,
+)
+from state_store import StateStore  # noqa: E402
+
+
+def make_account(name: str = "") -> Account:
+    account = Account(name=name)
+    account.tracker.update_and_get_change("SPY", 1.5)
+    tracker = account.position_tracker
+    tracker.add_trade("SPY", 3, 1.0, "BUY", "2024-01-19", 470,
+                      underlying="SPY ETF")
+    tracker.add_trade("SPY", 1, 2.0, "BUY", "2024-01-19", 470)
+    tracker.add_trade("SPY", 2, 1.5, "SELL", "2024-01-19", 470,
+                      when=1705678200)
+    return account
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = tmp_path / "snap.bin"
+    sent = DedupIndex()
+    sent.add((1, "t", "SPY"))
+    size = write_snapshot(str(path), [make_account("123")], sent, "42")
+    assert size == path.stat().st_size
+    assert path.read_bytes().startswith(MAGIC)
+
+    snapshot = read_snapshot(str(path))
+    assert snapshot["stamp"] == "42"
+    account = Account(name="123")
+    restored = DedupIndex()
+    assert restore_snapshot(snapshot, [account], restored)
+    assert (1, "t", "SPY") in restored
+    assert account.tracker.last_prices == {"SPY": 1.5}
+    tracker = account.position_tracker
+    assert tracker.get_open_quantity("SPY", "2024-01-19", 470) == 2
+    assert tracker.get_average_cost("SPY", "2024-01-19", 470) == 1.5
+    # option PnL is in dollars of 100 units per contract
+    assert tracker.realized_pnl[("SPY", "2024-01-19", 470.0)] == 100.0
+    assert tracker.aggregates.underlying_total("SPY ETF").long_contracts == 2
+    assert tracker.aggregates.day_total(1705678200).realized == 100.0
+    # accounts missing from the snapshot are left to the database
+    assert not restore_snapshot(snapshot, [Account(name="999")])
+
+
+def test_unreadable_snapshots_are_ignored(tmp_path):
+    assert read_snapshot(str(tmp_path / "missing.bin")) is None
+    path = tmp_path / "snap.bin"
+    path.write_bytes(b"not a snapshot")
+    assert read_snapshot(str(path)) is None
+    path.write_bytes(MAGIC + b"garbage")
+    assert read_snapshot(str(path)) is None
+
+
+def test_restore_state_prefers_current_snapshot(tmp_path):
+    store = StateStore(str(tmp_path / "state.db"))
+    saved = make_account()
+    store.flush(saved.tracker, saved.position_tracker)
+    path = str(tmp_path / "snap.bin")
+    write_snapshot(path, [saved], DedupIndex(), store.last_flush())
+
+    account = Account()
+    restore_state(store, [account], DedupIndex(), path)
+    assert account.position_tracker.get_open_quantity(
+        "SPY", "2024-01-19", 470
+    ) == 2
+
+    # a flush after the snapshot makes it stale: the database wins
+    saved.position_tracker.add_trade("SPY", 2, 1.0, "SELL", "2024-01-19", 470)
+    store.flush(saved.tracker, saved.position_tracker)
+    account = Account()
+    restore_state(store, [account], DedupIndex(), path)
+    assert account.position_tracker.get_open_quantity(
+        "SPY", "2024-01-19", 470
+    ) == 0
+    store.close()
@@ -0,0 +1,189 @@
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from dedup import DedupIndex  # noqa: E402
+from position_tracker import PositionTracker  # noqa: E402
+from state_store import StateStore  # noqa: E402
+from tracker import PriceTracker  # noqa: E402
+
+
+def test_flush_and_reload_round_trip(tmp_path):
+    path = str(tmp_path / "state.db")
+    store = StateStore(path)
+    tracker = PriceTracker()
+    positions = PositionTracker()
+    tracker.update_and_get_change("AAPL", 100.0)
+    positions.add_trade("AAPL", 10, 100.0, "BUY", "2024-01-19", 170.0)
+    positions.add_trade("AAPL", 10, 105.0, "BUY", "2024-01-19", 170.0)
+    positions.add_trade("AAPL", 15, 110.0, "SELL", "2024-01-19", 170.0)
+    sent = DedupIndex()
+    sent.add((1, "2024-01-01T00:00:00.000Z", "AAPL"))
+    store.flush(tracker, positions, sent)
+    assert not tracker.dirty and not positions.dirty
+    store.close()
+
+    restored_store = StateStore(path)
+    restored_prices = PriceTracker()
+    restored_positions = PositionTracker()
+    restored_sent = DedupIndex()
+    restored_store.load(restored_prices, restored_positions, restored_sent)
+    restored_store.close()
+
+    assert (1, "2024-01-01T00:00:00.000Z", "AAPL") in restored_sent
+    assert len(restored_sent) == 1
+    assert restored_prices.last_prices == {"AAPL": 100.0}
+    assert restored_positions.get_open_quantity(
+        "AAPL", "2024-01-19", 170.0
+    ) == 5
+    assert restored_positions.calculate_pnl(
+        "AAPL", "2024-01-19", 170.0
+    ) == positions.calculate_pnl("AAPL", "2024-01-19", 170.0)
+    assert restored_positions.get_average_cost(
+        "AAPL", "2024-01-19", 170.0
+    ) == 105.0
+
+
+def test_aggregates_are_restored(tmp_path):
+    path = str(tmp_path / "state.db")
+    store = StateStore(path)
+    positions = PositionTracker()
+    positions.add_trade("SPY C", 2, 1.0, "BUY_TO_OPEN", "2024-01-19", 470,
+                        underlying="SPY", when=1705678200)
+    positions.add_trade("SPY C", 1, 1.5, "SELL_TO_CLOSE", "2024-01-19", 470,
+                        when=1705678200)
+    store.flush(position_tracker=positions)
+    assert not positions.aggregates.dirty_days
+    store.close()
+
+    store = StateStore(path)
+    restored = PositionTracker()
+    store.load(position_tracker=restored)
+    store.close()
+    aggregates = restored.aggregates
+    assert aggregates.underlying_total("SPY").long_contracts == 1
+    assert aggregates.underlying_total("SPY").realized == 50.0
+    assert aggregates.expiring("2024-01-19", "2024-01-20").long_contracts == 1
+    assert aggregates.day_total(1705678200).realized == 50.0
+
+
+def test_flush_writes_only_dirty_keys(tmp_path):
+    store = StateStore(str(tmp_path / "state.db"))
+    positions = PositionTracker()
+    positions.add_trade("AAPL", 1, 1.0, "BUY")
+    store.flush(position_tracker=positions)
+    positions.add_trade("MSFT", 1, 2.0, "BUY")
+    assert positions.dirty == {("MSFT", "", 0.0)}
+    store.flush(position_tracker=positions)
+
+    restored = PositionTracker()
+    store.load(position_tracker=restored)
+    assert restored.get_open_quantity("AAPL") == 1
+    assert restored.get_open_quantity("MSFT") == 1
+    store.close()
+
+
+def test_database_uses_wal(tmp_path):
+    store = StateStore(str(tmp_path / "state.db"))
+    mode = store.conn.execute("PRAGMA journal_mode").fetchone()[0]
+    store.close()
+    assert mode == "wal"
+
+
+def test_option_pnl_is_migrated_to_dollars(tmp_path):
+    path = str(tmp_path / "state.db")
+    # positions as written before the store was versioned
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE positions (account TEXT NOT NULL, symbol TEXT NOT "
+        "NULL, expiration TEXT NOT NULL, strike REAL NOT NULL, realized "
+        "REAL NOT NULL, basis REAL NOT NULL, lots TEXT NOT NULL, PRIMARY "
+        "KEY (account, symbol, expiration, strike))"
+    )
+    rows = [
+        ("", "SPY", "2024-01-19", 470.0, 0.5, 2.0, "[]"),
+        ("", "AAPL", "", 0.0, 3.0, 10.0, "[]"),
+    ]
+    with conn:
+        conn.executemany(
+            "INSERT INTO positions VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+        )
+    conn.close()
+
+    for _ in range(2):
+        store = StateStore(path)
+        restored = PositionTracker()
+        store.load(position_tracker=restored)
+        store.close()
+        assert restored.realized_pnl == {
+            ("SPY", "2024-01-19", 470.0): 50.0,
+            ("AAPL", "", 0.0): 3.0,
+        }
+        assert restored.calculate_pnl("SPY", "2024-01-19", 470.0) == 25.0
+
+
+def test_tables_from_before_accounts_are_migrated(tmp_path):
+    path = str(tmp_path / "state.db")
+    # tables as written before rows were namespaced by account
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        "CREATE TABLE prices (symbol TEXT PRIMARY KEY, price REAL NOT NULL);"
+        "CREATE TABLE positions (symbol TEXT NOT NULL, expiration TEXT NOT "
+        "NULL, strike REAL NOT NULL, realized REAL NOT NULL, basis REAL NOT "
+        "NULL, lots TEXT NOT NULL, PRIMARY KEY (symbol, expiration, strike));"
+        "INSERT INTO prices VALUES ('AAPL', 101.0);"
+        "INSERT INTO positions VALUES ('AAPL', '', 0.0, 2.0, 10.0, "
+        "'[[1.0, 100.0]]');"
+    )
+    conn.close()
+
+    store = StateStore(path)
+    prices, positions = PriceTracker(), PositionTracker()
+    store.load(prices, positions)
+    assert prices.last_prices == {"AAPL": 101.0}
+    assert positions.get_open_quantity("AAPL") == 1
+    assert positions.realized_pnl[("AAPL", "", 0.0)] == 2.0
+    # both accounts keep their own row for the same contract
+    other_prices, other = PriceTracker(), PositionTracker()
+    other_prices.update_and_get_change("AAPL", 50.0)
+    other.add_trade("AAPL", 3, 50.0, "BUY")
+    store.flush(other_prices, other, account="123")
+    store.close()
+
+    store = StateStore(path)
+    restored_prices, restored = PriceTracker(), PositionTracker()
+    store.load(restored_prices, restored)
+    store.close()
+    assert restored_prices.last_prices == {"AAPL": 101.0}
+    assert restored.get_open_quantity("AAPL") == 1
+
+
+def test_expired_sent_keys_are_not_restored(tmp_path):
+    now = [1000.0]
+    store = StateStore(str(tmp_path / "state.db"))
+    sent = DedupIndex(window_secs=10, margin_secs=0, clock=lambda: now[0])
+    sent.add((1, "t", "AAPL"))
+    store.flush(sent_trade_ids=sent)
+
+    now[0] = 2000.0
+    restored = DedupIndex(window_secs=10, margin_secs=0, clock=lambda: now[0])
+    store.load(sent_trade_ids=restored)
+    store.close()
+    assert len(restored) == 0
+
+
+def test_accounts_are_namespaced(tmp_path):
+    store = StateStore(str(tmp_path / "state.db"))
+    first = PositionTracker()
+    first.add_trade("AAPL", 1, 1.0, "BUY")
+    second = PositionTracker()
+    second.add_trade("AAPL", 3, 1.0, "BUY")
+    store.flush(position_tracker=first, account="A")
+    store.flush(position_tracker=second, account="B")
+
+    restored = PositionTracker()
+    store.load(position_tracker=restored, account="B")
+    store.close()
+    assert restored.get_open_quantity("AAPL") == 3
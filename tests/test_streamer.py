@@ -0,0 +1,173 @@
+import asyncio
+import json
+import sys
+from pathlib import Path
+from unittest.mock import Mock
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.modules.setdefault("schwabdev", Mock())
+
+websockets = pytest.importorskip("websockets")
+
+from accounts import Account  # noqa: E402
+from poller import poll_accounts  # noqa: E402
+from streamer import ALL_ACCOUNTS, ActivityStream  # noqa: E402
+
+
+def activity(account: str, kind: str) -> str:
+    return json.dumps({"data": [{
+        "service": "ACCT_ACTIVITY",
+        "command": "SUBS",
+        "content": [{"seq": 1, "key": "Account Activity",
+                     "1": account, "2": kind, "3": ""}],
+    }]})
+
+
+def ok(command: str, code: int = 0) -> str:
+    return json.dumps({"response": [{
+        "service": "ADMIN" if command == "LOGIN" else "ACCT_ACTIVITY",
+        "command": command,
+        "content": {"code": code, "msg": "done"},
+    }]})
+
+
+class FakeStreamer:
+    """Local WebSocket server speaking the Schwab streamer handshake."""
+
+    def __init__(self, login_code: int = 0, messages=()):
+        self.login_code = login_code
+        self.messages = list(messages)
+        self.requests = []
+        self.connections = 0
+        self.release = asyncio.Event()
+
+    async def handler(self, ws):
+        self.connections += 1
+        login = json.loads(await ws.recv())
+        self.requests.append(login)
+        await ws.send(ok("LOGIN", self.login_code))
+        if self.login_code:
+            return
+        self.requests.append(json.loads(await ws.recv()))
+        await ws.send(ok("SUBS"))
+        for message in self.messages:
+            await ws.send(message)
+        # keep the connection open until the test drops it
+        await self.release.wait()
+
+    async def __aenter__(self):
+        self.server = await websockets.serve(self.handler, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        self.info = {
+            "streamerSocketUrl": f"ws://127.0.0.1:{port}",
+            "schwabClientCustomerId": "cust",
+            "schwabClientCorrelId": "corr",
+            "schwabClientChannel": "N9",
+            "schwabClientFunctionId": "APIAPP",
+            "accessToken": "token",
+        }
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release.set()
+        self.server.close()
+        await self.server.wait_closed()
+
+
+class InfoClient:
+    def __init__(self, info):
+        self.info = info
+
+    async def get_streamer_info(self):
+        return self.info
+
+
+async def wait_for(predicate, timeout: float = 2) -> None:
+    async def poll():
+        while not predicate():
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(poll(), timeout)
+
+
+def test_stream_subscribes_and_marks_fills():
+    async def run():
+        messages = [
+            activity("111", "OrderCreated"),
+            activity("111", "OrderFillCompleted"),
+        ]
+        async with FakeStreamer(messages=messages) as server:
+            stream = ActivityStream(InfoClient(server.info))
+            task = asyncio.create_task(stream.run())
+            await wait_for(lambda: "111" in stream.pending)
+            assert stream.connected
+            login, subs = server.requests
+            assert login["command"] == "LOGIN"
+            assert login["parameters"]["Authorization"] == "token"
+            assert subs["service"] == "ACCT_ACTIVITY"
+            assert subs["parameters"]["fields"] == "0,1,2,3"
+            assert stream.pending == {ALL_ACCOUNTS, "111"}
+
+            accounts = [Account(name="111", account_hash="h1"),
+                        Account(name="222", account_hash="h2")]
+            stream.pending.discard(ALL_ACCOUNTS)
+            assert [a.name for a in stream.take_due(accounts)] == ["111"]
+            assert stream.take_due(accounts) == []
+
+            server.release.set()
+            await wait_for(lambda: not stream.connected)
+            # a dropped stream makes every account due for a REST catch-up
+            assert stream.pending == {ALL_ACCOUNTS}
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+
+
+def test_stream_reconnects_after_rejected_login():
+    async def run():
+        async with FakeStreamer(login_code=3) as server:
+            stream = ActivityStream(
+                InfoClient(server.info), reconnect_delay=0.01
+            )
+            task = asyncio.create_task(stream.run())
+            await wait_for(lambda: server.connections >= 3)
+            assert not stream.connected
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+
+
+def test_poll_accounts_polls_on_stream_activity():
+    class Client:
+        def __init__(self):
+            self.calls = 0
+
+        async def get_account_positions(self, **kwargs):
+            self.calls += 1
+            return []
+
+    async def run():
+        client = Client()
+        stream = ActivityStream(InfoClient(None), reconcile_secs=600)
+        stream._set_connected(True)
+        account = Account(interval_secs=0.01)
+        task = asyncio.create_task(
+            poll_accounts(client, [account], stream=stream)
+        )
+        await wait_for(lambda: client.calls == 1)
+        await asyncio.sleep(0.1)
+        # connected: the reconciliation interval replaces the 10ms cadence
+        assert client.calls == 1
+        stream.handle(json.loads(activity("123", "OrderFillCompleted")))
+        await wait_for(lambda: client.calls == 2)
+
+        stream._set_connected(False)
+        await wait_for(lambda: client.calls >= 5)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
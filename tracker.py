@@ -3,6 +3,8 @@ class PriceTracker:
 
     def __init__(self):
         self.last_prices: dict[str, float] = {}
+        # contracts updated since the state was last persisted
+        self.dirty: set[str] = set()
 
     def update_and_get_change(self, contract: str, price: float) -> float:
         """Update price for ``contract`` and return percent change.
@@ -12,6 +14,7 @@ class PriceTracker:
         """
         previous = self.last_prices.get(contract)
         self.last_prices[contract] = price
+        self.dirty.add(contract)
         if previous is None or previous == 0:
             return 0.0
         return (price - previous) / previous * 100